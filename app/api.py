@@ -1,17 +1,50 @@
+import asyncio
 import logging
 import os
-import random
-import string
+import secrets
+import time
 import uuid
-from typing import Dict
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Callable, Dict, Optional, Tuple
 
-from fastapi import APIRouter, HTTPException, Request, WebSocket, WebSocketDisconnect
-from fastapi.responses import FileResponse, HTMLResponse
+from fastapi import (
+    APIRouter,
+    FastAPI,
+    HTTPException,
+    Request,
+    WebSocket,
+    WebSocketDisconnect,
+)
+from fastapi.responses import (
+    FileResponse,
+    HTMLResponse,
+    PlainTextResponse,
+    StreamingResponse,
+)
 from pydantic import BaseModel
 
-from app.engine.action_handlers import handle_ws_message
+from app.engine.action_handlers import (
+    handle_ws_message,
+    hold_seat,
+    join_room,
+    leave_room,
+    resume_room,
+)
+from app.engine.action_log import LogWriter, RoomLog
+from app.engine.cluster import Cluster, make_cluster
+from app.engine.codes import UNAMBIGUOUS_ALPHABET, CodeAllocator
+from app.engine.compression import DeflateSettings
+from app.engine.connection import Connection, accept
+from app.engine.frames import use_json_encoder
+from app.engine.heartbeat import Heartbeat, is_pong
+from app.engine.metrics import LATENCY_BUCKETS, REGISTRY, Counter, Gauge, Histogram
+from app.engine.outbox import URGENT, outbox_of
+from app.engine.reaper import RoomReaper
+from app.engine.resume import ResumeTokens
 from app.engine.room import Room
-from app.game.pass_pebble import PassThePebbleGame
+from app.engine.snapshot import SnapshotStore, restore_room, snapshot_room
+from app.engine.watch import stream
+from app.game import GAME_TYPES
 
 router = APIRouter()
 
@@ -20,9 +53,329 @@ logger = logging.getLogger()
 
 rooms: Dict[str, Room] = dict()  # { code: {player_id: websocket} }
 
+use_json_encoder(os.environ.get("JSON_ENCODER", "auto"))
 
-def generate_code(length: int = 4) -> str:
-    return "".join(random.choices(string.ascii_uppercase + string.digits, k=length))
+COALESCE_WINDOW = float(os.environ.get("ROOM_COALESCE_WINDOW_SECONDS", 0))
+
+ROOM_BACKEND = os.environ.get("ROOM_BACKEND", "memory")
+ROOM_BACKEND_DIR = os.environ.get("ROOM_BACKEND_DIR", "/tmp/roomcode-poker")
+
+DEFLATE = (
+    DeflateSettings(
+        threshold=int(os.environ.get("WS_DEFLATE_THRESHOLD_BYTES", 1024)),
+        level=int(os.environ.get("WS_DEFLATE_LEVEL", 6)),
+        context_takeover=os.environ.get("WS_DEFLATE_CONTEXT_TAKEOVER", "0") == "1",
+    )
+    if os.environ.get("WS_DEFLATE", "1") == "1"
+    else None
+)
+
+code_allocator = CodeAllocator(
+    length=int(os.environ.get("ROOM_CODE_LENGTH", 4)),
+    alphabet=os.environ.get("ROOM_CODE_ALPHABET", UNAMBIGUOUS_ALPHABET),
+)
+
+
+RESUME_GRACE = float(os.environ.get("ROOM_RESUME_GRACE_SECONDS", 30))
+# without a configured secret, tokens only work on the worker that issued them
+resume_tokens = ResumeTokens(
+    os.environ.get("RESUME_SECRET", "").encode() or secrets.token_bytes(32),
+    ttl=float(os.environ.get("RESUME_TOKEN_TTL_SECONDS", 86400)),
+)
+SESSIONS_RESUMED = Counter(
+    "roomcode_sessions_resumed", "Clients that reconnected and took back their seat"
+)
+
+
+def build_cluster() -> Cluster:
+    return make_cluster(
+        rooms,
+        backend=ROOM_BACKEND,
+        directory=ROOM_BACKEND_DIR,
+        resume_tokens=resume_tokens,
+        resume_grace=RESUME_GRACE,
+    )
+
+
+# rebuilt by lifespan in the worker itself: the worker id is the pid, and
+# with --preload this module is imported before the workers are forked
+cluster = build_cluster()
+
+ACTION_LOG_DIR = os.environ.get("ROOM_ACTION_LOG_DIR", "")
+ACTION_LOG_SNAPSHOT_EVERY = int(os.environ.get("ROOM_ACTION_LOG_SNAPSHOT_EVERY", 100))
+log_writer = LogWriter()
+
+
+def action_log_path(code: str) -> str:
+    return os.path.join(ACTION_LOG_DIR, f"{code}.log")
+
+
+def attach_log(room: Room) -> None:
+    if not ACTION_LOG_DIR:
+        return
+    game_type = {cls: name for name, cls in GAME_TYPES.items()}[type(room.game)]
+    room.log = RoomLog(
+        room.game,
+        game_type,
+        action_log_path(room.code),
+        log_writer,
+        snapshot_every=ACTION_LOG_SNAPSHOT_EVERY,
+    )
+
+
+def release_code(code: str) -> None:
+    if ACTION_LOG_DIR:
+        log_writer.delete(action_log_path(code))
+    cluster.registry.release(code)
+    code_allocator.free(code)
+
+
+EMPTY_GRACE = float(os.environ.get("ROOM_EMPTY_GRACE_SECONDS", 300))
+
+reaper = RoomReaper(
+    rooms,
+    empty_grace=EMPTY_GRACE,
+    idle_ttl=float(os.environ.get("ROOM_IDLE_TTL_SECONDS", 3600)),
+    interval=float(os.environ.get("ROOM_REAP_INTERVAL_SECONDS", 30)),
+    on_evict=release_code,
+)
+
+# off unless configured: several workers sharing one file would overwrite
+# each other's snapshot and all restore the same rooms
+SNAPSHOT_PATH = os.environ.get("ROOM_SNAPSHOT_PATH", "")
+snapshots: Optional[SnapshotStore] = (
+    SnapshotStore(
+        SNAPSHOT_PATH,
+        max_age=float(os.environ.get("ROOM_SNAPSHOT_MAX_AGE_SECONDS", 3600)),
+    )
+    if SNAPSHOT_PATH
+    else None
+)
+
+RESTORE_SECONDS = Histogram(
+    "roomcode_room_restore_seconds",
+    "Time to restore a room from the snapshot on first connection",
+    buckets=LATENCY_BUCKETS,
+)
+
+Gauge("roomcode_rooms", "Rooms held by this worker", function=lambda: len(rooms))
+Gauge(
+    "roomcode_connections",
+    "Clients connected to rooms held by this worker",
+    function=lambda: sum(len(room) for room in rooms.values()),
+)
+Gauge(
+    "roomcode_relayed_connections",
+    "Clients connected here whose room is held by another worker",
+    function=lambda: len(cluster.remote_clients),
+)
+Counter(
+    "roomcode_rooms_evicted",
+    "Rooms evicted by the reaper, by reason",
+    ["reason"],
+    function=lambda: {
+        ("empty",): reaper.evicted_empty,
+        ("idle",): reaper.evicted_idle,
+    },
+)
+Gauge(
+    "roomcode_codes_in_use",
+    "Room codes currently allocated",
+    function=lambda: code_allocator.stats()["in_use"],
+)
+Gauge(
+    "roomcode_codes_capacity",
+    "Number of possible room codes",
+    function=lambda: code_allocator.capacity,
+)
+Gauge(
+    "roomcode_held_seats",
+    "Disconnected clients whose seat is held for them to resume",
+    function=lambda: sum(room.held_count() for room in rooms.values()),
+)
+Counter(
+    "roomcode_action_log_records",
+    "Action log events and snapshots written",
+    function=lambda: log_writer.records,
+)
+Counter(
+    "roomcode_action_log_batches",
+    "Batches written by the action log thread",
+    function=lambda: log_writer.batches,
+)
+Counter(
+    "roomcode_action_log_write_seconds",
+    "Time the action log thread spent writing",
+    function=lambda: log_writer.write_seconds,
+)
+Gauge(
+    "roomcode_action_log_pending",
+    "Action log writes queued for the writer thread",
+    function=log_writer.pending,
+)
+
+# watchers get at most this many frames a second; 0 for every state change
+WATCH_MAX_FPS = float(os.environ.get("WATCH_MAX_FPS", 10))
+WATCH_KEEPALIVE = float(os.environ.get("WATCH_KEEPALIVE_SECONDS", 15))
+Gauge(
+    "roomcode_watchers",
+    "Read-only watchers streaming rooms held by this worker",
+    function=lambda: sum(len(room.watchers) for room in rooms.values()),
+)
+
+
+PING_INTERVAL = float(os.environ.get("WS_PING_INTERVAL_SECONDS", 20))
+heartbeat: Optional[Heartbeat] = (
+    Heartbeat(
+        interval=PING_INTERVAL,
+        timeout=float(os.environ.get("WS_PING_TIMEOUT_SECONDS", 60)),
+    )
+    if PING_INTERVAL > 0
+    else None
+)
+if heartbeat is not None:
+    Gauge(
+        "roomcode_heartbeat_connections",
+        "Connections watched by the heartbeat",
+        function=lambda: len(heartbeat.wheel) if heartbeat is not None else 0,
+    )
+    Counter(
+        "roomcode_heartbeat_pings",
+        "Pings sent to quiet connections",
+        function=lambda: heartbeat.pings if heartbeat is not None else 0,
+    )
+    Counter(
+        "roomcode_heartbeat_evictions",
+        "Connections closed for not answering pings or no longer being connected",
+        function=lambda: heartbeat.evicted if heartbeat is not None else 0,
+    )
+
+
+def compression_total(field: str) -> Callable[[], float]:
+    return lambda: sum(getattr(room.compression, field) for room in rooms.values())
+
+
+for field, description in [
+    ("frames", "Frames sent on compressed connections"),
+    ("compressed_frames", "Frames above the threshold that were compressed"),
+    ("bytes_in", "Bytes of frames on compressed connections before compression"),
+    ("bytes_out", "Bytes of frames on compressed connections after compression"),
+    ("cpu_seconds", "CPU time spent compressing frames"),
+]:
+    Gauge(
+        f"roomcode_ws_compression_{field}",
+        f"{description}, summed over live rooms",
+        function=compression_total(field),
+    )
+
+
+def compression_ratio() -> float:
+    bytes_in = compression_total("bytes_in")()
+    return compression_total("bytes_out")() / bytes_in if bytes_in else 1.0
+
+
+def compression_by_room(field: str) -> Callable[[], Dict[Tuple[str, ...], float]]:
+    # only rooms with compressed connections, to keep the label set small
+    return lambda: {
+        (code,): getattr(room.compression, field)
+        for code, room in rooms.items()
+        if room.compression.frames
+    }
+
+
+Gauge(
+    "roomcode_ws_compression_ratio",
+    "Bytes after compression over bytes before, over live rooms",
+    function=compression_ratio,
+)
+Gauge(
+    "roomcode_room_ws_compression_ratio",
+    "Bytes after compression over bytes before, by room with compressed clients",
+    ["room"],
+    function=compression_by_room("ratio"),
+)
+Gauge(
+    "roomcode_room_ws_compression_cpu_seconds",
+    "CPU time spent compressing frames, by room with compressed clients",
+    ["room"],
+    function=compression_by_room("cpu_seconds"),
+)
+
+
+if snapshots is not None:
+    Gauge(
+        "roomcode_snapshot_pending_rooms",
+        "Rooms in the startup snapshot that nobody has reconnected to yet",
+        function=lambda: len(snapshots) if snapshots is not None else 0,
+    )
+    Gauge(
+        "roomcode_snapshot_index_seconds",
+        "Time spent indexing the snapshot at startup",
+        function=lambda: snapshots.index_seconds if snapshots is not None else 0,
+    )
+    Gauge(
+        "roomcode_snapshot_write_seconds",
+        "Time spent writing the last snapshot",
+        function=lambda: snapshots.write_seconds if snapshots is not None else 0,
+    )
+
+
+def restore_snapshot_room(code: str) -> Optional[Room]:
+    if snapshots is None or (payload := snapshots.take(code)) is None:
+        return None
+    started = time.perf_counter()
+    try:
+        room = restore_room(code, payload, GAME_TYPES)
+    except (KeyError, TypeError, ValueError) as exc:
+        logger.warning("Could not restore room %s: %r", code, exc)
+        code_allocator.free(code)
+        return None
+    room.coalesce_window = COALESCE_WINDOW
+    attach_log(room)
+    rooms[code] = room
+    RESTORE_SECONDS.observe(time.perf_counter() - started)
+    logger.info("Restored room %s from snapshot", code)
+    return room
+
+
+async def expire_snapshot(store: SnapshotStore) -> None:
+    # rooms nobody came back for are evicted like any other empty room
+    await asyncio.sleep(EMPTY_GRACE)
+    for code in store.drop_remaining():
+        code_allocator.free(code)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI) -> AsyncIterator[None]:
+    global cluster
+    cluster = build_cluster()
+    await cluster.start()
+    if ACTION_LOG_DIR:
+        os.makedirs(ACTION_LOG_DIR, mode=0o700, exist_ok=True)
+        log_writer.start()
+    expiry = None
+    if snapshots is not None:
+        for code in snapshots.open():
+            code_allocator.claim(code)
+        if len(snapshots):
+            expiry = asyncio.create_task(expire_snapshot(snapshots))
+    reaper.start()
+    if heartbeat is not None:
+        heartbeat.start()
+    yield
+    if heartbeat is not None:
+        await heartbeat.stop()
+    await reaper.stop()
+    if snapshots is not None:
+        if expiry is not None:
+            expiry.cancel()
+        records = [
+            (code, snapshot_room(room, GAME_TYPES)) for code, room in rooms.items()
+        ]
+        records.extend(snapshots.remaining())
+        snapshots.write(records)
+    log_writer.stop()
+    await cluster.stop()
 
 
 class CreateGameRequest(BaseModel):
@@ -32,18 +385,30 @@ class CreateGameRequest(BaseModel):
 
 @router.post("/create-game/")
 async def create_game(request: CreateGameRequest) -> dict:
-    if request.game_type == "pass_the_pebble":
-        game = PassThePebbleGame(request.players)
-    else:
+    if (game_type := GAME_TYPES.get(request.game_type)) is None:
         raise HTTPException(status_code=400, detail="Unknown game type")
+    game = game_type(request.players)  # type: ignore[arg-type]
 
-    code = generate_code()
-    while code in rooms:
-        code = generate_code()
-    rooms[code] = Room(code, game)
+    taken = []  # in use by another worker; offer them again later
+    code = code_allocator.allocate()
+    while not cluster.registry.reserve(code):
+        taken.append(code)
+        code = code_allocator.allocate()
+    for other in taken:
+        code_allocator.free(other)
+    rooms[code] = room = Room(code, game)
+    room.coalesce_window = COALESCE_WINDOW
+    attach_log(room)
     return {"code": code}
 
 
+@router.get("/metrics", response_class=PlainTextResponse)
+async def metrics() -> PlainTextResponse:
+    return PlainTextResponse(
+        REGISTRY.render(), media_type="text/plain; version=0.0.4; charset=utf-8"
+    )
+
+
 # Basic UI page
 @router.get("/play/pass-the-pebble/", response_class=HTMLResponse)
 async def play_pass_the_pebble(request: Request):
@@ -51,39 +416,112 @@ async def play_pass_the_pebble(request: Request):
     return FileResponse(file_path)
 
 
+@router.get("/watch/{code}/")
+async def watch_game(code: str) -> StreamingResponse:
+    if (room := rooms.get(code)) is None:
+        room = restore_snapshot_room(code)
+    if room is None:
+        # a room held by another worker has to be watched there
+        raise HTTPException(status_code=404, detail="Game room not found")
+    watcher = room.watch()
+
+    async def events() -> AsyncIterator[bytes]:
+        try:
+            async for frame in stream(
+                watcher,
+                min_interval=1 / WATCH_MAX_FPS if WATCH_MAX_FPS > 0 else 0,
+                keepalive=WATCH_KEEPALIVE,
+            ):
+                yield frame
+        finally:
+            room.unwatch(watcher)
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
 @router.websocket("/ws/{code}/")
 async def game_ws(websocket: WebSocket, code: str):
-    await websocket.accept()
-    if (room := rooms.get(code)) is None:
-        await websocket.send_json({"error": "Game room not found"})
-        await websocket.close()
-        return
+    conn = await accept(websocket, DEFLATE)
+    if heartbeat is not None:
+        heartbeat.watch(conn)
+    try:
+        await serve_game(websocket, conn, code)
+    finally:
+        if heartbeat is not None:
+            heartbeat.forget(conn)
 
-    client_id = str(uuid.uuid4())[:8]
-    logger.info("WebSocket client_id=%s connected at %s", client_id, websocket.client)
-    room[client_id] = websocket
 
-    await websocket.send_json(
-        {
-            "client_id": client_id,
-            **room.common_payload(),
-            "my_slot": None,
-        }
+def resume_query(websocket: WebSocket) -> Dict[str, Any]:
+    """The resume token, version and patches a reconnecting client asked for."""
+    if (token := websocket.query_params.get("resume")) is None:
+        return {}
+    try:
+        version: Optional[int] = int(websocket.query_params["version"])
+    except (KeyError, ValueError):
+        version = None
+    return dict(
+        resume=token,
+        version=version,
+        patches=websocket.query_params.get("patches") == "1",
     )
 
-    game = room.game
 
-    if not game.manager:
-        await room.set_manager(client_id, websocket)
+async def serve_game(websocket: WebSocket, conn: Connection, code: str) -> None:
+    if (room := rooms.get(code)) is None:
+        room = restore_snapshot_room(code)
+    query = resume_query(websocket)
+    if room is None:
+        if (owner := cluster.remote_owner(code)) is not None:
+            await cluster.serve_remote(conn, code, owner, resume=query)
+            return
+        outbox = outbox_of(conn)
+        outbox.send(conn.codec.encode({"error": "Game room not found"}), URGENT)
+        outbox.close()
+        await outbox.drain()
+        return
 
-    await room.broadcast_slots()
+    client_id = str(uuid.uuid4())[:8]
+    context: Dict[str, Any] = dict(
+        ws=conn,
+        room=room,
+        client_id=client_id,
+        resume_token=resume_tokens.issue(code, client_id),
+    )
+    resumed = None
+    if (token := query.get("resume")) is not None:
+        resumed = resume_tokens.verify(token, code)
+    room.touch()
+    if resumed is None:
+        await room.submit(join_room, context)
+    else:
+        context = dict(
+            context,
+            client_id=resumed,
+            version=query["version"],
+            patches=query["patches"],
+            resume_token=resume_tokens.issue(code, resumed),
+            fallback=context,
+        )
+        await room.submit(resume_room, context)
+    if (client_id := context["client_id"]) == resumed:
+        logger.info("WebSocket client_id=%s resumed at %s", client_id, conn.client)
+        SESSIONS_RESUMED.inc()
+    else:
+        logger.info("WebSocket client_id=%s connected at %s", client_id, conn.client)
 
     try:
         while True:
             try:
-                data = await websocket.receive_json()
-                context = dict(ws=websocket, room=room, client_id=client_id, data=data)
-                await handle_ws_message(context)
+                data = await conn.receive()
+                if is_pong(data):
+                    continue
+                room.touch()
+                context = dict(ws=conn, room=room, client_id=client_id, data=data)
+                await room.submit(handle_ws_message, context)
 
             except Exception as exc:
                 if isinstance(exc, WebSocketDisconnect):
@@ -94,18 +532,18 @@ async def game_ws(websocket: WebSocket, code: str):
                     raise WebSocketDisconnect
 
                 logger.exception("Error handling WebSocket message: %r", exc)
-                await websocket.send_json(
-                    {"error": "Server error while handling your action"}
+                outbox_of(conn).send(
+                    conn.codec.encode(
+                        {"error": "Server error while handling your action"}
+                    ),
+                    URGENT,
                 )
 
     except WebSocketDisconnect:
         logger.info("client_id=%s disconnected from room %s!", client_id, room.code)
-        del room[client_id]
-        await room.release_slot(client_id)
-        if room:
-            if game.manager == client_id:
-                await room.release_manager()
-            await room.broadcast_slots()
-            await room.send_game_state()
+        room.touch()
+        context = dict(ws=conn, room=room, client_id=client_id)
+        if RESUME_GRACE > 0:
+            await room.submit(hold_seat, dict(context, grace=RESUME_GRACE))
         else:
-            del room
+            await room.submit(leave_room, context)
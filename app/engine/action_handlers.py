@@ -1,15 +1,34 @@
 import logging
+import time
+
+from app.engine.metrics import Counter, Histogram
 
 logger = logging.getLogger()
 
+ACTION_SECONDS = Histogram(
+    "roomcode_action_seconds",
+    "Time spent applying a client action, by action",
+    ["action"],
+)
+ACTION_ERRORS = Counter(
+    "roomcode_action_errors",
+    "Client actions whose handler raised, by action",
+    ["action"],
+)
+
 
 async def claim_slot(ctx: dict):
     slot = ctx["data"]["slot"]
     if ctx["room"].game.players[slot].client_id is None:
-        logger.info("client_id=%s claiming slot %s", ctx["client_id"], slot)
+        logger.info(
+            "client_id=%s claiming slot %s",
+            ctx["client_id"],
+            slot,
+            extra={"sample": "slot"},
+        )
         await ctx["room"].claim_slot(slot, ctx["client_id"])
     else:
-        await ctx["ws"].send_json({"error": f"Slot {slot} already claimed"})
+        await ctx["room"].send(ctx["ws"], {"error": f"Slot {slot} already claimed"})
 
 
 async def update_name(ctx: dict):
@@ -22,11 +41,13 @@ async def update_name(ctx: dict):
             slot,
             player.display_name,
             (name := ctx["data"]["name"]),
+            extra={"sample": "slot"},
         )
         player.set_display_name(name)
+        room.record("update_name", slot=slot, name=name)
         await room.broadcast_slots()
     else:
-        await ctx["ws"].send_json({"error": f"Cannot change name for {slot=}"})
+        await ctx["room"].send(ctx["ws"], {"error": f"Cannot change name for {slot=}"})
 
 
 async def claim_manager(ctx: dict):
@@ -35,13 +56,13 @@ async def claim_manager(ctx: dict):
     )
     if not await ctx["room"].set_manager(client_id, (websocket := ctx["ws"])):
         logger.info("client_id=%s unable to claim manager", client_id)
-        await websocket.send_json({"error": "Could not claim manager"})
+        await ctx["room"].send(websocket, {"error": "Could not claim manager"})
 
 
 async def release_slot(ctx: dict):
     room = ctx["room"]
     if not await room.release_slot(ctx["client_id"]):
-        await ctx["ws"].send_json({"error": "No slot associated with client"})
+        await ctx["room"].send(ctx["ws"], {"error": "No slot associated with client"})
     elif room.game.is_started:
         await room.send_game_state()
 
@@ -51,17 +72,32 @@ async def start_game(ctx: dict):
     try:
         await room.start_game(ctx["client_id"], ctx["ws"])
     except ValueError as exc:
-        await ctx["ws"].send_json({"error": f"{exc}"})
+        await ctx["room"].send(ctx["ws"], {"error": f"{exc}"})
 
 
 async def take_turn(ctx: dict):
     room = ctx["room"]
-    room.game.submit_action(ctx["client_id"], ctx["data"]["turn"])
+    room.game.submit_action(ctx["client_id"], (turn := ctx["data"]["turn"]))
+    room.record("take_turn", client_id=ctx["client_id"], turn=turn)
 
     # Notify all connected players of the new state
     await room.send_game_state()
 
 
+async def catch_up(ctx: dict):
+    # the public view and the recent events, for a client that fell behind
+    room = ctx["room"]
+    if room.log is None:
+        await room.send(ctx["ws"], {"error": "This room keeps no action log"})
+    else:
+        await room.send(ctx["ws"], {"catch_up": room.log.catch_up()})
+
+
+async def ack_state(ctx: dict):
+    if not ctx["room"].ack_state(ctx["client_id"], ctx["data"].get("version")):
+        await ctx["room"].send(ctx["ws"], {"error": "Unknown state version"})
+
+
 ACTION_HANDLERS = {
     "take_turn": take_turn,
     "claim_slot": claim_slot,
@@ -69,14 +105,109 @@ ACTION_HANDLERS = {
     "claim_manager": claim_manager,
     "release_slot": release_slot,
     "start_game": start_game,
+    "ack_state": ack_state,
+    "catch_up": catch_up,
 }
 
 
+async def join_room(ctx: dict):
+    room, client_id, websocket = ctx["room"], ctx["client_id"], ctx["ws"]
+    # frames deferred for earlier actions belong before this client's welcome
+    await room.flush()
+    room[client_id] = websocket
+    welcome = {"client_id": client_id, **room.common_payload(), "my_slot": None}
+    if (token := ctx.get("resume_token")) is not None:
+        welcome["resume_token"] = token
+    await room.send(websocket, welcome)
+
+    if not room.game.manager:
+        await room.set_manager(client_id, websocket)
+
+    await room.broadcast_slots()
+
+
+async def resume_room(ctx: dict):
+    """
+    Reattach a client to its seat, whether the room is holding it after a
+    disconnect or the old connection is still registered because the server
+    hasn't noticed the disconnect yet; that connection is closed. Only the
+    client hears about it: a welcome with its old client_id and slot, then
+    the game state if it missed anything since the version it last saw. Only
+    a client that asked for patches gets them against that version. If the
+    seat has been given up, the client joins as ctx["fallback"] instead, and
+    ctx is updated to say so.
+    """
+    room, client_id, websocket = ctx["room"], ctx["client_id"], ctx["ws"]
+    await room.flush()
+    if not room.unhold(client_id) and client_id not in room:
+        ctx.update(ctx["fallback"])
+        await join_room(ctx)
+        return
+    room.take_over(client_id, websocket)
+    if (version := ctx.get("version")) is not None and ctx.get("patches"):
+        room.ack_state(client_id, version)
+    await room.send(
+        websocket,
+        {
+            "client_id": client_id,
+            "resume_token": ctx["resume_token"],
+            "resumed": True,
+            **room.common_payload(),
+            "my_slot": room.slot_of(client_id),
+        },
+    )
+    if room.game.is_started and version != room.state_version:
+        await room.send_game_state_to(client_id)
+
+
+def _superseded(ctx: dict) -> bool:
+    # the client has resumed on another connection since this one went away
+    conn = ctx["room"].get(ctx["client_id"])
+    return conn is not None and conn is not ctx["ws"]
+
+
+async def hold_seat(ctx: dict):
+    if _superseded(ctx):
+        return
+    room = ctx["room"]
+    leave_ctx = dict(ws=ctx["ws"], room=room, client_id=ctx["client_id"])
+    room.hold(
+        ctx["client_id"], ctx["grace"], lambda: room.submit(leave_room, leave_ctx)
+    )
+
+
+async def leave_room(ctx: dict):
+    if _superseded(ctx):
+        return
+    room, client_id = ctx["room"], ctx["client_id"]
+    room.remove(client_id)
+    await room.release_slot(client_id)
+    if room.game.manager == client_id:
+        await room.release_manager()
+    if room:
+        await room.broadcast_slots()
+        await room.send_game_state()
+
+
 async def handle_ws_message(context: dict):
     action = context["data"].get("action")
-    logger.info("client %s sent action %s", context["client_id"], action)
+    logger.info(
+        "client %s sent action %s",
+        context["client_id"],
+        action,
+        extra={"sample": "action"},
+    )
 
     if (handler := ACTION_HANDLERS.get(action)) is None:
-        await context["ws"].send_json({"error": f"Unknown action: {action}"})
+        await context["room"].send(
+            context["ws"], {"error": f"Unknown action: {action}"}
+        )
     else:
-        await handler(context)
+        started = time.perf_counter()
+        try:
+            await handler(context)
+        except Exception:
+            ACTION_ERRORS.inc(1, action)
+            raise
+        finally:
+            ACTION_SECONDS.observe(time.perf_counter() - started, action)
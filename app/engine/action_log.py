@@ -0,0 +1,257 @@
+import json
+import logging
+import os
+import queue
+import struct
+import threading
+import time
+from typing import Any, Dict, List, Mapping, Optional, Tuple, Type
+
+from app.engine.frames import encode
+from app.game.base import Game
+
+logger = logging.getLogger()
+
+# Each record is a kind byte and a payload length, then that much JSON.
+_RECORD_HEADER = struct.Struct(">BI")
+EVENT = 0
+SNAPSHOT = 1  # everything before it in the file is superseded
+
+# event fields only the server may see: client ids are what resuming relies on
+_PRIVATE_FIELDS = ("client_id", "force")
+
+_APPEND = "append"
+_REPLACE = "replace"
+_DELETE = "delete"
+_STOP = "stop"
+
+
+def encode_record(kind: int, record: Dict[str, Any]) -> bytes:
+    payload = encode(record).encode()
+    return _RECORD_HEADER.pack(kind, len(payload)) + payload
+
+
+def read_log(path: str) -> Tuple[Optional[Dict[str, Any]], List[Dict[str, Any]]]:
+    """The last snapshot in a log and the events after it."""
+    with open(path, "rb") as f:
+        data = f.read()
+    snapshot: Optional[Dict[str, Any]] = None
+    events: List[Dict[str, Any]] = []
+    offset = 0
+    while offset + _RECORD_HEADER.size <= len(data):
+        kind, length = _RECORD_HEADER.unpack_from(data, offset)
+        start = offset + _RECORD_HEADER.size
+        offset = start + length
+        if offset > len(data):
+            logger.warning("Ignoring torn record at the end of %s", path)
+            break
+        record = json.loads(data[start:offset])
+        if kind == SNAPSHOT:
+            snapshot, events = record, []
+        else:
+            events.append(record)
+    return snapshot, events
+
+
+def restore_game(
+    snapshot: Dict[str, Any], game_types: Mapping[str, Type[Game]]
+) -> Game:
+    game = game_types[snapshot["game_type"]].restore(snapshot["game"])
+    for slot, client_id in enumerate(snapshot["seats"]):
+        game.players[slot].set_client_id(client_id)
+    game.manager = snapshot["manager"]
+    return game
+
+
+def apply_event(game: Game, event: Dict[str, Any]) -> None:
+    """Repeat one logged change on a game."""
+    kind = event["type"]
+    if kind == "take_turn":
+        game.submit_action(event["client_id"], event["turn"], event.get("force"))
+    elif kind == "claim_slot":
+        game.players[event["slot"]].set_client_id(event["client_id"])
+    elif kind == "release_slot":
+        game.players[event["slot"]].set_client_id(None)
+    elif kind == "update_name":
+        game.players[event["slot"]].set_display_name(event["name"])
+    elif kind == "set_manager":
+        game.manager = event["client_id"]
+    elif kind == "start_game":
+        game.start_game()
+    else:
+        raise ValueError(f"Unknown event type: {kind}")
+    game.state_changed()
+
+
+def replay(path: str, game_types: Mapping[str, Type[Game]]) -> Tuple[Game, int]:
+    """Rebuild a room's game from its log; returns it and its last sequence."""
+    snapshot, events = read_log(path)
+    if snapshot is None:
+        raise ValueError(f"No snapshot in {path}")
+    game = restore_game(snapshot, game_types)
+    seq = snapshot["seq"]
+    for event in events:
+        apply_event(game, event)
+        seq = event["seq"]
+    return game, seq
+
+
+class LogWriter:
+    """
+    Does all action-log file I/O on one background thread, so the event loop
+    only enqueues bytes. Whatever has queued up while the thread was busy is
+    written as one batch, with a single write per file; a snapshot replacing
+    a file makes everything queued for it before unnecessary.
+    """
+
+    def __init__(self) -> None:
+        self.batches: int = 0
+        self.records: int = 0
+        self.bytes_written: int = 0
+        self.write_seconds: float = 0.0
+        self.errors: int = 0
+        self._queue: "queue.SimpleQueue[Tuple[str, str, bytes]]" = queue.SimpleQueue()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self) -> None:
+        if self._thread is None:
+            self._thread = threading.Thread(
+                target=self._run, name="action-log", daemon=True
+            )
+            self._thread.start()
+
+    def stop(self) -> None:
+        """Write everything queued so far, then end the thread."""
+        if self._thread is not None:
+            self._queue.put((_STOP, "", b""))
+            self._thread.join()
+            self._thread = None
+
+    def pending(self) -> int:
+        return self._queue.qsize()
+
+    def append(self, path: str, data: bytes) -> None:
+        self._queue.put((_APPEND, path, data))
+
+    def replace(self, path: str, data: bytes) -> None:
+        self._queue.put((_REPLACE, path, data))
+
+    def delete(self, path: str) -> None:
+        self._queue.put((_DELETE, path, b""))
+
+    def _run(self) -> None:
+        while True:
+            batch = [self._queue.get()]
+            while True:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            writes = [item for item in batch if item[0] != _STOP]
+            if writes:
+                started = time.perf_counter()
+                try:
+                    self._write(writes)
+                except Exception as exc:
+                    self.errors += 1
+                    logger.exception("Action log write failed: %r", exc)
+                self.batches += 1
+                self.write_seconds += time.perf_counter() - started
+            if len(writes) < len(batch):
+                return
+
+    def _write(self, batch: List[Tuple[str, str, bytes]]) -> None:
+        # only the last replace or delete of a file matters, and what follows
+        last = {path: i for i, (op, path, _) in enumerate(batch) if op != _APPEND}
+        appends: Dict[str, List[bytes]] = {}
+        for i, (op, path, data) in enumerate(batch):
+            if i < last.get(path, 0):
+                continue
+            if op == _APPEND:
+                appends.setdefault(path, []).append(data)
+                continue
+            appends.pop(path, None)
+            if op == _REPLACE:
+                temporary = f"{path}.tmp"
+                with open(temporary, "wb") as f:
+                    f.write(data)
+                os.replace(temporary, path)
+                self.records += 1
+                self.bytes_written += len(data)
+            elif op == _DELETE:
+                try:
+                    os.unlink(path)
+                except FileNotFoundError:
+                    pass
+        for path, chunks in appends.items():
+            data = b"".join(chunks)
+            with open(path, "ab") as f:
+                f.write(data)
+            self.records += len(chunks)
+            self.bytes_written += len(data)
+
+
+class RoomLog:
+    """
+    The append-only log of one room's game changes. Every snapshot_every
+    events a snapshot replaces the file, so replay never has to go far. The
+    events since the latest snapshot are also kept in memory for clients
+    catching up, who only get their public parts.
+    """
+
+    def __init__(
+        self,
+        game: Game,
+        game_type: str,
+        path: str,
+        writer: LogWriter,
+        snapshot_every: int = 100,
+        seq: int = 0,
+    ):
+        self.game = game
+        self.game_type = game_type
+        self.path = path
+        self.writer = writer
+        self.snapshot_every = snapshot_every
+        self.seq = seq
+        self._events: List[Dict[str, Any]] = []
+        self.snapshot()
+
+    def snapshot(self) -> None:
+        game = self.game
+        record = {
+            "seq": self.seq,
+            "game_type": self.game_type,
+            "game": game.snapshot(),
+            "seats": [game.players[slot].client_id for slot in sorted(game.players)],
+            "manager": game.manager,
+        }
+        self.writer.replace(self.path, encode_record(SNAPSHOT, record))
+        self._events = []
+
+    def append(self, kind: str, fields: Dict[str, Any]) -> None:
+        self.seq += 1
+        event = {"seq": self.seq, "type": kind, **fields}
+        self._events.append(event)
+        self.writer.append(self.path, encode_record(EVENT, event))
+        if len(self._events) >= self.snapshot_every:
+            self.snapshot()
+
+    def catch_up(self) -> Dict[str, Any]:
+        """
+        The game's public view now, and the recent events without the
+        fields that identify clients. Snapshots hold private state, such as
+        cards nobody has seen yet, so they never leave the server.
+        """
+        return {
+            "seq": self.seq,
+            "view": self.game.public_view(),
+            "events": [
+                {
+                    key: value
+                    for key, value in event.items()
+                    if key not in _PRIVATE_FIELDS
+                }
+                for event in self._events
+            ],
+        }
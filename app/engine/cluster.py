@@ -0,0 +1,522 @@
+import asyncio
+import base64
+import json
+import logging
+import os
+import socket
+import uuid
+from abc import ABC, abstractmethod
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Set
+
+from fastapi import WebSocketDisconnect
+from fastapi.websockets import WebSocketState
+
+from app.engine.action_handlers import (
+    handle_ws_message,
+    hold_seat,
+    join_room,
+    leave_room,
+    resume_room,
+)
+from app.engine.connection import Connection
+from app.engine.frames import CODECS, JSON, Codec, encode, write
+from app.engine.heartbeat import is_pong
+from app.engine.outbox import URGENT, outbox_of
+from app.engine.resume import ResumeTokens
+from app.engine.room import Room
+
+logger = logging.getLogger()
+
+BusHandler = Callable[[Dict[str, Any]], Awaitable[None]]
+
+
+class RoomRegistry(ABC):
+    """Decides which worker owns a room code."""
+
+    def __init__(self, rooms: Dict[str, Room], worker_id: str):
+        self.rooms = rooms
+        self.worker_id = worker_id
+
+    @abstractmethod
+    def reserve(self, code: str) -> bool:
+        """Claim code for this worker; False if another room already uses it."""
+
+    @abstractmethod
+    def release(self, code: str) -> None:
+        pass  # pragma: no cover
+
+    @abstractmethod
+    def owner(self, code: str) -> Optional[str]:
+        pass  # pragma: no cover
+
+    def worker_alive(self, worker_id: str) -> bool:
+        return worker_id == self.worker_id
+
+
+class InMemoryRegistry(RoomRegistry):
+    # single worker: the local rooms dict is the whole registry
+
+    def reserve(self, code: str) -> bool:
+        return code not in self.rooms
+
+    def release(self, code: str) -> None:
+        pass
+
+    def owner(self, code: str) -> Optional[str]:
+        return self.worker_id if code in self.rooms else None
+
+
+def _pid_alive(worker_id: str) -> bool:
+    try:
+        os.kill(int(worker_id), 0)
+    except ProcessLookupError:
+        return False
+    except (PermissionError, ValueError):
+        pass
+    return True
+
+
+class LocalRegistry(RoomRegistry):
+    """
+    Registry shared by the worker processes on one host. Each reserved code is
+    a file holding the owner's worker id (its pid); O_EXCL creation makes the
+    reservation atomic across processes, and codes held by dead workers are
+    taken over.
+    """
+
+    def __init__(self, rooms: Dict[str, Room], worker_id: str, directory: str):
+        super().__init__(rooms, worker_id)
+        self.directory = os.path.join(directory, "rooms")
+        os.makedirs(self.directory, mode=0o700, exist_ok=True)
+
+    def _path(self, code: str) -> str:
+        return os.path.join(self.directory, code)
+
+    def reserve(self, code: str) -> bool:
+        if code in self.rooms:
+            return False
+        for _ in range(2):
+            try:
+                fd = os.open(self._path(code), os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+            except FileExistsError:
+                if self.owner(code) is not None:
+                    return False
+                continue  # owner() removed a stale reservation
+            with os.fdopen(fd, "w") as f:
+                f.write(self.worker_id)
+            return True
+        return False
+
+    def release(self, code: str) -> None:
+        if self.owner(code) == self.worker_id:
+            try:
+                os.unlink(self._path(code))
+            except FileNotFoundError:
+                pass
+
+    def worker_alive(self, worker_id: str) -> bool:
+        return _pid_alive(worker_id)
+
+    def owner(self, code: str) -> Optional[str]:
+        if code in self.rooms:
+            return self.worker_id
+        try:
+            with open(self._path(code)) as f:
+                owner = f.read()
+        except FileNotFoundError:
+            return None
+        if owner and not _pid_alive(owner):
+            logger.info("Removing room %s reserved by dead worker %s", code, owner)
+            try:
+                os.unlink(self._path(code))
+            except FileNotFoundError:
+                pass
+            return None
+        return owner or None
+
+
+class Bus(ABC):
+    """Delivers small JSON messages to a worker by id."""
+
+    def __init__(self, worker_id: str):
+        self.worker_id = worker_id
+        self._handler: Optional[BusHandler] = None
+        self._tasks: Set[asyncio.Future] = set()
+
+    async def start(self, handler: BusHandler) -> None:
+        self._handler = handler
+
+    async def stop(self) -> None:
+        self._handler = None
+
+    @abstractmethod
+    def publish(self, worker_id: str, message: Dict[str, Any]) -> None:
+        pass  # pragma: no cover
+
+    def _dispatch(self, message: Dict[str, Any]) -> None:
+        # tasks start in FIFO order, so per-client message order is kept
+        if self._handler is None:
+            return
+        task = asyncio.ensure_future(self._handler(message))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+
+class InMemoryBus(Bus):
+    def publish(self, worker_id: str, message: Dict[str, Any]) -> None:
+        if worker_id == self.worker_id:
+            self._dispatch(message)
+
+
+# Unix datagrams over about 200KB fail with EMSGSIZE, so larger messages go
+# as several datagrams. Each starts with a byte saying whether more follow;
+# datagrams between two workers arrive whole and in order.
+MAX_DATAGRAM = 64 * 1024
+_MORE, _LAST = b"\x01", b"\x00"
+
+
+class _DatagramProtocol(asyncio.DatagramProtocol):
+    def __init__(self, bus: "UnixSocketBus"):
+        self.bus = bus
+        self._parts: Dict[Any, List[bytes]] = {}
+
+    def datagram_received(self, data: bytes, addr: Any) -> None:
+        parts = self._parts.setdefault(addr, [])
+        parts.append(data[1:])
+        if data[:1] == _MORE:
+            return
+        del self._parts[addr]
+        try:
+            message = json.loads(b"".join(parts))
+        except ValueError:
+            logger.warning("Dropping malformed bus message")
+            return
+        self.bus._dispatch(message)
+
+    def error_received(self, exc: Exception) -> None:
+        logger.warning("Bus send failed: %r", exc)
+
+
+class UnixSocketBus(Bus):
+    """Each worker binds a Unix datagram socket named after its worker id."""
+
+    def __init__(self, worker_id: str, directory: str):
+        super().__init__(worker_id)
+        self.directory = os.path.join(directory, "bus")
+        self._transport: Optional[asyncio.DatagramTransport] = None
+
+    def _path(self, worker_id: str) -> str:
+        return os.path.join(self.directory, f"{worker_id}.sock")
+
+    async def start(self, handler: BusHandler) -> None:
+        await super().start(handler)
+        os.makedirs(self.directory, mode=0o700, exist_ok=True)
+        path = self._path(self.worker_id)
+        if os.path.exists(path):
+            os.unlink(path)
+        self._transport, _ = await asyncio.get_running_loop().create_datagram_endpoint(
+            lambda: _DatagramProtocol(self), local_addr=path, family=socket.AF_UNIX
+        )
+
+    async def stop(self) -> None:
+        await super().stop()
+        if self._transport is not None:
+            self._transport.close()
+            self._transport = None
+            try:
+                os.unlink(self._path(self.worker_id))
+            except FileNotFoundError:
+                pass
+
+    def publish(self, worker_id: str, message: Dict[str, Any]) -> None:
+        if self._transport is None:
+            raise RuntimeError("Bus not started")
+        data, path = encode(message).encode(), self._path(worker_id)
+        for start in range(0, len(data), MAX_DATAGRAM):
+            end = start + MAX_DATAGRAM
+            self._transport.sendto(
+                (_MORE if end < len(data) else _LAST) + data[start:end], path
+            )
+
+
+class RemoteConnection:
+    """
+    Stands in for a websocket held by another worker, so the owning worker's
+    Room can broadcast to it like any local connection. client_id is the id
+    that worker relays the connection under, new for every connection; seat
+    is the client_id it has in the room, which a resumed client keeps.
+    """
+
+    def __init__(
+        self,
+        bus: Bus,
+        worker_id: str,
+        client_id: str,
+        codec: Codec = JSON,
+        code: str = "",
+        seat: Optional[str] = None,
+    ):
+        self.bus = bus
+        self.worker_id = worker_id
+        self.client_id = client_id
+        self.codec = codec
+        self.code = code
+        self.seat = client_id if seat is None else seat
+        self.client = f"worker {worker_id}"
+        self.application_state = WebSocketState.CONNECTED
+
+    async def send_text(self, data: str) -> None:
+        self.bus.publish(
+            self.worker_id, {"type": "frame", "client_id": self.client_id, "text": data}
+        )
+
+    async def send_bytes(self, data: bytes) -> None:
+        self.bus.publish(
+            self.worker_id,
+            {
+                "type": "frame",
+                "client_id": self.client_id,
+                "bytes": base64.b64encode(data).decode(),
+            },
+        )
+
+    async def send_json(self, data: Any) -> None:
+        await write(self, self.codec.encode(data))
+
+    async def close(self, code: int = 1000) -> None:
+        self.application_state = WebSocketState.DISCONNECTED
+        self.bus.publish(
+            self.worker_id, {"type": "close", "client_id": self.client_id, "code": code}
+        )
+
+
+class Cluster:
+    """
+    Routes connections for rooms owned by other workers. The owner applies
+    every action; other workers relay their clients' messages to it and relay
+    its frames back. Relayed clients resume like local ones when the owner
+    has resume_tokens, and their seats are held for resume_grace seconds when
+    they go away. Clients relayed by a worker that has died leave their rooms
+    within peer_check_interval seconds.
+    """
+
+    def __init__(
+        self,
+        registry: RoomRegistry,
+        bus: Bus,
+        peer_check_interval: float = 5.0,
+        resume_tokens: Optional[ResumeTokens] = None,
+        resume_grace: float = 0.0,
+    ):
+        self.registry = registry
+        self.bus = bus
+        self.peer_check_interval = peer_check_interval
+        self.resume_tokens = resume_tokens
+        self.resume_grace = resume_grace
+        self.remote_clients: Dict[str, Connection] = {}
+        # owner side: each relaying worker's connections by their relay id
+        self.relayed: Dict[str, Dict[str, RemoteConnection]] = {}
+        self._peer_check: Optional[asyncio.Task] = None
+
+    @property
+    def worker_id(self) -> str:
+        return self.registry.worker_id
+
+    async def start(self) -> None:
+        await self.bus.start(self._on_message)
+        self._peer_check = asyncio.create_task(self._check_peers())
+
+    async def stop(self) -> None:
+        if self._peer_check is not None:
+            self._peer_check.cancel()
+            try:
+                await self._peer_check
+            except asyncio.CancelledError:
+                pass
+            self._peer_check = None
+        await self.bus.stop()
+
+    async def _check_peers(self) -> None:
+        while True:
+            await asyncio.sleep(self.peer_check_interval)
+            try:
+                await self.expire_dead_peers()
+            except Exception as exc:
+                logger.exception("Error expiring relayed clients: %r", exc)
+
+    async def expire_dead_peers(self) -> int:
+        """Make the clients of dead relaying workers leave; returns how many."""
+        expired = 0
+        dead = [w for w in self.relayed if not self.registry.worker_alive(w)]
+        for worker in dead:
+            for remote in self.relayed.pop(worker).values():
+                room = self.registry.rooms.get(remote.code)
+                if room is None or room.get(remote.seat) is not remote:
+                    continue
+                logger.info(
+                    "client_id=%s relayed by dead worker %s left room %s",
+                    remote.seat,
+                    worker,
+                    remote.code,
+                )
+                await self._leave(room, remote)
+                expired += 1
+        return expired
+
+    def remote_owner(self, code: str) -> Optional[str]:
+        if (owner := self.registry.owner(code)) == self.worker_id:
+            return None
+        return owner
+
+    async def _on_message(self, message: Dict[str, Any]) -> None:
+        kind = message.get("type")
+        if kind in ("frame", "close"):
+            if (conn := self.remote_clients.get(message["client_id"])) is None:
+                return
+            # through the client's outbox, so a stuck client holds up no others
+            outbox = outbox_of(conn)
+            if kind == "close":
+                outbox.close(message.get("code", 1000))
+            elif "bytes" in message:
+                outbox.send(base64.b64decode(message["bytes"]))
+            else:
+                outbox.send(message["text"])
+            return
+
+        if kind == "join":
+            if (room := self.registry.rooms.get(message.get("code", ""))) is not None:
+                await self._join(room, message)
+            return
+        relayed = self.relayed.get(message.get("worker", ""), {})
+        if kind == "leave":
+            remote = relayed.pop(message["client_id"], None)
+        else:
+            remote = relayed.get(message["client_id"])
+        if remote is None or (room := self.registry.rooms.get(remote.code)) is None:
+            return
+        room.touch()
+        if kind == "action":
+            context = dict(
+                ws=remote, room=room, client_id=remote.seat, data=message["data"]
+            )
+            try:
+                await room.submit(handle_ws_message, context)
+            except Exception as exc:
+                logger.exception("Error handling relayed message: %r", exc)
+                outbox_of(remote).send(
+                    remote.codec.encode(
+                        {"error": "Server error while handling your action"}
+                    ),
+                    URGENT,
+                )
+        elif kind == "leave":
+            await self._leave(room, remote)
+
+    async def _join(self, room: Room, message: Dict[str, Any]) -> None:
+        # a resumed client keeps its seat's client_id; if the seat is gone by
+        # the time the room gets to it, the client joins under that id afresh
+        resumed = None
+        if self.resume_tokens is not None and (token := message.get("resume")):
+            resumed = self.resume_tokens.verify(token, room.code)
+        remote = RemoteConnection(
+            self.bus,
+            message["worker"],
+            message["client_id"],
+            CODECS.get(message.get("codec", ""), JSON),
+            code=room.code,
+            seat=resumed,
+        )
+        self.relayed.setdefault(remote.worker_id, {})[remote.client_id] = remote
+        context: Dict[str, Any] = dict(ws=remote, room=room, client_id=remote.seat)
+        if self.resume_tokens is not None:
+            context["resume_token"] = self.resume_tokens.issue(room.code, remote.seat)
+        room.touch()
+        if resumed is None:
+            await room.submit(join_room, context)
+        else:
+            logger.info(
+                "client_id=%s relayed by worker %s resumed in room %s",
+                resumed,
+                remote.worker_id,
+                room.code,
+            )
+            await room.submit(
+                resume_room,
+                dict(
+                    context,
+                    version=message.get("version"),
+                    patches=message.get("patches", False),
+                    fallback=context,
+                ),
+            )
+
+    async def _leave(self, room: Room, remote: RemoteConnection) -> None:
+        context = dict(ws=remote, room=room, client_id=remote.seat)
+        if self.resume_grace > 0:
+            await room.submit(hold_seat, dict(context, grace=self.resume_grace))
+        else:
+            await room.submit(leave_room, context)
+
+    async def serve_remote(
+        self,
+        conn: Connection,
+        code: str,
+        owner: str,
+        resume: Optional[Dict[str, Any]] = None,
+    ) -> None:
+        """
+        Relay a client to the room's owner. resume holds the client's resume
+        token, version and patches request, which the owner acts on.
+        """
+        client_id = str(uuid.uuid4())[:8]
+        logger.info(
+            "WebSocket client_id=%s relayed to worker %s for room %s",
+            client_id,
+            owner,
+            code,
+        )
+        self.remote_clients[client_id] = conn
+        envelope = {"code": code, "client_id": client_id, "worker": self.worker_id}
+        self.bus.publish(
+            owner,
+            {"type": "join", "codec": conn.codec.name, **(resume or {}), **envelope},
+        )
+        try:
+            while True:
+                try:
+                    data = await conn.receive()
+                except ValueError:
+                    outbox_of(conn).send(
+                        conn.codec.encode(
+                            {"error": "Server error while handling your action"}
+                        ),
+                        URGENT,
+                    )
+                    continue
+                if not is_pong(data):
+                    self.bus.publish(
+                        owner, {"type": "action", "data": data, **envelope}
+                    )
+        except (WebSocketDisconnect, RuntimeError):
+            pass
+        finally:
+            self.remote_clients.pop(client_id, None)
+            self.bus.publish(owner, {"type": "leave", **envelope})
+
+
+def make_cluster(
+    rooms: Dict[str, Room], backend: str, directory: str, **options: Any
+) -> Cluster:
+    """options are passed on to Cluster."""
+    worker_id = str(os.getpid())
+    if backend == "memory":
+        return Cluster(
+            InMemoryRegistry(rooms, worker_id), InMemoryBus(worker_id), **options
+        )
+    if backend == "local":
+        return Cluster(
+            LocalRegistry(rooms, worker_id, directory),
+            UnixSocketBus(worker_id, directory),
+            **options,
+        )
+    raise ValueError(f"Unknown room backend: {backend}")
@@ -0,0 +1,101 @@
+import random
+from collections import deque
+from typing import Deque, Dict, List, Optional, Set
+
+# no 0/O or 1/I/L, which are easy to mix up when read aloud or off a screen
+UNAMBIGUOUS_ALPHABET = "ABCDEFGHJKMNPQRSTUVWXYZ23456789"
+
+
+class CodeAllocator:
+    """
+    Hands out room codes in O(1) regardless of how many are in use.
+
+    Fresh codes come from a keyed pseudo-random permutation of the whole code
+    space, so each code is issued once before any repeats and no retry loop is
+    needed. Codes given back with free() are reused oldest-first once the
+    fresh codes run out. A small reserve of upcoming codes is kept ready.
+    """
+
+    def __init__(
+        self,
+        length: int = 4,
+        alphabet: str = UNAMBIGUOUS_ALPHABET,
+        reserve_size: int = 64,
+        rng: Optional[random.Random] = None,
+    ):
+        if length < 1 or len(set(alphabet)) != len(alphabet) or len(alphabet) < 2:
+            raise ValueError("Need a positive length and at least two distinct symbols")
+        self.length = length
+        self.alphabet = alphabet
+        self.capacity: int = len(alphabet) ** length
+        self.reserve_size = reserve_size
+        rng = rng or random.Random()
+        self._half_bits = max(1, ((self.capacity - 1).bit_length() + 1) // 2)
+        self._keys: List[int] = [rng.getrandbits(32) for _ in range(4)]
+        self._next_index: int = 0
+        self._reserve: Deque[str] = deque()
+        self._freed: Deque[str] = deque()
+        self._in_use: Set[str] = set()
+
+    def _permute(self, index: int) -> int:
+        # Feistel network over 2 * half_bits bits, cycle-walked into range
+        mask = (1 << self._half_bits) - 1
+        while True:
+            left, right = index >> self._half_bits, index & mask
+            for key in self._keys:
+                mixed = ((right ^ key) * 0x9E3779B1) >> 7
+                left, right = right, left ^ (mixed & mask)
+            index = (left << self._half_bits) | right
+            if index < self.capacity:
+                return index
+
+    def _to_code(self, number: int) -> str:
+        base = len(self.alphabet)
+        chars = []
+        for _ in range(self.length):
+            number, digit = divmod(number, base)
+            chars.append(self.alphabet[digit])
+        return "".join(chars)
+
+    def _refill(self) -> None:
+        while len(self._reserve) < self.reserve_size:
+            if self._next_index < self.capacity:
+                number = self._permute(self._next_index)
+                self._next_index += 1
+                self._reserve.append(self._to_code(number))
+            elif self._freed:
+                self._reserve.append(self._freed.popleft())
+            else:
+                break
+
+    def allocate(self) -> str:
+        while True:
+            if not self._reserve:
+                self._refill()
+                if not self._reserve:
+                    raise RuntimeError("No room codes left")
+            code = self._reserve.popleft()
+            if code not in self._in_use:
+                self._in_use.add(code)
+                return code
+
+    def claim(self, code: str) -> bool:
+        """Mark a specific code as in use, e.g. one restored from a snapshot."""
+        if code in self._in_use:
+            return False
+        self._in_use.add(code)
+        return True
+
+    def free(self, code: str) -> None:
+        if code in self._in_use:
+            self._in_use.remove(code)
+            self._freed.append(code)
+
+    def stats(self) -> Dict[str, float]:
+        return {
+            "capacity": self.capacity,
+            "in_use": len(self._in_use),
+            "free": self.capacity - len(self._in_use),
+            "occupancy": len(self._in_use) / self.capacity,
+            "reserve": len(self._reserve),
+        }
@@ -0,0 +1,93 @@
+import time
+import zlib
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Dict, Optional, Union
+
+# Compressed connections get every frame as binary, prefixed with one byte:
+RAW = b"\x00"
+DEFLATED = b"\x01"  # raw DEFLATE, sync-flushed with the 00 00 ff ff tail removed
+
+# As in RFC 7692, clients should append 00 00 ff ff and feed DEFLATED payloads
+# to one inflater kept for the whole connection.
+_TAIL = b"\x00\x00\xff\xff"
+
+
+@dataclass
+class DeflateSettings:
+    threshold: int = 1024  # bytes; smaller frames are not worth compressing
+    level: int = 6
+    context_takeover: bool = False
+
+
+@dataclass
+class CompressionStats:
+    frames: int = 0
+    compressed_frames: int = 0
+    bytes_in: int = 0
+    bytes_out: int = 0
+    cpu_seconds: float = 0.0
+
+    @property
+    def ratio(self) -> float:
+        return self.bytes_out / self.bytes_in if self.bytes_in else 1.0
+
+    def as_dict(self) -> Dict[str, float]:
+        return {
+            "frames": self.frames,
+            "compressed_frames": self.compressed_frames,
+            "bytes_in": self.bytes_in,
+            "bytes_out": self.bytes_out,
+            "ratio": self.ratio,
+            "cpu_seconds": self.cpu_seconds,
+        }
+
+
+@lru_cache(maxsize=64)
+def _deflate(frame: Union[str, bytes], level: int) -> bytes:
+    # stateless, so a frame object broadcast to many clients is compressed once
+    data = frame.encode() if isinstance(frame, str) else frame
+    compressor = zlib.compressobj(level, zlib.DEFLATED, -zlib.MAX_WBITS)
+    return (compressor.compress(data) + compressor.flush(zlib.Z_SYNC_FLUSH))[:-4]
+
+
+class FrameCompressor:
+    def __init__(self, settings: DeflateSettings):
+        self.settings = settings
+        self._context: Optional["zlib._Compress"] = None
+        if settings.context_takeover:
+            self._context = zlib.compressobj(
+                settings.level, zlib.DEFLATED, -zlib.MAX_WBITS
+            )
+
+    def wrap(
+        self, frame: Union[str, bytes], stats: Optional[CompressionStats] = None
+    ) -> bytes:
+        data = frame.encode() if isinstance(frame, str) else frame
+        if len(data) < self.settings.threshold:
+            if stats is not None:
+                stats.frames += 1
+                stats.bytes_in += len(data)
+                stats.bytes_out += len(data) + 1
+            return RAW + data
+
+        started = time.process_time()
+        if self._context is None:
+            payload = _deflate(frame, self.settings.level)
+        else:
+            payload = self._context.compress(data)
+            payload = (payload + self._context.flush(zlib.Z_SYNC_FLUSH))[:-4]
+        if stats is not None:
+            stats.frames += 1
+            stats.compressed_frames += 1
+            stats.bytes_in += len(data)
+            stats.bytes_out += len(payload) + 1
+            stats.cpu_seconds += time.process_time() - started
+        return DEFLATED + payload
+
+
+def unwrap(data: bytes, inflater: "zlib._Decompress") -> bytes:
+    """The client's side of FrameCompressor.wrap."""
+    if data[:1] == RAW:
+        return data[1:]
+    return inflater.decompress(data[1:] + _TAIL)
@@ -0,0 +1,67 @@
+import time
+from typing import Any, Optional
+
+from fastapi import WebSocket
+
+from app.engine.compression import DeflateSettings, FrameCompressor
+from app.engine.frames import JSON, Codec, Frame, negotiate, write
+
+
+class Connection:
+    """
+    A client's websocket together with the codec negotiated for it and, if
+    the client asked for it, a compressor applied to outgoing frames.
+    """
+
+    def __init__(
+        self,
+        websocket: WebSocket,
+        codec: Codec = JSON,
+        compressor: Optional[FrameCompressor] = None,
+    ):
+        self.websocket = websocket
+        self.codec = codec
+        self.compressor = compressor
+        # monotonic time of the last message received, for the heartbeat
+        self.last_seen: float = time.monotonic()
+
+    @property
+    def application_state(self):
+        return self.websocket.application_state
+
+    @property
+    def client(self):
+        return self.websocket.client
+
+    async def send_text(self, data: str) -> None:
+        await self.websocket.send_text(data)
+
+    async def send_bytes(self, data: bytes) -> None:
+        await self.websocket.send_bytes(data)
+
+    async def send_json(self, message: Any) -> None:
+        await write(self, self.codec.encode(message))
+
+    async def receive(self) -> Any:
+        data: Frame
+        if self.codec.binary:
+            data = await self.websocket.receive_bytes()
+        else:
+            data = await self.websocket.receive_text()
+        self.last_seen = time.monotonic()
+        return self.codec.decode(data)
+
+    async def close(self, code: int = 1000) -> None:
+        await self.websocket.close(code)
+
+
+async def accept(
+    websocket: WebSocket, deflate: Optional[DeflateSettings] = None
+) -> Connection:
+    offered = websocket.scope.get("subprotocols", [])
+    codec, subprotocol = negotiate(offered, allow_deflate=deflate is not None)
+    await websocket.accept(subprotocol=subprotocol)
+    compressor = None
+    if deflate is not None and subprotocol and subprotocol.endswith("+deflate"):
+        compressor = FrameCompressor(deflate)
+    return Connection(websocket, codec, compressor)
@@ -0,0 +1,204 @@
+import json
+from abc import ABC, abstractmethod
+from typing import Any, Callable, Dict, Iterable, Optional, Tuple, Union
+
+from app.engine.compression import CompressionStats
+
+try:
+    import msgpack  # type: ignore[import-untyped]
+except ImportError:  # pragma: no cover
+    msgpack = None
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover
+    orjson = None  # type: ignore[assignment]
+
+JsonEncoder = Callable[[Any], str]
+
+
+def to_wire(value: Any) -> Any:
+    """
+    default= hook for every encoder: objects defining __json__ (such as poker
+    Cards) become their client-facing shape here, as the frame is built, and
+    nowhere earlier.
+    """
+    if (convert := getattr(type(value), "__json__", None)) is None:
+        raise TypeError(f"Object of type {type(value).__name__} is not serializable")
+    return convert(value)
+
+
+def stdlib_dumps(message: Any) -> str:
+    # same settings as starlette's WebSocket.send_json
+    return json.dumps(
+        message, separators=(",", ":"), ensure_ascii=False, default=to_wire
+    )
+
+
+def orjson_dumps(message: Any) -> str:
+    try:
+        return orjson.dumps(
+            message, default=to_wire, option=orjson.OPT_NON_STR_KEYS
+        ).decode()
+    except TypeError:
+        # e.g. integers beyond 64 bits, which the stdlib can still encode
+        return stdlib_dumps(message)
+
+
+JSON_ENCODERS: Dict[str, JsonEncoder] = {"stdlib": stdlib_dumps}
+if orjson is not None:
+    JSON_ENCODERS["orjson"] = orjson_dumps
+
+_dumps: JsonEncoder = JSON_ENCODERS.get("orjson", stdlib_dumps)
+
+
+def use_json_encoder(encoder: Union[str, JsonEncoder]) -> JsonEncoder:
+    """
+    Set the function every outgoing JSON frame is encoded with: a name from
+    JSON_ENCODERS, "auto" for the fastest one installed, or any function
+    producing compact JSON text. Returns the previous encoder.
+    """
+    global _dumps
+    previous = _dumps
+    if encoder == "auto":
+        _dumps = JSON_ENCODERS.get("orjson", stdlib_dumps)
+    elif isinstance(encoder, str):
+        if encoder not in JSON_ENCODERS:
+            raise ValueError(f"JSON encoder {encoder} is not available")
+        _dumps = JSON_ENCODERS[encoder]
+    else:
+        _dumps = encoder
+    return previous
+
+
+def encode(message: Any) -> str:
+    return _dumps(message)
+
+
+def extend(frame: str, extra: Dict[str, Any]) -> str:
+    """
+    Add top-level keys to an already-encoded JSON object without decoding it,
+    so a shared payload is encoded once and only the small per-client part is
+    encoded per connection.
+    """
+    if not extra:
+        return frame
+    tail = encode(extra)[1:]
+    if frame == "{}":
+        return "{" + tail
+    return frame[:-1] + "," + tail
+
+
+Frame = Union[str, bytes]
+
+
+class Codec(ABC):
+    """How messages are written to and read from one kind of connection."""
+
+    name: str = ""
+    binary: bool = False
+
+    @abstractmethod
+    def encode(self, message: Any) -> Frame:
+        pass  # pragma: no cover
+
+    @abstractmethod
+    def extend(self, frame: Frame, extra: Dict[str, Any]) -> Frame:
+        pass  # pragma: no cover
+
+    @abstractmethod
+    def decode(self, data: Frame) -> Any:
+        pass  # pragma: no cover
+
+
+class JsonCodec(Codec):
+    name = "roomcode.json"
+
+    def encode(self, message: Any) -> Frame:
+        return encode(message)
+
+    def extend(self, frame: Frame, extra: Dict[str, Any]) -> Frame:
+        assert isinstance(frame, str)
+        return extend(frame, extra)
+
+    def decode(self, data: Frame) -> Any:
+        return json.loads(data)
+
+
+def _split_map(packed: bytes) -> Tuple[int, bytes]:
+    head = packed[0]
+    if 0x80 <= head <= 0x8F:
+        return head & 0x0F, packed[1:]
+    if head == 0xDE:
+        return int.from_bytes(packed[1:3], "big"), packed[3:]
+    if head == 0xDF:
+        return int.from_bytes(packed[1:5], "big"), packed[5:]
+    raise ValueError("Not a MessagePack map")
+
+
+def _map_header(count: int) -> bytes:
+    if count < 16:
+        return bytes([0x80 | count])
+    if count < 1 << 16:
+        return b"\xde" + count.to_bytes(2, "big")
+    return b"\xdf" + count.to_bytes(4, "big")
+
+
+class MsgpackCodec(Codec):
+    name = "roomcode.msgpack"
+    binary = True
+
+    def encode(self, message: Any) -> Frame:
+        return msgpack.packb(message, default=to_wire)
+
+    def extend(self, frame: Frame, extra: Dict[str, Any]) -> Frame:
+        # same trick as the JSON extend: rewrite the map header, append entries
+        assert isinstance(frame, bytes)
+        if not extra:
+            return frame
+        count, body = _split_map(frame)
+        extra_count, extra_body = _split_map(msgpack.packb(extra, default=to_wire))
+        return _map_header(count + extra_count) + body + extra_body
+
+    def decode(self, data: Frame) -> Any:
+        return msgpack.unpackb(data, strict_map_key=False)
+
+
+JSON = JsonCodec()
+
+# binary codecs are only offered when their optional dependency is installed
+CODECS: Dict[str, Codec] = {JSON.name: JSON}
+if msgpack is not None:
+    CODECS[MsgpackCodec.name] = MsgpackCodec()
+
+
+def negotiate(
+    offered: Iterable[str], allow_deflate: bool = False
+) -> Tuple[Codec, Optional[str]]:
+    """
+    Pick the first WebSocket subprotocol the client offered that we support;
+    a "+deflate" suffix asks for compressed frames on top of the codec.
+    Clients that offer none (like the static test page) get plain JSON.
+    """
+    for subprotocol in offered:
+        name, plus, extension = subprotocol.partition("+")
+        if plus and (extension != "deflate" or not allow_deflate):
+            continue
+        if (codec := CODECS.get(name)) is not None:
+            return codec, subprotocol
+    return JSON, None
+
+
+def codec_of(conn: Any) -> Codec:
+    return getattr(conn, "codec", JSON)
+
+
+async def write(
+    conn: Any, frame: Frame, stats: Optional[CompressionStats] = None
+) -> None:
+    if (compressor := getattr(conn, "compressor", None)) is not None:
+        frame = compressor.wrap(frame, stats)
+    if isinstance(frame, bytes):
+        await conn.send_bytes(frame)
+    else:
+        await conn.send_text(frame)
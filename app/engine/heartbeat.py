@@ -0,0 +1,169 @@
+import asyncio
+import logging
+import time
+from typing import Any, Dict, Hashable, List, Optional, Set, cast
+
+from fastapi.websockets import WebSocketState
+
+from app.engine.connection import Connection
+from app.engine.frames import codec_of
+from app.engine.outbox import URGENT, outbox_of
+
+logger = logging.getLogger()
+
+
+def is_pong(data: Any) -> bool:
+    return isinstance(data, dict) and data.get("action") == "pong"
+
+
+class TimerWheel:
+    """
+    A hashed timing wheel: timers are bucketed by the tick they expire in, so
+    advancing costs one bucket per tick passed plus the timers that expire,
+    however many are pending. Delays must fit in one turn of the wheel.
+    """
+
+    def __init__(self, tick: float = 1.0, slots: int = 64, now: Optional[float] = None):
+        self.tick = tick
+        self._slots: List[Dict[Hashable, None]] = [{} for _ in range(slots)]
+        self._slot_of: Dict[Hashable, int] = {}
+        self._current = self._tick_of(time.monotonic() if now is None else now)
+
+    def _tick_of(self, when: float) -> int:
+        return int(when / self.tick)
+
+    def __len__(self) -> int:
+        return len(self._slot_of)
+
+    def __contains__(self, key: Hashable) -> bool:
+        return key in self._slot_of
+
+    def schedule(
+        self, key: Hashable, delay: float, now: Optional[float] = None
+    ) -> None:
+        """Fire key after delay seconds, replacing any timer it already has."""
+        now = time.monotonic() if now is None else now
+        target = max(self._tick_of(now + delay), self._current + 1)
+        if target - self._current >= len(self._slots):
+            raise ValueError(f"Delay {delay}s is longer than the wheel")
+        self.cancel(key)
+        index = target % len(self._slots)
+        self._slots[index][key] = None
+        self._slot_of[key] = index
+
+    def cancel(self, key: Hashable) -> None:
+        if (index := self._slot_of.pop(key, None)) is not None:
+            del self._slots[index][key]
+
+    def advance(self, now: Optional[float] = None) -> List[Hashable]:
+        """Move the wheel up to now; returns the keys whose timers expired."""
+        target = self._tick_of(time.monotonic() if now is None else now)
+        # after a stall of a whole turn or more, every bucket is due once
+        steps = min(target - self._current, len(self._slots))
+        expired: List[Hashable] = []
+        for step in range(1, steps + 1):
+            bucket = self._slots[(self._current + step) % len(self._slots)]
+            if bucket:
+                expired.extend(bucket)
+                for key in bucket:
+                    del self._slot_of[key]
+                bucket.clear()
+        self._current = max(self._current, target)
+        return expired
+
+
+class Heartbeat:
+    """
+    Watches every connection of the process from one task on one timer wheel.
+    Connections that have been quiet for interval seconds are sent
+    {"ping": <n>}; any message from the client, a {"action": "pong"} reply
+    included, counts as a sign of life. Connections quiet for timeout seconds,
+    or no longer connected, are closed, which ends their receive loop so the
+    client leaves its room the usual way.
+    """
+
+    def __init__(
+        self,
+        interval: float = 20.0,
+        timeout: float = 60.0,
+        tick: float = 1.0,
+        now: Optional[float] = None,
+    ):
+        self.interval = interval
+        self.timeout = timeout
+        self.tick = tick
+        self.wheel = TimerWheel(tick, int(max(interval, timeout) / tick) + 2, now)
+        self.pings: int = 0
+        self.evicted: int = 0
+        self._closing: Set[asyncio.Future] = set()
+        self._task: Optional[asyncio.Task] = None
+
+    def watch(self, conn: Connection, now: Optional[float] = None) -> None:
+        now = time.monotonic() if now is None else now
+        conn.last_seen = now
+        self.wheel.schedule(conn, self.interval, now)
+
+    def forget(self, conn: Connection) -> None:
+        self.wheel.cancel(conn)
+
+    async def beat(self, now: Optional[float] = None) -> None:
+        now = time.monotonic() if now is None else now
+        quiet: List[Connection] = []
+        for key in self.wheel.advance(now):
+            conn = cast(Connection, key)
+            idle = now - conn.last_seen
+            if (
+                idle >= self.timeout
+                or conn.application_state != WebSocketState.CONNECTED
+            ):
+                self._evict(conn, idle)
+            elif idle < self.interval:
+                # heard from since the timer was set; no ping needed yet
+                self.wheel.schedule(conn, self.interval - idle, now)
+            else:
+                quiet.append(conn)
+                self.wheel.schedule(conn, min(self.interval, self.timeout - idle), now)
+        if quiet:
+            self.pings += len(quiet)
+            for conn in quiet:
+                self._ping(conn, self.pings)
+            await asyncio.sleep(0)  # let the writers start
+
+    def _ping(self, conn: Connection, n: int) -> None:
+        # queued like any frame, so a stuck socket holds up nobody else; a
+        # connection that stays broken is closed by its outbox or the timeout
+        outbox_of(conn).send(codec_of(conn).encode({"ping": n}), URGENT)
+
+    def _evict(self, conn: Connection, idle: float) -> None:
+        logger.info("Closing connection at %s quiet for %.0fs", conn.client, idle)
+        self.evicted += 1
+        task = asyncio.ensure_future(self._close(conn))
+        self._closing.add(task)
+        task.add_done_callback(self._closing.discard)
+
+    async def _close(self, conn: Connection) -> None:
+        try:
+            await asyncio.wait_for(conn.close(1001), self.timeout)
+        except Exception:
+            pass
+
+    async def run(self) -> None:
+        while True:
+            await asyncio.sleep(self.tick)
+            try:
+                await self.beat()
+            except Exception as exc:
+                logger.exception("Error checking heartbeats: %r", exc)
+
+    def start(self) -> None:
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self.run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
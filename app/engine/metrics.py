@@ -0,0 +1,205 @@
+import math
+from abc import ABC, abstractmethod
+from bisect import bisect_left
+from typing import Callable, Dict, List, Optional, Sequence, Tuple, Union
+
+Number = Union[int, float]
+Labels = Tuple[str, ...]
+Sample = Tuple[str, Labels, Number]  # name suffix, label values, value
+
+LATENCY_BUCKETS = (
+    0.0001,
+    0.00025,
+    0.0005,
+    0.001,
+    0.0025,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+)
+COUNT_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000)
+
+
+class Registry:
+    """Renders every registered metric in the Prometheus text format."""
+
+    def __init__(self) -> None:
+        self._metrics: Dict[str, "Metric"] = {}
+
+    def register(self, metric: "Metric") -> None:
+        if metric.name in self._metrics:
+            raise ValueError(f"Metric {metric.name} already registered")
+        self._metrics[metric.name] = metric
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics.values():
+            lines.append(f"# HELP {metric.name} {_escape_help(metric.help)}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            for suffix, values, value in metric.samples():
+                labels = _format_labels(metric.labelnames, values, suffix)
+                lines.append(f"{metric.name}{suffix}{labels} {_format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+
+class Metric(ABC):
+    kind = "untyped"
+
+    def __init__(
+        self,
+        name: str,
+        help: str,
+        labelnames: Sequence[str] = (),
+        registry: Optional[Registry] = REGISTRY,
+    ):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        if registry is not None:
+            registry.register(self)
+
+    @abstractmethod
+    def samples(self) -> List[Sample]:
+        pass  # pragma: no cover
+
+
+class _Scalar(Metric):
+    """
+    One number per label combination. Pass function to read the current
+    values from elsewhere at render time instead; it returns either a number
+    or a dict of label values to numbers.
+    """
+
+    suffix = ""
+
+    def __init__(
+        self,
+        name: str,
+        help: str,
+        labelnames: Sequence[str] = (),
+        registry: Optional[Registry] = REGISTRY,
+        function: Optional[Callable[[], Union[Number, Dict[Labels, Number]]]] = None,
+    ):
+        super().__init__(name, help, labelnames, registry)
+        self.function = function
+        self._values: Dict[Labels, Number] = {}
+
+    def inc(self, amount: Number = 1, *labels: str) -> None:
+        self._values[labels] = self._values.get(labels, 0) + amount
+
+    def samples(self) -> List[Sample]:
+        if self.function is None:
+            values = self._values
+        elif isinstance(current := self.function(), dict):
+            values = current
+        else:
+            values = {(): current}
+        return [(self.suffix, labels, value) for labels, value in values.items()]
+
+
+class Counter(_Scalar):
+    kind = "counter"
+    suffix = "_total"
+
+
+class Gauge(_Scalar):
+    kind = "gauge"
+
+    def set(self, value: Number, *labels: str) -> None:
+        self._values[labels] = value
+
+
+class _HistogramChild:
+    __slots__ = ("buckets", "counts", "sum")
+
+    def __init__(self, buckets: Tuple[float, ...]):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # the last one is +Inf
+        self.sum: float = 0.0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+
+
+class Histogram(Metric):
+    """
+    Counts observations into buckets by upper bound. Look up the series for a
+    label combination once with labels() and call observe() on it; both are
+    cheap enough for the per-action path.
+    """
+
+    kind = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        help: str,
+        labelnames: Sequence[str] = (),
+        registry: Optional[Registry] = REGISTRY,
+        buckets: Sequence[float] = LATENCY_BUCKETS,
+    ):
+        super().__init__(name, help, labelnames, registry)
+        self.buckets = tuple(sorted(buckets))
+        self._children: Dict[Labels, _HistogramChild] = {}
+
+    def labels(self, *values: str) -> _HistogramChild:
+        if (child := self._children.get(values)) is None:
+            if len(values) != len(self.labelnames):
+                raise ValueError(f"{self.name} takes labels {self.labelnames}")
+            child = self._children[values] = _HistogramChild(self.buckets)
+        return child
+
+    def observe(self, value: float, *labels: str) -> None:
+        self.labels(*labels).observe(value)
+
+    def samples(self) -> List[Sample]:
+        samples: List[Sample] = []
+        for labels, child in self._children.items():
+            cumulative = 0
+            for bound, count in zip(self.buckets + (math.inf,), child.counts):
+                cumulative += count
+                samples.append(
+                    ("_bucket", labels + (_format_value(bound),), cumulative)
+                )
+            samples.append(("_sum", labels, child.sum))
+            samples.append(("_count", labels, cumulative))
+        return samples
+
+
+def _escape_help(text: str) -> str:
+    return text.replace("\\", "\\\\").replace("\n", "\\n")
+
+
+def _format_labels(names: Labels, values: Labels, suffix: str) -> str:
+    if suffix == "_bucket":
+        names = names + ("le",)
+    if not names:
+        return ""
+    pairs = (
+        '{}="{}"'.format(
+            name,
+            str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n"),
+        )
+        for name, value in zip(names, values)
+    )
+    return "{" + ",".join(pairs) + "}"
+
+
+def _format_value(value: Number) -> str:
+    if isinstance(value, float):
+        if math.isinf(value):
+            return "+Inf" if value > 0 else "-Inf"
+        if value.is_integer() and abs(value) < 1e15:
+            return str(int(value))
+        return repr(value)
+    return str(value)
@@ -0,0 +1,211 @@
+import asyncio
+import logging
+import time
+from collections import deque
+from typing import Any, Callable, Deque, Optional
+
+from app.engine.compression import CompressionStats
+from app.engine.frames import Frame, write
+from app.engine.metrics import Counter
+
+logger = logging.getLogger()
+
+# Lanes, in the order queued frames are written.
+URGENT = 0  # errors
+STATE = 1  # the latest game state, which also tells the player it's their turn
+INFO = 2  # everything else: welcome, slots, info messages
+
+# "Try Again Later": the server closed the connection because it was overloaded
+CLOSE_TOO_SLOW = 1013
+
+SUPERSEDED = Counter(
+    "roomcode_outbox_superseded",
+    "Queued game-state frames dropped because a newer one was queued",
+)
+OVERFLOWS = Counter(
+    "roomcode_outbox_overflows",
+    "Connections closed because they stayed over their outbound queue limit",
+)
+
+
+class Outbox:
+    """
+    The frames waiting to be written to one connection. Sending only queues a
+    frame; a writer task per connection writes them, errors first, then game
+    state, then everything else, so whoever sends never waits on the socket.
+    Only the newest game state is kept. A write that fails or takes longer
+    than send_timeout closes the connection with code 1011.
+
+    A connection whose queue holds more than max_bytes for overflow_grace
+    seconds, or twice that at any time, is closed with code 1013, so a client
+    that stops reading costs at most about 2 * max_bytes. on_close is called
+    when the outbox closes the connection either way.
+    """
+
+    def __init__(
+        self,
+        conn: Any,
+        max_bytes: int = 1 << 20,
+        overflow_grace: float = 1.0,
+        send_timeout: float = 5.0,
+        stats: Optional[CompressionStats] = None,
+        on_close: Optional[Callable[[], None]] = None,
+    ):
+        self.conn = conn
+        self.max_bytes = max_bytes
+        self.overflow_grace = overflow_grace
+        self.send_timeout = send_timeout
+        self.stats = stats
+        self.on_close = on_close
+        self.queued_bytes: int = 0
+        self.closed: bool = False
+        self._urgent: Deque[Frame] = deque()
+        self._state: Optional[Frame] = None
+        self._info: Deque[Frame] = deque()
+        self._writer: Optional[asyncio.Future] = None
+        self._timed_out: bool = False
+        self._close_code: Optional[int] = None
+        self._over_since: Optional[float] = None
+        self._closing: Optional[asyncio.Future] = None
+
+    def __len__(self) -> int:
+        return len(self._urgent) + (self._state is not None) + len(self._info)
+
+    def send(self, frame: Frame, lane: int = INFO) -> bool:
+        """Queue a frame; False if the connection has been closed."""
+        if self.closed or self._close_code is not None:
+            return False
+        self._enqueue(frame, lane)
+        if self.closed:
+            return False
+        self._start_writer()
+        return True
+
+    def close(self, code: int = 1000) -> None:
+        """Close the connection once the frames already queued are written."""
+        if self.closed or self._close_code is not None:
+            return
+        self._close_code = code
+        self._start_writer()
+
+    def _start_writer(self) -> None:
+        if self._writer is None:
+            self._writer = asyncio.ensure_future(self._write_queued())
+
+    async def drain(self) -> None:
+        """Wait until everything queued so far has been written or dropped."""
+        while self._writer is not None:
+            await asyncio.wait([self._writer])
+
+    def _enqueue(self, frame: Frame, lane: int) -> None:
+        if lane == URGENT:
+            self._urgent.append(frame)
+        elif lane == STATE:
+            if self._state is not None:
+                self.queued_bytes -= len(self._state)
+                SUPERSEDED.inc()
+            self._state = frame
+        else:
+            self._info.append(frame)
+        self.queued_bytes += len(frame)
+
+        if self.queued_bytes <= self.max_bytes:
+            return
+        now = time.monotonic()
+        if self._over_since is None:
+            self._over_since = now
+        if (
+            self.queued_bytes > 2 * self.max_bytes
+            or now - self._over_since >= self.overflow_grace
+        ):
+            logger.warning(
+                "Closing connection at %s with %s bytes queued",
+                getattr(self.conn, "client", None),
+                self.queued_bytes,
+            )
+            OVERFLOWS.inc()
+            self._shut(CLOSE_TOO_SLOW)
+
+    def _pop(self) -> Optional[Frame]:
+        frame: Optional[Frame]
+        if self._urgent:
+            frame = self._urgent.popleft()
+        elif self._state is not None:
+            frame, self._state = self._state, None
+        elif self._info:
+            frame = self._info.popleft()
+        else:
+            return None
+        self.queued_bytes -= len(frame)
+        if self.queued_bytes <= self.max_bytes:
+            self._over_since = None
+        return frame
+
+    def _time_out(self, writer: asyncio.Future) -> None:
+        self._timed_out = True
+        writer.cancel()
+
+    async def _write_queued(self) -> None:
+        # a timer rather than wait_for, so a write that doesn't block finishes
+        # within the writer's first step
+        loop = asyncio.get_running_loop()
+        writer = asyncio.current_task()
+        assert writer is not None
+        try:
+            while not self.closed and (frame := self._pop()) is not None:
+                timer = loop.call_later(self.send_timeout, self._time_out, writer)
+                try:
+                    await write(self.conn, frame, self.stats)
+                finally:
+                    timer.cancel()
+            if self._close_code is not None and not self.closed:
+                self.closed = True
+                await asyncio.wait_for(
+                    self.conn.close(self._close_code), self.send_timeout
+                )
+        except asyncio.CancelledError:
+            if not self._timed_out:
+                raise
+            self._fail("timed out")
+        except Exception as exc:
+            self._fail(repr(exc))
+        finally:
+            self._writer = None
+
+    def _fail(self, reason: str) -> None:
+        logger.warning(
+            "Closing connection at %s after failed send: %s",
+            getattr(self.conn, "client", None),
+            reason,
+        )
+        self._shut(1011)
+
+    def _shut(self, code: int) -> None:
+        # closing ends the connection's receive loop, which leaves the room
+        self.closed = True
+        self._urgent.clear()
+        self._state = None
+        self._info.clear()
+        self.queued_bytes = 0
+        if self._writer is not None and self._writer is not asyncio.current_task():
+            self._writer.cancel()
+        self._closing = asyncio.ensure_future(self._close(code))
+        if self.on_close is not None:
+            self.on_close()
+
+    async def _close(self, code: int) -> None:
+        try:
+            await asyncio.wait_for(self.conn.close(code), self.send_timeout)
+        except Exception:
+            pass
+
+
+def outbox_of(conn: Any, **settings: Any) -> Outbox:
+    """
+    The connection's outbox, made with settings on first use. It is kept on
+    the connection, so it goes away with it.
+    """
+    if (outbox := getattr(conn, "outbox", None)) is None:
+        outbox = Outbox(conn, **settings)
+        setattr(conn, "outbox", outbox)
+    return outbox
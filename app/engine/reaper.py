@@ -0,0 +1,83 @@
+import asyncio
+import logging
+import time
+from typing import Callable, Dict, List, Optional
+
+from app.engine.room import Room
+
+logger = logging.getLogger()
+
+
+class RoomReaper:
+    """
+    Evicts rooms nobody is using:
+    - rooms with no connections once they have been quiet for empty_grace
+      seconds (long enough to survive a page reload), and
+    - any room with no activity at all for idle_ttl seconds.
+    Evicted codes are removed from the rooms dict, so they can be handed out
+    again; on_evict is called with each evicted code.
+    """
+
+    def __init__(
+        self,
+        rooms: Dict[str, Room],
+        empty_grace: float = 300.0,
+        idle_ttl: float = 3600.0,
+        interval: float = 30.0,
+        on_evict: Optional[Callable[[str], None]] = None,
+    ):
+        self.rooms = rooms
+        self.empty_grace = empty_grace
+        self.idle_ttl = idle_ttl
+        self.interval = interval
+        self.on_evict = on_evict
+        self.evicted_empty: int = 0
+        self.evicted_idle: int = 0
+        self._task: Optional[asyncio.Task] = None
+
+    def reap(self, now: Optional[float] = None) -> List[str]:
+        now = time.monotonic() if now is None else now
+        evicted = []
+        for code, room in list(self.rooms.items()):
+            quiet_for = now - room.last_activity
+            if not room and quiet_for >= self.empty_grace:
+                self.evicted_empty += 1
+            elif quiet_for >= self.idle_ttl:
+                self.evicted_idle += 1
+            else:
+                continue
+            logger.info("Evicting room %s after %.0fs quiet", code, quiet_for)
+            del self.rooms[code]
+            room.close()
+            if self.on_evict is not None:
+                self.on_evict(code)
+            evicted.append(code)
+        return evicted
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "rooms": len(self.rooms),
+            "evicted_empty": self.evicted_empty,
+            "evicted_idle": self.evicted_idle,
+        }
+
+    async def run(self) -> None:
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                self.reap()
+            except Exception as exc:
+                logger.exception("Error reaping rooms: %r", exc)
+
+    def start(self) -> None:
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self.run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
@@ -0,0 +1,52 @@
+import base64
+import binascii
+import hashlib
+import hmac
+import time
+from typing import Optional
+
+
+def _encode(data: bytes) -> str:
+    return base64.urlsafe_b64encode(data).rstrip(b"=").decode()
+
+
+def _decode(text: str) -> bytes:
+    return base64.urlsafe_b64decode(text + "=" * (-len(text) % 4))
+
+
+class ResumeTokens:
+    """
+    Signed tokens that let a client reconnecting to a room take back its
+    client_id. A token names the room and the client and expires after ttl
+    seconds; the room only honors it while that client still has a seat, held
+    or on an old connection.
+    """
+
+    def __init__(self, secret: bytes, ttl: float = 86400.0):
+        self.secret = secret
+        self.ttl = ttl
+
+    def _sign(self, body: bytes) -> bytes:
+        return hmac.new(self.secret, body, hashlib.sha256).digest()
+
+    def issue(self, code: str, client_id: str, now: Optional[float] = None) -> str:
+        expires = int((time.time() if now is None else now) + self.ttl)
+        body = f"{code}:{client_id}:{expires}".encode()
+        return f"{_encode(body)}.{_encode(self._sign(body))}"
+
+    def verify(
+        self, token: str, code: str, now: Optional[float] = None
+    ) -> Optional[str]:
+        """The client_id in a valid, unexpired token for this room, else None."""
+        try:
+            body_text, signature_text = token.split(".")
+            body, signature = _decode(body_text), _decode(signature_text)
+            token_code, client_id, expires = body.decode().split(":")
+            expiry = int(expires)
+        except (ValueError, binascii.Error):
+            return None
+        if not hmac.compare_digest(signature, self._sign(body)):
+            return None
+        if token_code != code or expiry < (time.time() if now is None else now):
+            return None
+        return client_id
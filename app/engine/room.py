@@ -1,43 +1,338 @@
+import asyncio
 import logging
-from copy import deepcopy
-from typing import Any, Callable, Dict, Optional
+import time
+from collections import OrderedDict, deque
+from typing import Any, Awaitable, Callable, Deque, Dict, List, Optional, Set, Tuple
 
 from fastapi import WebSocket
 from fastapi.websockets import WebSocketState
 
-from app.game.base import Game
+from app.engine.action_log import RoomLog
+from app.engine.compression import CompressionStats
+from app.engine.frames import Codec, Frame, codec_of, encode
+from app.engine.metrics import COUNT_BUCKETS, Counter, Histogram
+from app.engine.outbox import INFO, STATE, URGENT, Outbox, outbox_of
+from app.engine.state_diff import Patch, copy_view, diff
+from app.engine.watch import Watcher
+from app.game.base import Game, Player
 
 logger = logging.getLogger()
 
+Handler = Callable[[dict], Awaitable[None]]
+
+FANOUT_SECONDS = Histogram(
+    "roomcode_fanout_seconds",
+    "Time to queue one message for everyone in a room, by kind of message",
+    ["kind"],
+)
+FANOUT_FRAMES = Histogram(
+    "roomcode_fanout_frames",
+    "Frames sent per fan-out, by kind of message",
+    ["kind"],
+    buckets=COUNT_BUCKETS,
+)
+FRAMES_SENT = Counter(
+    "roomcode_frames_sent",
+    "Frames delivered to clients, by kind of message",
+    ["kind"],
+)
+BYTES_SENT = Counter(
+    "roomcode_frame_bytes_sent",
+    "Size of frames delivered to clients before compression (characters for "
+    "text frames), by kind of message",
+    ["kind"],
+)
+
 
 class Room(dict):
+    # seconds a single send may take before the connection is considered stuck
+    send_timeout: float = 5.0
+    # published state versions kept for diffing; older acks get a full snapshot
+    state_history: int = 16
+    # extra seconds the actor waits for more actions before flushing a batch
+    coalesce_window: float = 0.0
+    # bytes queued for a client that isn't keeping up before it is dropped
+    outbox_max_bytes: int = 1 << 20
+    outbox_overflow_grace: float = 1.0
+
     def __init__(self, code: str, game: Game, *args, **kwargs):
         super(Room, self).__init__(*args, **kwargs)
         self.code: str = code
         self.game: Game = game
+        self.last_activity: float = time.monotonic()
+        self.compression = CompressionStats()
+        self.log: Optional[RoomLog] = None
+        self._closing: Set[asyncio.Future] = set()
+        self._slot_by_client: Dict[str, int] = {}
+        self._available_slots: Optional[Dict[int, bool]] = None
+        self._names: Optional[Dict[int, Optional[str]]] = None
+        self._mailbox: Deque[Tuple[Handler, dict, asyncio.Future]] = deque()
+        self._actor: Optional[asyncio.Task] = None
+        self._batching: bool = False
+        self._slots_pending: bool = False
+        self._state_pending: bool = False
+        self.state_version: int = 0
+        self._states: "OrderedDict[int, Dict[str, Any]]" = OrderedDict()
+        self._acked_versions: Dict[str, int] = {}
+        self._held: Dict[str, asyncio.Future] = {}
+        self.watchers: Set[Watcher] = set()
+        self._watch_frame: Optional[bytes] = None
+        self._watch_offered: Optional[bytes] = None
+        for player in game.players.values():
+            player.set_listener(self._on_player_change)
+            if player.client_id is not None:
+                self._slot_by_client[player.client_id] = player.slot_index
+
+    def _on_player_change(self, player: Player, previous: Optional[str]) -> None:
+        if previous != player.client_id:
+            if (
+                previous is not None
+                and self._slot_by_client.get(previous) == player.slot_index
+            ):
+                del self._slot_by_client[previous]
+            if player.client_id is not None:
+                self._slot_by_client[player.client_id] = player.slot_index
+        self._available_slots = None
+        self._names = None
+        self._watch_frame = None
+        # seats and names can show in the public view
+        self.game.state_changed()
+
+    def outbox(self, conn: WebSocket) -> Outbox:
+        return outbox_of(
+            conn,
+            max_bytes=self.outbox_max_bytes,
+            overflow_grace=self.outbox_overflow_grace,
+            send_timeout=self.send_timeout,
+            stats=self.compression,
+            on_close=lambda: self._drop(conn),
+        )
+
+    def _drop(self, conn: WebSocket) -> None:
+        # its outbox gave up on the connection and is closing it
+        for client_id, member in list(self.items()):
+            if member is conn:
+                logger.warning(
+                    "Dropping client_id=%s from room %s after failed send",
+                    client_id,
+                    self.code,
+                )
+                self.remove(client_id)
+
+    async def fan_out(self, frames: Dict[str, Frame], kind: str = "broadcast") -> None:
+        """
+        Hand each client its pre-encoded frame through their outbox. Nothing
+        here waits for a socket: each connection's writer does the writing,
+        and a client whose write fails, exceeds send_timeout or whose outbox
+        overflows is removed from the room by it.
+        """
+        if not frames:
+            return
+        started = time.perf_counter()
+        lane = STATE if kind == "state" else INFO
+        handed = sent = size = 0
+        for client_id, frame in frames.items():
+            if (conn := self.get(client_id)) is None:
+                continue
+            handed += 1
+            if self.outbox(conn).send(frame, lane):
+                sent += 1
+                size += len(frame)
+            else:
+                self.discard(client_id)
+        # a turn lets the writers start at once; they are not waited on
+        await asyncio.sleep(0)
+        FANOUT_SECONDS.observe(time.perf_counter() - started, kind)
+        FANOUT_FRAMES.observe(handed, kind)
+        FRAMES_SENT.inc(sent, kind)
+        BYTES_SENT.inc(size, kind)
+
+    def remove(self, client_id: str) -> Optional[WebSocket]:
+        self._acked_versions.pop(client_id, None)
+        return self.pop(client_id, None)
+
+    def discard(self, client_id: str) -> None:
+        """
+        Remove a dead or stuck connection without waiting on it. Closing the
+        socket ends its receive loop, which runs the usual disconnect cleanup.
+        """
+        if (conn := self.remove(client_id)) is not None:
+            self._close_later(conn)
+
+    def take_over(self, client_id: str, conn: WebSocket) -> None:
+        """
+        Give a client's seat to its new connection conn, closing the old one
+        without waiting on it. The old connection's disconnect cleanup then
+        finds the client on another connection and leaves it alone.
+        """
+        if (old := self.remove(client_id)) is not None and old is not conn:
+            self._close_later(old)
+        self[client_id] = conn
+
+    def _close_later(self, conn: WebSocket) -> None:
+        task = asyncio.ensure_future(self._close_quietly(conn))
+        self._closing.add(task)
+        task.add_done_callback(self._closing.discard)
+
+    async def submit(self, handler: Handler, context: dict) -> None:
+        """
+        Queue handler(context) on this room's actor and wait until it has been
+        applied and the resulting state published. Actions for a room run one
+        at a time, in the order they were submitted, so handlers never
+        interleave across their own awaits. Exceptions from the handler are
+        re-raised here.
+        """
+        future = asyncio.get_running_loop().create_future()
+        self._mailbox.append((handler, context, future))
+        if self._actor is None or self._actor.done():
+            self._actor = asyncio.create_task(self._run_actor())
+        await future
+
+    async def _run_actor(self) -> None:
+        # exits once the mailbox is empty; submit() starts a new one as needed
+        while self._mailbox:
+            applied: List[Tuple[asyncio.Future, Optional[BaseException]]] = []
+            self._batching = True
+            try:
+                while True:
+                    while self._mailbox:
+                        handler, context, future = self._mailbox.popleft()
+                        try:
+                            await handler(context)
+                        except Exception as exc:
+                            applied.append((future, exc))
+                        else:
+                            applied.append((future, None))
+                    if self.coalesce_window <= 0:
+                        break
+                    await asyncio.sleep(self.coalesce_window)
+                    if not self._mailbox:
+                        break
+            finally:
+                self._batching = False
+
+            try:
+                await self.flush()
+            except Exception as exc:
+                logger.exception("Error publishing state for %s: %r", self.code, exc)
+
+            for future, error in applied:
+                if future.done():
+                    continue
+                if error is None:
+                    future.set_result(None)
+                else:
+                    future.set_exception(error)
+
+    async def flush(self) -> None:
+        """
+        Send the slot and game-state frames deferred while the actor was
+        applying a batch, one of each at most, reflecting the latest state.
+        """
+        if self._slots_pending:
+            self._slots_pending = False
+            await self._publish_slots()
+        if self._state_pending:
+            self._state_pending = False
+            await self._publish_game_state()
+
+    def close(self) -> None:
+        for client_id in list(self):
+            self.discard(client_id)
+        for task in self._held.values():
+            task.cancel()
+        self._held.clear()
+        for watcher in self.watchers:
+            watcher.close()
+        self.watchers.clear()
+
+    def hold(
+        self, client_id: str, grace: float, leave: Callable[[], Awaitable[None]]
+    ) -> None:
+        """
+        Keep a disconnected client's seat and manager role for grace seconds
+        in case it resumes, without telling the room. leave() runs if it
+        doesn't come back in time.
+        """
+        self.unhold(client_id)
+        self.remove(client_id)
+        self._held[client_id] = asyncio.ensure_future(
+            self._leave_after(client_id, grace, leave)
+        )
+
+    async def _leave_after(
+        self, client_id: str, grace: float, leave: Callable[[], Awaitable[None]]
+    ) -> None:
+        await asyncio.sleep(grace)
+        del self._held[client_id]
+        await leave()
+
+    def unhold(self, client_id: str) -> bool:
+        """Stop holding a client's seat so it can resume; False if not held."""
+        if (task := self._held.pop(client_id, None)) is None:
+            return False
+        task.cancel()
+        return True
+
+    def held_count(self) -> int:
+        return len(self._held)
+
+    def touch(self) -> None:
+        self.last_activity = time.monotonic()
+
+    def record(self, kind: str, **fields: Any) -> None:
+        """Add an accepted change to the game to the room's action log."""
+        if self.log is not None:
+            self.log.append(kind, fields)
+
+    async def _close_quietly(self, conn: WebSocket) -> None:
+        try:
+            await asyncio.wait_for(conn.close(), self.send_timeout)
+        except Exception:
+            pass
+
+    async def send(self, conn: WebSocket, message: Dict[str, Any]) -> None:
+        # info/error frames are never coalesced; deferred frames go out first
+        await self.flush()
+        frame = codec_of(conn).encode(message)
+        self.outbox(conn).send(frame, URGENT if "error" in message else INFO)
+        await asyncio.sleep(0)  # let the writer start; it is not waited on
+        FRAMES_SENT.inc(1, "direct")
+        BYTES_SENT.inc(len(frame), "direct")
 
     async def broadcast(self, message: Dict[str, Any]):
-        for conn in self.values():
-            await conn.send_json(message)
+        await self.flush()
+        # encoded once per codec in use, not once per client
+        encoded: Dict[Codec, Frame] = {}
+        frames = {}
+        for client_id, conn in self.items():
+            if (frame := encoded.get(codec := codec_of(conn))) is None:
+                frame = encoded[codec] = codec.encode(message)
+            frames[client_id] = frame
+        await self.fan_out(frames)
 
     def slot_availability(self) -> Dict[int, bool]:
-        return {
-            slot_id: player.client_id is None
-            for slot_id, player in self.game.players.items()
-        }
+        if self._available_slots is None:
+            self._available_slots = {
+                slot_id: player.client_id is None
+                for slot_id, player in self.game.players.items()
+            }
+        return self._available_slots
 
     def slots_by_client(self) -> Dict[str, int]:
-        return {
-            player.client_id: slot_id
-            for slot_id, player in self.game.players.items()
-            if player.client_id is not None
-        }
+        # maintained by _on_player_change; treat as read-only
+        return self._slot_by_client
+
+    def slot_of(self, client_id: str) -> Optional[int]:
+        return self._slot_by_client.get(client_id)
 
     def player_names(self) -> Dict[int, Optional[str]]:
-        return {
-            slot_id: (player.display_name if player.client_id is not None else None)
-            for slot_id, player in self.game.players.items()
-        }
+        if self._names is None:
+            self._names = {
+                slot_id: (player.display_name if player.client_id is not None else None)
+                for slot_id, player in self.game.players.items()
+            }
+        return self._names
 
     def common_payload(self):
         return {
@@ -47,32 +342,46 @@ class Room(dict):
         }
 
     async def broadcast_personalized(
-        self, common: Dict[str, Any], personal: Dict[str, Callable]
+        self,
+        common: Dict[str, Any],
+        personal: Dict[str, Callable],
+        kind: str = "broadcast",
     ):
+        encoded: Dict[Codec, Frame] = {}
+        frames = {}
         for client_id, conn in self.items():
-            message = deepcopy(common)
-            for key, lookup in personal.items():
-                message[key] = lookup(client_id)
-            await conn.send_json(message)
+            if (shared := encoded.get(codec := codec_of(conn))) is None:
+                shared = encoded[codec] = codec.encode(common)
+            extra = {key: lookup(client_id) for key, lookup in personal.items()}
+            frames[client_id] = codec.extend(shared, extra)
+        await self.fan_out(frames, kind)
 
     async def broadcast_slots(self):
+        if self._batching:
+            self._slots_pending = True
+            return
+        await self._publish_slots()
+
+    async def _publish_slots(self):
         personal = {
-            "my_slot": lambda x: self.slots_by_client().get(x),
+            "my_slot": self.slot_of,
         }
-        await self.broadcast_personalized(self.common_payload(), personal)
+        await self.broadcast_personalized(self.common_payload(), personal, "slots")
+        self._offer_watchers()
 
     async def claim_slot(self, slot_id: int, client_id: str) -> None:
         self.game.players[slot_id].set_client_id(client_id)
+        self.record("claim_slot", slot=slot_id, client_id=client_id)
         await self.broadcast_slots()
 
     async def release_slot(self, client_id: str) -> bool:
-        slots_by_client = self.slots_by_client()
-        if (client_slot := slots_by_client.get(client_id)) is None:
+        if (client_slot := self.slot_of(client_id)) is None:
             return False
 
         current_player_client_id = self.game.get_current_player()
 
         self.game.players[client_slot].set_client_id(None)
+        self.record("release_slot", slot=client_slot)
 
         if self.game.is_started and client_id == current_player_client_id:
             logger.info("current player released slot! Taking 'pass' action.")
@@ -81,6 +390,12 @@ class Room(dict):
                 {"action": "pass"},
                 force_turn_for_client=current_player_client_id,
             )
+            self.record(
+                "take_turn",
+                client_id=client_id,
+                turn={"action": "pass"},
+                force=client_id,
+            )
 
         await self.broadcast_slots()
         return True
@@ -88,48 +403,157 @@ class Room(dict):
     async def set_manager(self, client_id: str, conn: WebSocket) -> bool:
         if self.game.manager is None:
             self.game.manager = client_id
-            if (client_slot := self.slots_by_client().get(client_id)) is None:
+            self.game.state_changed()
+            self.record("set_manager", client_id=client_id)
+            if (client_slot := self.slot_of(client_id)) is None:
                 manager = "A spectator"
             else:
                 manager = f"Player {client_slot}"
             await self.broadcast({"info": f"{manager} is the manager now"})
-            await conn.send_json({"info": "You are the manager"})
+            await self.send(conn, {"info": "You are the manager"})
             return True
         return False
 
     async def release_manager(self):
         self.game.manager = None
+        self.game.state_changed()
+        self.record("set_manager", client_id=None)
         await self.broadcast({"info": "There is no manager"})
 
     async def send_game_state(self):
+        if self._batching:
+            self._state_pending = True
+            return
+        await self._publish_game_state()
+
+    async def send_game_state_to(self, client_id: str) -> None:
+        # only this client: the rest of the room has seen the current version
+        await self.flush()
+        await self._publish_game_state([client_id])
+
+    async def _publish_game_state(self, client_ids: Optional[List[str]] = None):
         game = self.game
-        game_state = {
-            "public_state": game.get_public_state(),
-            "is_over": game.is_game_over(),
-            "final_result": (game.get_final_result() if game.is_game_over() else None),
-        }
+        version = self._record_state(self.game.public_view())
+
+        # one encoded frame per codec and acked base version in use
+        shared_frames: Dict[Tuple[Codec, Optional[int]], Frame] = {}
+        patches: Dict[int, Patch] = {}
         current_player = game.get_current_player()
-        for pid, ws in self.items():
+        frames = {}
+        gone = []
+        for pid in self if client_ids is None else client_ids:
+            if (ws := self.get(pid)) is None:
+                continue
             if ws.application_state != WebSocketState.CONNECTED:
+                if ws.application_state == WebSocketState.DISCONNECTED:
+                    gone.append(pid)
                 continue
+            base = self._acked_versions.get(pid)
+            if base not in self._states:
+                base = None
+            codec = codec_of(ws)
+            if (shared := shared_frames.get((codec, base))) is None:
+                shared = self._state_frame(codec, version, base, patches)
+                shared_frames[(codec, base)] = shared
             player_state = {
                 "private_state": game.get_private_state(pid),
                 "your_turn": current_player == pid,
             }
-            game_state.update(player_state)
-            await ws.send_json(game_state)
+            frames[pid] = codec.extend(shared, player_state)
+        for pid in gone:
+            self.discard(pid)
+        await self.fan_out(frames, "state")
+        self._offer_watchers()
+
+    def _record_state(self, game_state: Dict[str, Any]) -> int:
+        # the view may hold the game's live lists and dicts, so the history
+        # keeps a copy: changes made to them in place would be missed otherwise
+        if not self._states or self._states[self.state_version] != game_state:
+            self.state_version += 1
+            self._states[self.state_version] = copy_view(game_state)
+            while len(self._states) > self.state_history:
+                self._states.popitem(last=False)
+            self._watch_frame = None
+        return self.state_version
+
+    def _state_frame(
+        self, codec: Codec, version: int, base: Optional[int], patches: Dict[int, Patch]
+    ) -> Frame:
+        full = self.game.memoized(
+            ("state_frame", codec, version),
+            lambda: codec.encode({"version": version, **self._states[version]}),
+        )
+        if base is None:
+            return full
+        if (patch := patches.get(base)) is None:
+            patch = patches[base] = diff(self._states[base], self._states[version])
+        delta = codec.encode({"version": version, "base_version": base, "patch": patch})
+        return delta if len(delta) < len(full) else full
+
+    def watch_frame(self) -> bytes:
+        """
+        The room as watchers see it, as a Server-Sent Event: the public game
+        state and the players' names, encoded once however many are watching.
+        """
+        if self._watch_frame is None:
+            if not self._states:
+                self._record_state(self.game.public_view())
+            version = self.state_version
+            data = encode(
+                {
+                    "version": version,
+                    **self._states[version],
+                    "names": self.player_names(),
+                }
+            )
+            self._watch_frame = (
+                f"id: {version}\nevent: state\ndata: {data}\n\n".encode()
+            )
+        return self._watch_frame
+
+    def watch(self) -> Watcher:
+        """A new read-only watcher of the room, starting at its current state."""
+        watcher = Watcher()
+        watcher.offer(self.watch_frame())
+        self.watchers.add(watcher)
+        return watcher
+
+    def unwatch(self, watcher: Watcher) -> None:
+        self.watchers.discard(watcher)
+
+    def _offer_watchers(self) -> None:
+        if not self.watchers:
+            return
+        frame = self.watch_frame()
+        if frame is self._watch_offered:
+            return
+        self._watch_offered = frame
+        for watcher in self.watchers:
+            watcher.offer(frame)
+
+    def ack_state(self, client_id: str, version: int) -> bool:
+        """
+        Record the latest state version a client has applied. Later game-state
+        frames to that client carry a patch against it instead of a snapshot,
+        as long as that version is still in the room's history.
+        """
+        if client_id not in self or version not in self._states:
+            return False
+        self._acked_versions[client_id] = version
+        return True
 
     async def start_game(self, client_id: str, conn: WebSocket) -> bool:
         game = self.game
         if game.manager != client_id:
-            await conn.send_json({"error": "Only the manager can start the game"})
+            await self.send(conn, {"error": "Only the manager can start the game"})
             return False
 
         if game.is_started:
-            await conn.send_json({"error": "Game already started"})
+            await self.send(conn, {"error": "Game already started"})
             return False
 
         game.start_game()
+        self.record("start_game")
         await self.broadcast({"info": "Game started"})
         await self.send_game_state()
         return True
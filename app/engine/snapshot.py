@@ -0,0 +1,167 @@
+import json
+import logging
+import mmap
+import os
+import struct
+import tempfile
+import time
+from typing import Any, Dict, Iterable, Iterator, List, Mapping, Optional, Tuple, Type
+
+from app.engine.room import Room
+from app.game.base import Game
+
+logger = logging.getLogger()
+
+MAGIC = b"RCSNAP1\n"
+_FILE_HEADER = struct.Struct(">d")  # wall-clock time the snapshot was written
+_RECORD_HEADER = struct.Struct(">HI")  # code length, payload length
+
+
+def snapshot_room(room: Room, game_types: Mapping[str, Type[Game]]) -> bytes:
+    names = {cls: name for name, cls in game_types.items()}
+    return json.dumps(
+        {
+            "game_type": names[type(room.game)],
+            "game": room.game.snapshot(),
+            "state_version": room.state_version,
+        },
+        separators=(",", ":"),
+    ).encode()
+
+
+def restore_room(
+    code: str, payload: bytes, game_types: Mapping[str, Type[Game]]
+) -> Room:
+    data = json.loads(payload)
+    room = Room(code, game_types[data["game_type"]].restore(data["game"]))
+    room.state_version = data["state_version"]
+    return room
+
+
+class SnapshotStore:
+    """
+    Rooms saved to one local file on shutdown and read back by code after a
+    restart. Opening the file only indexes it (a header read per room, the
+    rest stays on disk behind an mmap); a room is decoded when it is taken.
+    """
+
+    def __init__(self, path: str, max_age: float = 3600.0):
+        self.path = path
+        self.max_age = max_age
+        self.index_seconds: float = 0.0
+        self.write_seconds: float = 0.0
+        self._index: Dict[str, Tuple[int, int]] = {}
+        self._file: Optional[Any] = None
+        self._map: Optional[mmap.mmap] = None
+
+    def open(self) -> List[str]:
+        """Index the snapshot, if there is a recent one; returns its codes."""
+        started = time.perf_counter()
+        try:
+            self._file = open(self.path, "rb")
+            if os.fstat(self._file.fileno()).st_size:
+                self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+                self._index = dict(self._scan(self._map))
+        except FileNotFoundError:
+            pass
+        except ValueError as exc:
+            logger.warning("Ignoring snapshot %s: %s", self.path, exc)
+            self._index = {}
+        self.index_seconds = time.perf_counter() - started
+        if self._index:
+            logger.info(
+                "Indexed %s rooms from %s in %.1fms",
+                len(self._index),
+                self.path,
+                self.index_seconds * 1000,
+            )
+        return list(self._index)
+
+    def _scan(self, data: mmap.mmap) -> Iterator[Tuple[str, Tuple[int, int]]]:
+        if data[: len(MAGIC)] != MAGIC:
+            raise ValueError("not a room snapshot")
+        (written_at,) = _FILE_HEADER.unpack_from(data, len(MAGIC))
+        if time.time() - written_at > self.max_age:
+            raise ValueError("snapshot is too old")
+        offset = len(MAGIC) + _FILE_HEADER.size
+        while offset < len(data):
+            if offset + _RECORD_HEADER.size > len(data):
+                raise ValueError("truncated")
+            code_length, length = _RECORD_HEADER.unpack_from(data, offset)
+            offset += _RECORD_HEADER.size
+            start, offset = offset, offset + code_length
+            code = data[start:offset].decode()
+            if offset + length > len(data):
+                raise ValueError("truncated")
+            yield code, (offset, length)
+            offset += length
+
+    def __contains__(self, code: object) -> bool:
+        return code in self._index
+
+    def __len__(self) -> int:
+        return len(self._index)
+
+    def take(self, code: str) -> Optional[bytes]:
+        """A room's saved payload, handed out once."""
+        if self._map is None or (entry := self._index.pop(code, None)) is None:
+            return None
+        offset, length = entry
+        end = offset + length
+        return self._map[offset:end]
+
+    def drop_remaining(self) -> List[str]:
+        codes = list(self._index)
+        self._index.clear()
+        return codes
+
+    def remaining(self) -> Iterator[Tuple[str, bytes]]:
+        for code in list(self._index):
+            if (payload := self.take(code)) is not None:
+                yield code, payload
+
+    def write(self, records: Iterable[Tuple[str, bytes]]) -> int:
+        """
+        Replace the snapshot with records of (code, payload). Written to a
+        temporary file first, so a crash mid-write keeps the old snapshot.
+        """
+        started = time.perf_counter()
+        directory = os.path.dirname(self.path) or "."
+        os.makedirs(directory, mode=0o700, exist_ok=True)
+        # a temporary file of our own, so writers never share one
+        fd, temporary = tempfile.mkstemp(
+            prefix=f".{os.path.basename(self.path)}.", dir=directory
+        )
+        count = 0
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(MAGIC + _FILE_HEADER.pack(time.time()))
+                for code, payload in records:
+                    encoded = code.encode()
+                    f.write(_RECORD_HEADER.pack(len(encoded), len(payload)))
+                    f.write(encoded)
+                    f.write(payload)
+                    count += 1
+                f.flush()
+                os.fsync(f.fileno())
+            self.close()
+            os.replace(temporary, self.path)
+        except BaseException:
+            os.unlink(temporary)
+            raise
+        self.write_seconds = time.perf_counter() - started
+        logger.info(
+            "Wrote %s rooms to %s in %.1fms",
+            count,
+            self.path,
+            self.write_seconds * 1000,
+        )
+        return count
+
+    def close(self) -> None:
+        if self._map is not None:
+            self._map.close()
+            self._map = None
+        if self._file is not None:
+            self._file.close()
+            self._file = None
@@ -0,0 +1,67 @@
+from copy import deepcopy
+from typing import Any, Dict, List
+
+Patch = List[Dict[str, Any]]
+
+
+def _escape(key: Any) -> str:
+    # RFC 6901 JSON pointer escaping
+    return str(key).replace("~", "~0").replace("/", "~1")
+
+
+def _unescape(token: str) -> str:
+    return token.replace("~1", "/").replace("~0", "~")
+
+
+def copy_view(value: Any) -> Any:
+    """
+    A copy of a JSON-like value sharing no dicts or lists with it; much
+    cheaper than deepcopy. Other values are immutable or kept as they are.
+    """
+    if type(value) is dict:
+        return {key: copy_view(item) for key, item in value.items()}
+    if type(value) is list:
+        return [copy_view(item) for item in value]
+    if type(value) is tuple:
+        return tuple(copy_view(item) for item in value)
+    return value
+
+
+def diff(old: Any, new: Any, path: str = "") -> Patch:
+    """
+    JSON-patch-style (RFC 6902) operations turning old into new. Objects are
+    diffed key by key; anything else, lists included, is replaced whole.
+    """
+    if isinstance(old, dict) and isinstance(new, dict):
+        ops: Patch = []
+        for key in old:
+            if key not in new:
+                ops.append({"op": "remove", "path": f"{path}/{_escape(key)}"})
+        for key, value in new.items():
+            child = f"{path}/{_escape(key)}"
+            if key not in old:
+                ops.append({"op": "add", "path": child, "value": value})
+            else:
+                ops.extend(diff(old[key], value, child))
+        return ops
+    if type(old) is type(new) and old == new:
+        return []
+    return [{"op": "replace", "path": path, "value": new}]
+
+
+def apply_patch(doc: Any, patch: Patch) -> Any:
+    """Apply operations produced by diff to a JSON-decoded document."""
+    doc = deepcopy(doc)
+    for op in patch:
+        if op["path"] == "":
+            doc = deepcopy(op["value"])
+            continue
+        *parents, last = [_unescape(t) for t in op["path"].split("/")[1:]]
+        target = doc
+        for token in parents:
+            target = target[token]
+        if op["op"] == "remove":
+            del target[last]
+        else:
+            target[last] = deepcopy(op["value"])
+    return doc
@@ -0,0 +1,55 @@
+import asyncio
+from typing import AsyncIterator, Optional
+
+# sent when nothing else has been for a while, so proxies keep the stream open
+KEEPALIVE = b": keepalive\n\n"
+
+
+class Watcher:
+    """
+    A read-only spectator of a room. It only ever holds the latest frame the
+    room offered it: frames offered faster than the watcher takes them
+    replace each other.
+    """
+
+    def __init__(self) -> None:
+        self.frame: Optional[bytes] = None
+        self.closed: bool = False
+        self._ready = asyncio.Event()
+
+    def offer(self, frame: bytes) -> None:
+        self.frame = frame
+        self._ready.set()
+
+    def close(self) -> None:
+        self.closed = True
+        self._ready.set()
+
+    async def next(self) -> Optional[bytes]:
+        """The newest frame not yet taken; None once the room has closed."""
+        if self.closed:
+            return None
+        await self._ready.wait()
+        self._ready.clear()
+        return None if self.closed else self.frame
+
+
+async def stream(
+    watcher: Watcher, min_interval: float = 0.0, keepalive: float = 15.0
+) -> AsyncIterator[bytes]:
+    """
+    Server-Sent Events for a watcher: at most one frame per min_interval
+    seconds, the newest one, and a keepalive comment after keepalive quiet
+    seconds.
+    """
+    while True:
+        try:
+            frame = await asyncio.wait_for(watcher.next(), keepalive)
+        except asyncio.TimeoutError:
+            yield KEEPALIVE
+            continue
+        if frame is None:
+            return
+        yield frame
+        if min_interval > 0:
+            await asyncio.sleep(min_interval)
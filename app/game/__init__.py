@@ -0,0 +1,9 @@
+from typing import Dict, Type
+
+from app.game.base import Game
+from app.game.pass_pebble import PassThePebbleGame
+
+# game_type names accepted by /create-game/ and stored in room snapshots
+GAME_TYPES: Dict[str, Type[Game]] = {
+    "pass_the_pebble": PassThePebbleGame,
+}
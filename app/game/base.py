@@ -1,13 +1,59 @@
+import functools
 from abc import ABC, abstractmethod
 from dataclasses import dataclass, field
-from typing import Dict, Optional
+from typing import Any, Callable, Dict, Hashable, Optional, Tuple, Type, TypeVar
+
+# called with (player, previous client_id) whenever a player's seat or name changes
+PlayerListener = Callable[["Player", Optional[str]], None]
+
+G = TypeVar("G", bound="Game")
+T = TypeVar("T")
+
+# kept out of snapshots: they describe this process's copy of the game
+_UNSAVED = ("players", "manager", "state_version", "_memo")
+
+
+def _changes_state(method: Callable[..., T]) -> Callable[..., T]:
+    @functools.wraps(method)
+    def wrapper(self: "Game", *args: Any, **kwargs: Any) -> T:
+        try:
+            return method(self, *args, **kwargs)
+        finally:
+            # even a rejected action may have changed something on the way
+            self.state_changed()
+
+    return wrapper
 
 
 class Player:
     def __init__(self, slot_index: int):
         self.slot_index: int = slot_index
-        self.display_name: str = f"Player {slot_index}"
-        self.client_id: Optional[str] = None
+        self._listener: Optional[PlayerListener] = None
+        self._display_name: str = f"Player {slot_index}"
+        self._client_id: Optional[str] = None
+
+    @property
+    def display_name(self) -> str:
+        return self._display_name
+
+    @display_name.setter
+    def display_name(self, display_name: str):
+        self._display_name = display_name
+        if self._listener is not None:
+            self._listener(self, self._client_id)
+
+    @property
+    def client_id(self) -> Optional[str]:
+        return self._client_id
+
+    @client_id.setter
+    def client_id(self, client_id: Optional[str]):
+        previous, self._client_id = self._client_id, client_id
+        if self._listener is not None:
+            self._listener(self, previous)
+
+    def set_listener(self, listener: Optional[PlayerListener]):
+        self._listener = listener
 
     def set_display_name(self, display_name: str):
         self.display_name = display_name
@@ -22,6 +68,14 @@ class Game(ABC):
     manager: Optional[str] = field(default_factory=str)
     is_started: bool = field(default_factory=bool)
     current_index: int = field(default_factory=int)
+    # bumped by every submit_action() and start_game(); see memoized()
+    state_version: int = field(default=0, compare=False, repr=False)
+
+    def __init_subclass__(cls, **kwargs: Any) -> None:
+        super().__init_subclass__(**kwargs)
+        for name in ("submit_action", "start_game"):
+            if name in vars(cls):
+                setattr(cls, name, _changes_state(vars(cls)[name]))
 
     @abstractmethod
     def get_public_state(self) -> dict:
@@ -52,3 +106,63 @@ class Game(ABC):
     @abstractmethod
     def start_game(self) -> dict:
         pass  # pragma: no cover
+
+    def state_changed(self) -> None:
+        """
+        Note that the game's state changed. submit_action() and start_game()
+        do this by themselves; call it after changing the state any other way.
+        """
+        self.state_version += 1
+
+    def memoized(self, key: Hashable, build: Callable[[], T]) -> T:
+        """build(), computed once per state_version for each key."""
+        memo: Dict[Hashable, Any]
+        version, memo = getattr(self, "_memo", (None, {}))
+        if version != self.state_version:
+            memo = {}
+            self._memo: Tuple[int, Dict[Hashable, Any]] = (self.state_version, memo)
+        if key not in memo:
+            memo[key] = build()
+        return memo[key]
+
+    def public_view(self) -> Dict[str, Any]:
+        """
+        What everyone may see of the game: its public state, whether it is
+        over and the final result if so. Treat it as read-only; it is shared
+        until the state changes.
+        """
+        return self.memoized("public_view", self._public_view)
+
+    def _public_view(self) -> Dict[str, Any]:
+        is_over = self.is_game_over()
+        return {
+            "public_state": self.get_public_state(),
+            "is_over": is_over,
+            "final_result": self.get_final_result() if is_over else None,
+        }
+
+    def snapshot(self) -> Dict[str, Any]:
+        """
+        The game as plain JSON data, for restoring it after a restart. Seats
+        keep only their names: clients get new ids when they reconnect and
+        claim their seats again, and the manager is reset. Games holding
+        anything but plain data in their attributes override this and
+        restore().
+        """
+        return {
+            "names": [self.players[slot].display_name for slot in sorted(self.players)],
+            "state": {
+                key: value for key, value in vars(self).items() if key not in _UNSAVED
+            },
+        }
+
+    @classmethod
+    def restore(cls: Type[G], data: Dict[str, Any]) -> G:
+        game = cls.__new__(cls)
+        vars(game).update(data["state"])
+        game.players = {}
+        for slot, name in enumerate(data["names"]):
+            game.players[slot] = Player(slot)
+            game.players[slot].set_display_name(name)
+        game.manager = None
+        return game
@@ -62,7 +62,11 @@ class PassThePebbleGame(Game):
                 for _ in range(len(self.players)):
                     self.current_index = (self.current_index + 1) % len(self.players)
                     if self.players[self.current_index].client_id:
-                        logger.info("Next player: %s", self.current_index)
+                        logger.info(
+                            "Next player: %s",
+                            self.current_index,
+                            extra={"sample": "turn"},
+                        )
                         break
                 else:
                     raise ValueError("No players!")
@@ -157,3 +157,55 @@ def test_pass_pebble__submit_action__force__no_players_remain():
     with pytest.raises(ValueError) as exc:
         game.submit_action("foo", {"action": "pass"}, force_turn_for_client="foo")
     assert "No players!" in str(exc)
+
+
+def test_pass_pebble__snapshot__restore():
+    game = PassThePebbleGame(2)
+    game.players[0].set_display_name("Alice")
+    game.players[0].set_client_id("A")
+    game.manager = "A"
+    game.is_started = True
+    game.pass_count = 3
+    game.current_index = 1
+
+    restored = PassThePebbleGame.restore(game.snapshot())
+
+    assert restored.get_public_state() == game.get_public_state()
+    assert restored.max_passes == 5 and restored.winner is None
+    assert restored.players[0].display_name == "Alice"
+    assert restored.players[0].client_id is None
+    assert restored.manager is None
+
+
+def test_pass_pebble__public_view__memoized_per_state_version():
+    game = PassThePebbleGame(2)
+    game.players[0].client_id = "foo"
+    game.players[1].client_id = "bar"
+    game.start_game()
+    view = game.public_view()
+    assert view is game.public_view()
+    assert view["public_state"]["pass_count"] == 0
+    assert view["is_over"] is False and view["final_result"] is None
+
+    version = game.state_version
+    game.submit_action("foo", {"action": "pass"})
+    assert game.state_version == version + 1
+    assert game.public_view()["public_state"]["pass_count"] == 1
+
+    # a rejected action still counts as a possible change
+    with pytest.raises(ValueError):
+        game.submit_action("foo", {"action": "pass"})
+    assert game.state_version == version + 2
+
+
+def test_pass_pebble__snapshot__leaves_out_memo():
+    game = PassThePebbleGame(1)
+    game.players[0].client_id = "foo"
+    game.start_game()
+    game.public_view()
+
+    state = game.snapshot()["state"]
+    assert "_memo" not in state and "state_version" not in state
+    assert PassThePebbleGame.restore(game.snapshot()).public_view() == (
+        game.public_view()
+    )
@@ -0,0 +1,181 @@
+"""
+Cards as small ints: rank * 4 + suit, with ranks 0-12 for 2 through ace and
+suits in SUITS order. Ordered groups of cards (a hand, the board) are Cards,
+one byte per card; unordered sets are 52-bit masks. Neither turns into the
+"Ah"-style strings clients see until a frame is encoded.
+"""
+
+import queue
+import secrets
+import threading
+from array import array
+from random import Random
+from typing import Iterable, Iterator, List, Optional, Sequence, Union, overload
+
+RANKS = "23456789TJQKA"
+SUITS = "cdhs"
+DECK_SIZE = 52
+
+_system_random = secrets.SystemRandom()
+
+
+def card(text: str) -> int:
+    """'Ah' -> 50"""
+    return RANKS.index(text[0].upper()) * 4 + SUITS.index(text[1].lower())
+
+
+def parse_cards(text: str) -> List[int]:
+    """'Ah Kd 7c' -> [50, 45, 20]"""
+    return [card(part) for part in text.split()]
+
+
+def card_text(value: int) -> str:
+    return RANKS[value >> 2] + SUITS[value & 3]
+
+
+def mask_of(cards: Iterable[int]) -> int:
+    mask = 0
+    for value in cards:
+        mask |= 1 << value
+    return mask
+
+
+def cards_in(mask: int) -> List[int]:
+    cards = []
+    while mask:
+        low = mask & -mask
+        cards.append(low.bit_length() - 1)
+        mask ^= low
+    return cards
+
+
+class Cards(Sequence[int]):
+    """
+    An immutable, ordered run of cards. Safe to put in game state: equal
+    Cards compare equal for state diffs, and frames encode them as a list of
+    card names via __json__.
+    """
+
+    __slots__ = ("_cards",)
+
+    def __init__(self, cards: Iterable[int] = ()):
+        self._cards = array("B", cards)
+
+    @classmethod
+    def parse(cls, text: str) -> "Cards":
+        return cls(parse_cards(text))
+
+    def __len__(self) -> int:
+        return len(self._cards)
+
+    def __iter__(self) -> Iterator[int]:
+        return iter(self._cards)
+
+    @overload
+    def __getitem__(self, index: int) -> int: ...
+
+    @overload
+    def __getitem__(self, index: slice) -> "Cards": ...
+
+    def __getitem__(self, index: Union[int, slice]) -> Union[int, "Cards"]:
+        if isinstance(index, slice):
+            return Cards(self._cards[index])
+        return self._cards[index]
+
+    def __add__(self, other: Iterable[int]) -> "Cards":
+        return Cards(self._cards + array("B", other))
+
+    def __eq__(self, other: object) -> bool:
+        return isinstance(other, Cards) and self._cards == other._cards
+
+    def __hash__(self) -> int:
+        return hash(self._cards.tobytes())
+
+    def __repr__(self) -> str:
+        return f"Cards.parse({' '.join(map(card_text, self._cards))!r})"
+
+    @property
+    def mask(self) -> int:
+        return mask_of(self._cards)
+
+    def __json__(self) -> List[str]:
+        return [card_text(value) for value in self._cards]
+
+
+def shuffled_deck(rng: Optional[Random] = None) -> array:
+    deck = array("B", range(DECK_SIZE))
+    (rng or _system_random).shuffle(deck)
+    return deck
+
+
+class Deck:
+    """A shuffled deck dealt from the top."""
+
+    __slots__ = ("_cards", "_next")
+
+    def __init__(self, cards: Optional[array] = None):
+        self._cards = shuffled_deck() if cards is None else cards
+        self._next = 0
+
+    def __len__(self) -> int:
+        return len(self._cards) - self._next
+
+    def deal(self, count: int = 1) -> Cards:
+        if count > len(self):
+            raise ValueError("Not enough cards left in the deck")
+        start, end = self._next, self._next + count
+        self._next = end
+        return Cards(self._cards[start:end])
+
+    def burn(self) -> None:
+        self.deal(1)
+
+
+class DeckPool:
+    """
+    Decks shuffled ahead of time with the OS's secure RNG. A background
+    thread keeps up to size of them ready, so take() on the event loop is a
+    queue pop; if the pool runs dry it shuffles one inline and counts a miss.
+    """
+
+    def __init__(self, size: int = 64, rng: Optional[Random] = None):
+        self.rng = rng or _system_random
+        self.misses = 0
+        self._decks: "queue.Queue[array]" = queue.Queue(size)
+        self._stopping = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self) -> None:
+        if self._thread is None or not self._thread.is_alive():
+            self._stopping.clear()
+            self._thread = threading.Thread(
+                target=self._fill, name="deck-pool", daemon=True
+            )
+            self._thread.start()
+
+    def stop(self) -> None:
+        self._stopping.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def _fill(self) -> None:
+        deck = None
+        while not self._stopping.is_set():
+            if deck is None:
+                deck = shuffled_deck(self.rng)
+            try:
+                self._decks.put(deck, timeout=0.1)
+            except queue.Full:
+                continue
+            deck = None
+
+    def take(self) -> Deck:
+        try:
+            return Deck(self._decks.get_nowait())
+        except queue.Empty:
+            self.misses += 1
+            return Deck(shuffled_deck(self.rng))
+
+    def ready(self) -> int:
+        return self._decks.qsize()
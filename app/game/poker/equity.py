@@ -0,0 +1,271 @@
+"""
+Monte Carlo pot equity, for showing odds at the table and reviewing hands.
+
+Remaining board cards (and the hole cards of players whose cards are
+unknown) are sampled in NumPy batches and ranked with a vectorized version
+of the evaluator's lookup tables. Sampling stops as soon as every player's
+equity is known to within the requested margin. EquityEngine spreads the
+batches over a process pool so the event loop never runs them.
+
+Needs numpy, which is an optional dependency.
+"""
+
+import asyncio
+import os
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field
+from multiprocessing import get_context
+from statistics import NormalDist
+from typing import List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from app.game.poker import evaluator
+
+Hole = Optional[Sequence[int]]  # None for a player whose cards are unknown
+
+_SEVEN = 7 * evaluator._SIZE_UNIT
+_card_keys: Optional[np.ndarray] = None
+_rank7: Optional[np.ndarray] = None
+_flush: Optional[np.ndarray] = None
+
+
+def _tables() -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    global _card_keys, _rank7, _flush
+    if _card_keys is None or _rank7 is None or _flush is None:
+        evaluator.build_tables()
+        sevens = [
+            (key - _SEVEN, strength)
+            for key, strength in evaluator._rank_table.items()
+            if key >= _SEVEN
+        ]
+        keys, strengths = zip(*sevens)
+        # dense over the 7-card keys: ~16MB, but a single gather per batch
+        _rank7 = np.zeros(max(keys) + 1, dtype=np.int16)
+        _rank7[np.array(keys)] = strengths
+        _flush = np.array(evaluator._flush_table, dtype=np.int16)
+        _card_keys = np.array(evaluator.CARD_KEYS, dtype=np.int64)
+    return _card_keys, _rank7, _flush
+
+
+def evaluate_array(cards: np.ndarray) -> np.ndarray:
+    """Strengths, as evaluator.evaluate gives them, of an (n, 7) card array."""
+    card_keys, rank7, flush = _tables()
+    keys = card_keys[cards].sum(axis=1)
+    strengths = rank7[(keys >> evaluator._SUIT_BITS) - _SEVEN]
+    flush_bits = (keys + evaluator._FLUSH_CHECK) & evaluator._FLUSH_BITS
+    if (rows := np.flatnonzero(flush_bits)).size:
+        # with 7 cards at most one suit can have five, so one bit is set
+        bits = flush_bits[rows]
+        suit = (bits >> 7 & 1) + 2 * (bits >> 11 & 1) + 3 * (bits >> 15 & 1)
+        hands = cards[rows]
+        masks = np.where(hands & 3 == suit[:, None], 1 << (hands >> 2), 0)
+        strengths[rows] = flush[masks.sum(axis=1)]
+    return strengths
+
+
+@dataclass
+class EquityResult:
+    equity: List[float]  # expected share of the pot
+    win: List[float]  # chance of winning outright
+    tie: List[float]  # chance of splitting the pot
+    samples: int
+    margin: float  # confidence interval half-width of the least certain equity
+    exact: bool = False
+
+
+@dataclass
+class _Tally:
+    players: int
+    samples: int = 0
+    share: List[float] = field(default_factory=list)
+    share_squared: List[float] = field(default_factory=list)
+    wins: List[int] = field(default_factory=list)
+    ties: List[int] = field(default_factory=list)
+    exact: bool = False
+
+    def __post_init__(self) -> None:
+        for values in (self.share, self.share_squared, self.wins, self.ties):
+            values.extend([0] * (self.players - len(values)))
+
+    def add(self, other: "_Tally") -> None:
+        self.samples += other.samples
+        self.exact = other.exact
+        for i in range(self.players):
+            self.share[i] += other.share[i]
+            self.share_squared[i] += other.share_squared[i]
+            self.wins[i] += other.wins[i]
+            self.ties[i] += other.ties[i]
+
+    def margin(self, z: float) -> float:
+        if self.exact:
+            return 0.0
+        if self.samples < 2:
+            return 1.0
+        worst = 0.0
+        for total, squared in zip(self.share, self.share_squared):
+            mean = total / self.samples
+            variance = max(squared / self.samples - mean * mean, 0.0)
+            worst = max(worst, variance / self.samples)
+        return z * worst**0.5
+
+    def result(self, z: float) -> EquityResult:
+        n = self.samples or 1
+        return EquityResult(
+            equity=[total / n for total in self.share],
+            win=[wins / n for wins in self.wins],
+            tie=[ties / n for ties in self.ties],
+            samples=self.samples,
+            margin=self.margin(z),
+            exact=self.exact,
+        )
+
+
+def _check(holes: Sequence[Hole], board: Sequence[int], dead: Sequence[int]) -> None:
+    if len(holes) < 2:
+        raise ValueError("Need at least two players")
+    if len(board) > 5 or any(hole is not None and len(hole) != 2 for hole in holes):
+        raise ValueError("Need up to 5 board cards and 2 hole cards per player")
+    known = [*board, *dead, *(c for hole in holes if hole is not None for c in hole)]
+    if len(set(known)) != len(known) or not all(0 <= c < 52 for c in known):
+        raise ValueError("Cards must be distinct, from 0 to 51")
+    unknown = sum(hole is None for hole in holes)
+    if 52 - len(known) < 5 - len(board) + 2 * unknown:
+        raise ValueError("Not enough cards left to deal")
+
+
+def _simulate(
+    holes: Sequence[Hole],
+    board: Sequence[int],
+    dead: Sequence[int],
+    trials: int,
+    seed: "np.random.SeedSequence",
+) -> _Tally:
+    known = {*board, *dead, *(c for hole in holes if hole is not None for c in hole)}
+    deck = np.array([c for c in range(52) if c not in known], dtype=np.int64)
+    missing = 5 - len(board)
+    draw = missing + 2 * sum(hole is None for hole in holes)
+    if draw == 0:
+        trials = 1
+    picks = np.empty((trials, 0), dtype=np.int64)
+    if draw:
+        rng = np.random.default_rng(seed)
+        order = np.argpartition(rng.random((trials, deck.size)), draw - 1, axis=1)
+        picks = deck[order[:, :draw]]
+
+    fixed = np.broadcast_to(np.array(board, dtype=np.int64), (trials, len(board)))
+    boards = np.concatenate([fixed, picks[:, :missing]], axis=1)
+    next_pick = missing
+    strengths = np.empty((trials, len(holes)), dtype=np.int16)
+    for player, hole in enumerate(holes):
+        if hole is None:
+            start, next_pick = next_pick, next_pick + 2
+            cards = picks[:, start:next_pick]
+        else:
+            cards = np.broadcast_to(np.array(hole, dtype=np.int64), (trials, 2))
+        strengths[:, player] = evaluate_array(np.concatenate([boards, cards], axis=1))
+
+    best = strengths == strengths.max(axis=1, keepdims=True)
+    winners = best.sum(axis=1)
+    share = best / winners[:, None]
+    return _Tally(
+        players=len(holes),
+        samples=trials,
+        share=share.sum(axis=0).tolist(),
+        share_squared=(share * share).sum(axis=0).tolist(),
+        wins=(best & (winners == 1)[:, None]).sum(axis=0).tolist(),
+        ties=(best & (winners > 1)[:, None]).sum(axis=0).tolist(),
+        exact=draw == 0,
+    )
+
+
+def _z(confidence: float) -> float:
+    return NormalDist().inv_cdf((1 + confidence) / 2)
+
+
+def calculate_equity(
+    holes: Sequence[Hole],
+    board: Sequence[int] = (),
+    dead: Sequence[int] = (),
+    margin: float = 0.005,
+    confidence: float = 0.95,
+    max_samples: int = 500_000,
+    batch: int = 20_000,
+    seed: Optional[int] = None,
+) -> EquityResult:
+    """
+    Each player's equity, sampled in this process until every equity is
+    within margin of the true value at the given confidence, or until
+    max_samples boards have been dealt.
+    """
+    _check(holes, board, dead)
+    z = _z(confidence)
+    seeds = np.random.SeedSequence(seed)
+    tally = _Tally(players=len(holes))
+    while True:
+        tally.add(_simulate(holes, board, dead, batch, seeds.spawn(1)[0]))
+        if tally.margin(z) <= margin or tally.samples >= max_samples:
+            return tally.result(z)
+
+
+class EquityEngine:
+    """
+    Runs equity calculations on a process pool: each round deals one batch
+    per worker in parallel, then stops once the margin is reached. Create
+    one per server and close() it on shutdown.
+    """
+
+    def __init__(self, workers: Optional[int] = None, batch: int = 20_000):
+        self.workers = workers or os.cpu_count() or 1
+        self.batch = batch
+        self._pool: Optional[ProcessPoolExecutor] = None
+
+    def _executor(self) -> ProcessPoolExecutor:
+        if self._pool is None:
+            # spawned, not forked: the server process has other threads running
+            self._pool = ProcessPoolExecutor(
+                self.workers, mp_context=get_context("spawn")
+            )
+        return self._pool
+
+    async def equity(
+        self,
+        holes: Sequence[Hole],
+        board: Sequence[int] = (),
+        dead: Sequence[int] = (),
+        margin: float = 0.005,
+        confidence: float = 0.95,
+        max_samples: int = 500_000,
+        seed: Optional[int] = None,
+    ) -> EquityResult:
+        _check(holes, board, dead)
+        loop = asyncio.get_running_loop()
+        pool = self._executor()
+        z = _z(confidence)
+        seeds = np.random.SeedSequence(seed)
+        holes = [None if hole is None else tuple(hole) for hole in holes]
+        tally = _Tally(players=len(holes))
+        while True:
+            parts = await asyncio.gather(
+                *(
+                    loop.run_in_executor(
+                        pool,
+                        _simulate,
+                        holes,
+                        tuple(board),
+                        tuple(dead),
+                        self.batch,
+                        child,
+                    )
+                    for child in seeds.spawn(self.workers)
+                )
+            )
+            for part in parts:
+                tally.add(part)
+            if tally.margin(z) <= margin or tally.samples >= max_samples:
+                return tally.result(z)
+
+    def close(self) -> None:
+        if self._pool is not None:
+            self._pool.shutdown()
+            self._pool = None
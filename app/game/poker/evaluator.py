@@ -0,0 +1,220 @@
+"""
+Poker hand ranking by table lookup.
+
+Cards are the small ints of app.game.poker.cards, rank * 4 + suit. Each
+card has a precomputed key holding its rank weight in the high bits and a
+count for its suit in one of four nibbles in the low 16 bits, so a hand's
+key is just the sum of its cards' keys:
+
+- the suit nibbles say whether five or more cards share a suit, found by
+  adding 3 to every nibble and checking their top bits;
+- otherwise the rank weights sum to a number unique to the hand's ranks,
+  looked up in a table of every 5-, 6- and 7-card rank combination.
+
+Flushes are looked up by the 13-bit mask of the flush suit's ranks instead.
+The tables take about a second to build. That happens on first use unless
+build_tables() is called earlier, e.g. at startup. Hand strengths run from
+1 (7-5-4-3-2 offsuit) to 7462 (royal flush); higher is better.
+"""
+
+from bisect import bisect_right
+from typing import Dict, Hashable, Iterable, List, Mapping, Sequence, Tuple, TypeVar
+
+from app.game.poker.cards import DECK_SIZE
+
+CATEGORIES = (
+    "high_card",
+    "pair",
+    "two_pair",
+    "three_of_a_kind",
+    "straight",
+    "flush",
+    "full_house",
+    "four_of_a_kind",
+    "straight_flush",
+)
+
+# Greedily chosen so that their sums differ for every multiset of 5, 6 or 7
+# ranks with at most four of each; build_tables() checks this.
+RANK_WEIGHTS = (
+    0,
+    1,
+    5,
+    22,
+    98,
+    453,
+    2031,
+    8698,
+    22854,
+    83661,
+    262349,
+    636345,
+    1479181,
+)
+# added once per card, so hands of different sizes never share a key
+_SIZE_UNIT = 1 << 23
+_SUIT_BITS = 16
+_FLUSH_CHECK = 0x3333  # a nibble of 5 or more then reaches 8
+_FLUSH_BITS = 0x8888
+
+CARD_KEYS: Tuple[int, ...] = tuple(
+    ((RANK_WEIGHTS[card >> 2] + _SIZE_UNIT) << _SUIT_BITS) | (1 << ((card & 3) << 2))
+    for card in range(DECK_SIZE)
+)
+
+Score = Tuple[int, ...]  # category, then the ranks that break ties
+K = TypeVar("K", bound=Hashable)
+
+_rank_table: Dict[int, int] = {}
+_flush_table: List[int] = []
+_category_starts: List[int] = []
+
+
+def _ranks_high_to_low(mask: int) -> List[int]:
+    return [rank for rank in range(12, -1, -1) if mask >> rank & 1]
+
+
+def _straight_high(mask: int) -> int:
+    for high in range(12, 3, -1):
+        run = 0b11111 << (high - 4)
+        if mask & run == run:
+            return high
+    wheel = 0b1000000001111  # A-2-3-4-5
+    return 3 if mask & wheel == wheel else -1
+
+
+def _flush_score(mask: int) -> Score:
+    if (high := _straight_high(mask)) >= 0:
+        return (8, high)
+    return (5, *_ranks_high_to_low(mask)[:5])
+
+
+def _rank_score(counts: Sequence[int]) -> Score:
+    # best five-card hand, ignoring flushes, from the number of cards per rank
+    by_count: List[List[int]] = [[], [], [], [], []]
+    mask = 0
+    for rank in range(12, -1, -1):
+        if counts[rank]:
+            by_count[counts[rank]].append(rank)
+            mask |= 1 << rank
+    quads, trips, pairs = by_count[4], by_count[3], by_count[2]
+
+    def kickers(n: int, *used: int) -> List[int]:
+        return [rank for rank in _ranks_high_to_low(mask) if rank not in used][:n]
+
+    if quads:
+        return (7, quads[0], *kickers(1, quads[0]))
+    if trips and (len(trips) > 1 or pairs):
+        return (6, trips[0], max(trips[1:] + pairs))
+    if (high := _straight_high(mask)) >= 0:
+        return (4, high)
+    if trips:
+        return (3, trips[0], *kickers(2, trips[0]))
+    if len(pairs) > 1:
+        return (2, pairs[0], pairs[1], *kickers(1, pairs[0], pairs[1]))
+    if pairs:
+        return (1, pairs[0], *kickers(3, pairs[0]))
+    return (0, *kickers(5))
+
+
+def _rank_multisets(size: int, rank: int = 12) -> Iterable[List[int]]:
+    # every way to pick size cards' ranks from ranks 0..rank, at most 4 each
+    if rank == 0:
+        if size <= 4:
+            yield [size] + [0] * 12
+        return
+    for count in range(min(4, size), -1, -1):
+        for counts in _rank_multisets(size - count, rank - 1):
+            counts[rank] = count
+            yield counts
+
+
+def build_tables() -> None:
+    scores = {_rank_score(counts) for counts in _rank_multisets(5)}
+    popcounts = [bin(mask).count("1") for mask in range(1 << 13)]
+    flush_masks = [mask for mask in range(1 << 13) if popcounts[mask] >= 5]
+    scores.update(_flush_score(mask) for mask in flush_masks if popcounts[mask] == 5)
+    strength = {score: index for index, score in enumerate(sorted(scores), 1)}
+
+    rank_table: Dict[int, int] = {}
+    for size in (5, 6, 7):
+        for counts in _rank_multisets(size):
+            key = sum(
+                count * (weight + _SIZE_UNIT)
+                for count, weight in zip(counts, RANK_WEIGHTS)
+            )
+            if key in rank_table:
+                raise RuntimeError("RANK_WEIGHTS do not give unique hand keys")
+            rank_table[key] = strength[_rank_score(counts)]
+
+    flush_table = [0] * (1 << 13)
+    for mask in flush_masks:
+        flush_table[mask] = strength[_flush_score(mask)]
+
+    starts: List[int] = []
+    for score in sorted(scores):
+        if len(starts) <= score[0]:
+            starts.append(strength[score])
+
+    _rank_table.update(rank_table)
+    _flush_table[:] = flush_table
+    _category_starts[:] = starts
+
+
+def _strength(key: int, cards: Sequence[int]) -> int:
+    if flush := (key + _FLUSH_CHECK) & _FLUSH_BITS:
+        suit = (flush.bit_length() >> 2) - 1
+        mask = 0
+        for value in cards:
+            if value & 3 == suit:
+                mask |= 1 << (value >> 2)
+        return _flush_table[mask]
+    return _rank_table[key >> _SUIT_BITS]
+
+
+def evaluate(cards: Sequence[int]) -> int:
+    """Strength of the best five-card hand among 5 to 7 distinct cards."""
+    if not _flush_table:
+        build_tables()
+    if not 5 <= len(cards) <= 7:
+        raise ValueError("Need 5 to 7 cards")
+    key = 0
+    for value in cards:
+        key += CARD_KEYS[value]
+    return _strength(key, cards)
+
+
+def evaluate_many(hands: Iterable[Sequence[int]]) -> List[int]:
+    return [evaluate(hand) for hand in hands]
+
+
+def showdown(
+    board: Sequence[int], holes: Mapping[K, Sequence[int]]
+) -> Tuple[Dict[K, int], List[K]]:
+    """
+    Rank every player's hole cards with the shared board in one pass; the
+    board's key is summed once. Returns each player's strength and the
+    winners (more than one on a split pot).
+    """
+    if not _flush_table:
+        build_tables()
+    if not 5 <= len(board) + 2 <= 7:
+        raise ValueError("Need a board of 3 to 5 cards")
+    board_key = 0
+    for value in board:
+        board_key += CARD_KEYS[value]
+    strengths = {}
+    for player, (first, second) in holes.items():
+        key = board_key + CARD_KEYS[first] + CARD_KEYS[second]
+        if (key + _FLUSH_CHECK) & _FLUSH_BITS:
+            strengths[player] = _strength(key, (*board, first, second))
+        else:
+            strengths[player] = _rank_table[key >> _SUIT_BITS]
+    best = max(strengths.values(), default=0)
+    return strengths, [player for player, value in strengths.items() if value == best]
+
+
+def category(strength: int) -> str:
+    if not _flush_table:
+        build_tables()
+    return CATEGORIES[bisect_right(_category_starts, strength) - 1]
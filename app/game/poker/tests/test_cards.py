@@ -0,0 +1,101 @@
+import json
+import random
+import time
+
+import pytest
+
+from app.engine.frames import CODECS, orjson_dumps, stdlib_dumps
+from app.game.poker.cards import (
+    Cards,
+    Deck,
+    DeckPool,
+    card,
+    card_text,
+    cards_in,
+    mask_of,
+    shuffled_deck,
+)
+from app.game.poker.evaluator import evaluate, showdown
+
+
+def test_card__round_trip():
+    assert card("2c") == 0
+    assert card("As") == 51
+    assert [card_text(value) for value in range(52)] == [
+        rank + suit for rank in "23456789TJQKA" for suit in "cdhs"
+    ]
+
+
+def test_mask__round_trip():
+    hand = [51, 0, 17]
+    assert mask_of(hand) == (1 << 51) | 1 | (1 << 17)
+    assert cards_in(mask_of(hand)) == sorted(hand)
+
+
+def test_cards__immutable_sequence():
+    board = Cards.parse("Ah Kd 7c")
+    turn = board + [card("2s")]
+    assert list(board) == [50, 45, 20]
+    assert len(turn) == 4 and turn[3] == 3
+    assert turn[:3] == board
+    assert hash(turn[:3]) == hash(board)
+    assert board != Cards.parse("Ah Kd")
+    assert evaluate(turn + Cards.parse("Ac")) == evaluate([50, 45, 20, 1, card("Ac")])
+
+
+@pytest.mark.parametrize("dumps", [stdlib_dumps, orjson_dumps])
+def test_cards__encoded_only_as_frames_are_built(dumps):
+    if dumps is orjson_dumps:
+        pytest.importorskip("orjson")
+    state = {"board": Cards.parse("Ah Kd 7c"), "pot": 10}
+    assert json.loads(dumps(state)) == {"board": ["Ah", "Kd", "7c"], "pot": 10}
+    with pytest.raises(TypeError):
+        dumps({"x": object()})
+
+
+def test_cards__msgpack_frames():
+    msgpack = pytest.importorskip("msgpack")
+    codec = CODECS["roomcode.msgpack"]
+    frame = codec.extend(codec.encode({"pot": 1}), {"hole": Cards.parse("2c 2d")})
+    assert msgpack.unpackb(frame) == {"pot": 1, "hole": ["2c", "2d"]}
+
+
+def test_deck__deals_every_card_once():
+    deck = Deck(shuffled_deck(random.Random(1)))
+    hands = [deck.deal(2) for _ in range(9)]
+    deck.burn()
+    board = deck.deal(5)
+    dealt = [value for hand in hands for value in hand] + list(board)
+    assert len(set(dealt)) == len(dealt) == 23
+    assert len(deck) == 52 - 24
+    with pytest.raises(ValueError):
+        deck.deal(29)
+
+
+def test_deck_pool__fills_in_background():
+    pool = DeckPool(size=4)
+    pool.start()
+    try:
+        deadline = time.monotonic() + 5
+        while pool.ready() < 4 and time.monotonic() < deadline:
+            time.sleep(0.01)
+        assert pool.ready() == 4
+        deck = pool.take()
+        assert sorted(deck.deal(52)) == list(range(52))
+        assert pool.misses == 0
+    finally:
+        pool.stop()
+
+
+def test_deck_pool__shuffles_inline_when_empty():
+    pool = DeckPool(size=1)
+    assert len(pool.take()) == 52
+    assert pool.misses == 1
+
+
+def test_cards__showdown_with_dealt_cards():
+    deck = Deck(shuffled_deck(random.Random(5)))
+    holes = {seat: deck.deal(2) for seat in range(3)}
+    board = deck.deal(5)
+    strengths, _ = showdown(board, holes)
+    assert strengths == {seat: evaluate(board + hole) for seat, hole in holes.items()}
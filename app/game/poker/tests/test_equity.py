@@ -0,0 +1,77 @@
+import pytest
+
+np = pytest.importorskip("numpy")
+
+from app.game.poker.cards import parse_cards  # noqa: E402
+from app.game.poker.equity import (  # noqa: E402
+    EquityEngine,
+    calculate_equity,
+    evaluate_array,
+)
+from app.game.poker.evaluator import evaluate  # noqa: E402
+
+
+def test_evaluate_array__matches_evaluate():
+    rng = np.random.default_rng(7)
+    cards = np.array([rng.choice(52, 7, replace=False) for _ in range(3000)])
+    cards[0] = parse_cards("2h 7h 9h Jh Kh Ks Kd")  # make sure flushes are covered
+    want = [evaluate(hand.tolist()) for hand in cards]
+    assert evaluate_array(cards).tolist() == want
+
+
+def test_calculate_equity__aces_against_kings():
+    result = calculate_equity(
+        [parse_cards("Ah As"), parse_cards("Kh Kd")], margin=0.01, seed=1
+    )
+    assert result.equity[0] == pytest.approx(0.82, abs=0.015)
+    assert sum(result.equity) == pytest.approx(1.0)
+    assert result.margin <= 0.01
+    assert not result.exact
+
+
+def test_calculate_equity__river_is_exact_split():
+    result = calculate_equity(
+        [parse_cards("2c 3d"), parse_cards("2d 3c")],
+        board=parse_cards("Ah Kh Qh Jh Th"),
+    )
+    assert result.exact
+    assert result.samples == 1
+    assert result.equity == [0.5, 0.5]
+    assert result.tie == [1.0, 1.0]
+
+
+def test_calculate_equity__unknown_opponents_and_sample_cap():
+    result = calculate_equity(
+        [parse_cards("Ah As"), None, None],
+        margin=0.0001,
+        max_samples=10_000,
+        batch=5_000,
+        seed=2,
+    )
+    assert result.samples == 10_000
+    assert result.equity[0] == pytest.approx(0.735, abs=0.03)
+
+
+@pytest.mark.parametrize(
+    "holes,board",
+    [
+        ([parse_cards("Ah As")], []),
+        ([parse_cards("Ah As"), parse_cards("Ah Kd")], []),
+        ([parse_cards("Ah As"), parse_cards("Kh Kd")], parse_cards("Ah 2c 3c")),
+    ],
+)
+def test_calculate_equity__bad_input(holes, board):
+    with pytest.raises(ValueError):
+        calculate_equity(holes, board=board)
+
+
+async def test_equity_engine__process_pool():
+    engine = EquityEngine(workers=2, batch=5_000)
+    try:
+        result = await engine.equity(
+            [parse_cards("Ah As"), parse_cards("Kh Kd")], margin=0.01, seed=3
+        )
+    finally:
+        engine.close()
+    assert result.samples % 10_000 == 0
+    assert result.equity[0] == pytest.approx(0.82, abs=0.015)
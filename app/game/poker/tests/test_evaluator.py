@@ -0,0 +1,130 @@
+import random
+from itertools import combinations
+
+import pytest
+
+from app.game.poker import evaluator
+from app.game.poker.cards import card_text, parse_cards
+from app.game.poker.evaluator import category, evaluate, evaluate_many, showdown
+
+
+def reference_score(cards):
+    # slow and obvious: best of every five-card subset
+    return max(five_card_score(hand) for hand in combinations(cards, 5))
+
+
+def five_card_score(cards):
+    ranks = sorted((c >> 2 for c in cards), reverse=True)
+    flush = len({c & 3 for c in cards}) == 1
+    distinct = sorted(set(ranks), reverse=True)
+    straight = None
+    if len(distinct) == 5 and distinct[0] - distinct[4] == 4:
+        straight = distinct[0]
+    elif distinct == [12, 3, 2, 1, 0]:
+        straight = 3
+    groups = sorted(((ranks.count(r), r) for r in distinct), reverse=True)
+    shape = [count for count, _ in groups]
+    order = [rank for _, rank in groups]
+    if straight is not None and flush:
+        return (8, straight)
+    if shape == [4, 1]:
+        return (7, *order)
+    if shape == [3, 2]:
+        return (6, *order)
+    if flush:
+        return (5, *order)
+    if straight is not None:
+        return (4, straight)
+    return ({(3, 1, 1): 3, (2, 2, 1): 2, (2, 1, 1, 1): 1}.get(tuple(shape), 0), *order)
+
+
+def test_build_tables__every_hand_class_once():
+    evaluator.build_tables()
+    assert len(evaluator._rank_table) == 6175 + 18395 + 49205
+    sizes = [
+        b - a
+        for a, b in zip(evaluator._category_starts, evaluator._category_starts[1:])
+    ]
+    assert sizes + [7463 - evaluator._category_starts[-1]] == [
+        1277,
+        2860,
+        858,
+        858,
+        10,
+        1277,
+        156,
+        156,
+        10,
+    ]
+
+
+@pytest.mark.parametrize(
+    "hand,want",
+    [
+        ("Ah Kh Qh Jh Th 2c 3d", "straight_flush"),
+        ("5d 4d 3d 2d Ad Ac As", "straight_flush"),
+        ("9c 9d 9h 9s 2c 3d", "four_of_a_kind"),
+        ("Kc Kd Ks Qc Qd Qs 2h", "full_house"),
+        ("2h 7h 9h Jh Kh Ks Kd", "flush"),
+        ("Ac 2d 3h 4s 5c Kd", "straight"),
+        ("7c 7d 7h Ac Kd", "three_of_a_kind"),
+        ("7c 7d 8h 8c Ad Ac 2s", "two_pair"),
+        ("7c 7d 9h Jc Ad", "pair"),
+        ("7c 5d 4h 3c 2d", "high_card"),
+    ],
+)
+def test_category__known_hands(hand, want):
+    assert category(evaluate(parse_cards(hand))) == want
+
+
+def test_evaluate__extremes():
+    assert evaluate(parse_cards("7c 5d 4h 3c 2d")) == 1
+    assert evaluate(parse_cards("Ah Kh Qh Jh Th")) == 7462
+    assert evaluate(parse_cards("5s 4d 3d 2d Ad")) < evaluate(
+        parse_cards("6s 5s 4d 3d 2d")
+    )
+
+
+@pytest.mark.parametrize("size", [5, 6, 7])
+def test_evaluate__orders_hands_like_reference(size):
+    rng = random.Random(size)
+    hands = [rng.sample(range(52), size) for _ in range(500)]
+    strengths = evaluate_many(hands)
+    scores = [reference_score(hand) for hand in hands]
+    for i in range(len(hands) - 1):
+        got = (strengths[i] > strengths[i + 1]) - (strengths[i] < strengths[i + 1])
+        want = (scores[i] > scores[i + 1]) - (scores[i] < scores[i + 1])
+        assert got == want, [card_text(c) for c in hands[i] + hands[i + 1]]
+
+
+def test_showdown__winner_and_split():
+    board = parse_cards("Ah Kd 7c 7s 2h")
+    strengths, winners = showdown(
+        board,
+        {
+            "ann": parse_cards("Ac 3d"),
+            "bob": parse_cards("As 4d"),
+            "cy": parse_cards("Kc Ks"),
+        },
+    )
+    assert winners == ["cy"]
+    assert strengths["ann"] == strengths["bob"]
+
+    _, winners = showdown(
+        board, {"ann": parse_cards("Ac 3d"), "bob": parse_cards("As 4d")}
+    )
+    assert winners == ["ann", "bob"]
+
+
+def test_showdown__matches_evaluate_with_flush():
+    board = parse_cards("2h 7h 9h Jc Kd")
+    holes = {seat: parse_cards(text) for seat, text in enumerate(["Ah 3h", "Kc Ks"])}
+    strengths, winners = showdown(board, holes)
+    assert strengths == {seat: evaluate(board + hole) for seat, hole in holes.items()}
+    assert winners == [0]
+
+
+@pytest.mark.parametrize("count", [4, 8])
+def test_evaluate__wrong_number_of_cards(count):
+    with pytest.raises(ValueError):
+        evaluate(list(range(count)))
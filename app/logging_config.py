@@ -0,0 +1,169 @@
+import atexit
+import json
+import logging
+import queue
+import time
+from logging.handlers import QueueHandler, QueueListener
+from typing import Any, Callable, Dict, Optional, Tuple
+
+TEXT_FORMAT = (
+    "%(asctime)s.%(msecs)03dZ [%(filename)s:%(lineno)d] %(levelname)s - %(message)s"
+)
+DATE_FORMAT = "%Y-%m-%dT%H:%M:%S"
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line, for log shippers."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry: Dict[str, Any] = {
+            "ts": self.formatTime(record, DATE_FORMAT) + f".{int(record.msecs):03d}Z",
+            "level": record.levelname,
+            "where": f"{record.filename}:{record.lineno}",
+            "message": record.getMessage(),
+        }
+        if (category := getattr(record, "sample", None)) is not None:
+            entry["category"] = category
+        if suppressed := getattr(record, "suppressed", 0):
+            entry["suppressed"] = suppressed
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            entry["exc"] = record.exc_text
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class SamplingFilter(logging.Filter):
+    """
+    Lets through at most a given number of records per second for each
+    category, named on the hot log lines with extra={"sample": category}.
+    The next record let through after some were dropped says how many.
+    Records without a category, or in categories without a rate, all pass.
+    """
+
+    def __init__(
+        self,
+        rates: Dict[str, float],
+        default: Optional[float] = None,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        super().__init__()
+        self.rates = rates
+        self.default = default
+        self.clock = clock
+        self._buckets: Dict[str, Tuple[float, float]] = {}  # tokens, last refill
+        self._dropped: Dict[str, int] = {}
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if (category := getattr(record, "sample", None)) is None:
+            return True
+        if (rate := self.rates.get(category, self.default)) is None:
+            return True
+        now = self.clock()
+        burst = max(rate, 1.0)
+        tokens, last = self._buckets.get(category, (burst, now))
+        tokens = min(burst, tokens + (now - last) * rate)
+        if tokens < 1:
+            self._buckets[category] = (tokens, now)
+            self._dropped[category] = self._dropped.get(category, 0) + 1
+            return False
+        self._buckets[category] = (tokens - 1, now)
+        if suppressed := self._dropped.pop(category, 0):
+            record.suppressed = suppressed
+            record.msg = f"{record.msg} ({suppressed} similar suppressed)"
+        return True
+
+
+def parse_sample_rates(spec: str) -> Tuple[Dict[str, float], Optional[float]]:
+    """
+    "action=5,slot=1" sets per-category rates; a bare number such as "20"
+    is the rate for every other category.
+    """
+    rates: Dict[str, float] = {}
+    default = None
+    for entry in filter(None, (part.strip() for part in spec.split(","))):
+        category, _, rate = entry.rpartition("=")
+        if category:
+            rates[category] = float(rate)
+        else:
+            default = float(rate)
+    return rates, default
+
+
+class NonBlockingQueueHandler(QueueHandler):
+    """
+    Hands records to a QueueListener thread without ever waiting: only the
+    message arguments are merged here, formatting and writing happen on the
+    listener, and records are dropped (and counted) if the queue is full.
+    """
+
+    def __init__(self, log_queue: "queue.Queue[logging.LogRecord]"):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # args may be mutated by the caller before the listener gets to them
+        record.msg = record.getMessage()
+        record.args = None
+        return record
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+class DrainingQueueListener(QueueListener):
+    def __init__(
+        self, log_queue: "queue.Queue[Any]", *handlers: logging.Handler, **kwargs: Any
+    ):
+        super().__init__(log_queue, *handlers, **kwargs)
+        self.log_queue = log_queue
+
+    def enqueue_sentinel(self) -> None:
+        # waits for room rather than failing when the queue is full
+        self.log_queue.put(getattr(self, "_sentinel", None))
+
+    def stop(self) -> None:
+        if self._thread is not None:
+            super().stop()
+
+
+def configure_logging(
+    mode: str = "sync",
+    fmt: str = "text",
+    level: str = "INFO",
+    sample: str = "",
+    queue_size: int = 10000,
+) -> Optional[DrainingQueueListener]:
+    """
+    Set up the root logger. In "sync" mode records are written to stderr by
+    the thread that logs them; in "queue" mode the event loop only enqueues
+    them and a background thread writes them. Returns the queue listener, if
+    any; it is stopped at exit so queued records are flushed.
+    """
+    if mode not in ("sync", "queue"):
+        raise ValueError(f"Unknown log mode: {mode}")
+    if fmt not in ("text", "json"):
+        raise ValueError(f"Unknown log format: {fmt}")
+
+    stream = logging.StreamHandler()
+    stream.setFormatter(
+        JsonFormatter()
+        if fmt == "json"
+        else logging.Formatter(TEXT_FORMAT, datefmt=DATE_FORMAT)
+    )
+    front: logging.Handler = stream
+    listener = None
+    if mode == "queue":
+        log_queue: "queue.Queue[logging.LogRecord]" = queue.Queue(queue_size)
+        front = NonBlockingQueueHandler(log_queue)
+        listener = DrainingQueueListener(log_queue, stream, respect_handler_level=True)
+        listener.start()
+        atexit.register(listener.stop)
+    if sample:
+        front.addFilter(SamplingFilter(*parse_sample_rates(sample)))
+
+    logging.basicConfig(level=level, handlers=[front])
+    return listener
@@ -1,20 +1,20 @@
 import logging
+import os
 import time
 
 from fastapi import FastAPI
 
-from app.api import router
+from app.api import lifespan, router
+from app.logging_config import configure_logging
 
-logging.basicConfig(
-    level=logging.INFO,
-    format=(
-        "%(asctime)s.%(msecs)03dZ [%(filename)s:%(lineno)d] "
-        "%(levelname)s - %(message)s"
-    ),
-    datefmt="%Y-%m-%dT%H:%M:%S",
+configure_logging(
+    mode=os.environ.get("LOG_MODE", "sync"),
+    fmt=os.environ.get("LOG_FORMAT", "text"),
+    level=os.environ.get("LOG_LEVEL", "INFO"),
+    sample=os.environ.get("LOG_SAMPLE_PER_SECOND", ""),
 )
 logging.Formatter.converter = time.gmtime
 logger = logging.getLogger()
 logger.info("Starting up")
-fastapi_app = FastAPI()
+fastapi_app = FastAPI(lifespan=lifespan)
 fastapi_app.include_router(router)
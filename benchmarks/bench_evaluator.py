@@ -0,0 +1,57 @@
+"""
+Throughput of the poker hand evaluator on random 7-card hands, one at a time
+and as 10-player showdowns.
+
+    python -m benchmarks.bench_evaluator
+"""
+
+import argparse
+import json
+import random
+import sys
+import time
+from typing import Any, Dict, Optional, Sequence
+
+from app.game.poker.evaluator import build_tables, evaluate_many, showdown
+from benchmarks.harness import commit_info
+
+
+def run(hands: int = 200_000, seed: int = 1) -> Dict[str, Any]:
+    started = time.perf_counter()
+    build_tables()
+    build_seconds = time.perf_counter() - started
+
+    rng = random.Random(seed)
+    sevens = [rng.sample(range(52), 7) for _ in range(hands)]
+    started = time.perf_counter()
+    evaluate_many(sevens)
+    single = hands / (time.perf_counter() - started)
+
+    tables = []
+    for _ in range(hands // 10):
+        deck = rng.sample(range(52), 25)
+        holes = {seat: (deck[5 + seat], deck[15 + seat]) for seat in range(10)}
+        tables.append((deck[:5], holes))
+    started = time.perf_counter()
+    for board, holes in tables:
+        showdown(board, holes)
+    batched = len(tables) * 10 / (time.perf_counter() - started)
+
+    return {
+        **commit_info(),
+        "build_seconds": build_seconds,
+        "hands_per_sec": single,
+        "showdown_hands_per_sec": batched,
+    }
+
+
+def main(argv: Optional[Sequence[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--hands", type=int, default=200_000)
+    args = parser.parse_args(argv)
+    print(json.dumps(run(args.hands), indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
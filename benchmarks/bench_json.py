@@ -0,0 +1,139 @@
+"""
+Microbenchmark of the JSON encoders available to frames.encode, on the
+payloads a 10-client room actually sends from send_game_state and
+broadcast_slots, plus a larger table-game state.
+
+    python -m benchmarks.bench_json
+"""
+
+import argparse
+import json
+import sys
+import timeit
+from typing import Any, Callable, Dict, Optional, Sequence
+
+from app.engine import frames
+from app.engine.room import Room
+from app.game.pass_pebble import PassThePebbleGame
+from benchmarks.harness import commit_info
+
+CLIENTS = 10
+
+
+def client_id(slot: int) -> str:
+    return f"client{slot:02d}"
+
+
+def pebble_room() -> Room:
+    game = PassThePebbleGame(CLIENTS)
+    for slot, player in game.players.items():
+        player.set_client_id(client_id(slot))
+        player.set_display_name(f"Player {slot} ☘")
+    game.start_game()
+    return Room("BENCH", game)
+
+
+def table_state() -> Dict[str, Any]:
+    # roughly what a hold'em table with a long action log looks like
+    return {
+        "version": 1234,
+        "public_state": {
+            "board": ["Ah", "Kd", "7c", "7s", "2h"],
+            "pot": 125000,
+            "seats": {
+                seat: {
+                    "name": f"Player {seat}",
+                    "stack": 10000 - seat * 321,
+                    "bet": seat * 50,
+                    "folded": seat % 3 == 0,
+                    "last_action": "raise",
+                }
+                for seat in range(CLIENTS)
+            },
+            "log": [
+                {"seat": i % CLIENTS, "action": "call", "amount": 50 * i}
+                for i in range(200)
+            ],
+        },
+        "is_over": False,
+        "final_result": None,
+    }
+
+
+def workloads() -> Dict[str, Callable[[], None]]:
+    room = pebble_room()
+    game = room.game
+    client_ids = [client_id(slot) for slot in game.players]
+    state = {
+        "version": 42,
+        "public_state": game.get_public_state(),
+        "is_over": game.is_game_over(),
+        "final_result": None,
+    }
+    private = {
+        cid: {"private_state": game.get_private_state(cid), "your_turn": i == 0}
+        for i, cid in enumerate(client_ids)
+    }
+    slots = room.common_payload()
+    table = table_state()
+
+    def publish(shared: Dict[str, Any]) -> Callable[[], None]:
+        # one shared encode plus a per-client extend, as _publish_game_state does
+        def run() -> None:
+            frame = frames.encode(shared)
+            for cid in client_ids:
+                frames.extend(frame, private[cid])
+
+        return run
+
+    def publish_slots() -> None:
+        frame = frames.encode(slots)
+        for slot, cid in enumerate(client_ids):
+            frames.extend(frame, {"my_slot": slot})
+
+    return {
+        "game_state": publish(state),
+        "slots": publish_slots,
+        "table_state": publish(table),
+    }
+
+
+def run(number: int = 2000, repeat: int = 5) -> Dict[str, Any]:
+    results: Dict[str, Dict[str, float]] = {}
+    cases = workloads()
+    previous = frames.use_json_encoder("stdlib")
+    try:
+        for name in frames.JSON_ENCODERS:
+            frames.use_json_encoder(name)
+            results[name] = {
+                case: min(timeit.repeat(fn, number=number, repeat=repeat))
+                / number
+                * 1e6
+                for case, fn in cases.items()
+            }
+    finally:
+        frames.use_json_encoder(previous)
+
+    result: Dict[str, Any] = {
+        **commit_info(),
+        "clients": CLIENTS,
+        "us_per_publish": results,
+    }
+    if "orjson" in results:
+        result["speedup"] = {
+            case: results["stdlib"][case] / results["orjson"][case] for case in cases
+        }
+    return result
+
+
+def main(argv: Optional[Sequence[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--number", type=int, default=2000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args(argv)
+    print(json.dumps(run(args.number, args.repeat), indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,219 @@
+"""
+Load benchmark for the room hot path. Many rooms of simulated clients play
+Pass the Pebble through the real ASGI app in one process, with no network,
+so the numbers reflect Room, handle_ws_message and the game itself.
+
+    python -m benchmarks.bench_rooms --rooms 100 --clients 10 --actions 50
+    python -m benchmarks.bench_rooms --output new.json --baseline old.json
+
+Results are printed (or written) as JSON tagged with the commit they were
+measured on. With --baseline the run is compared against an earlier result
+and exits non-zero on a regression beyond --tolerance.
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import platform
+import sys
+import time
+import tracemalloc
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from app.api import CreateGameRequest, create_game, release_code, rooms
+from app.engine.room import Room
+from app.main import fastapi_app
+from benchmarks.harness import SimulatedClient, commit_info, percentile
+
+TAKE_TURN = json.dumps({"action": "take_turn", "turn": {"action": "pass"}})
+STATE_PREFIX = '{"version":'
+
+
+async def open_room(num_clients: int) -> Tuple[Room, List[SimulatedClient]]:
+    code = (
+        await create_game(
+            CreateGameRequest(game_type="pass_the_pebble", players=num_clients)
+        )
+    )["code"]
+    room = rooms[code]
+    room.game.max_passes = sys.maxsize  # type: ignore[attr-defined]
+    clients = [SimulatedClient(fastapi_app, f"/ws/{code}/") for _ in range(num_clients)]
+    for client in clients:
+        await client.connect()
+    for slot, client in enumerate(clients):
+        client.send_text(json.dumps({"action": "claim_slot", "slot": slot}))
+    while any(player.client_id is None for player in room.game.players.values()):
+        await asyncio.sleep(0)
+    clients[0].send_text(json.dumps({"action": "start_game"}))  # the manager
+    for client in clients:
+        await client.wait_for(STATE_PREFIX)
+        client.frames.clear()
+    return room, clients
+
+
+async def close_room(room: Room, clients: List[SimulatedClient]) -> None:
+    # stop the game first: a started game forces a pass when its holder leaves,
+    # which fails once nobody is left to take the pebble
+    room.game.is_started = False
+    for client in clients:
+        await client.disconnect()
+    rooms.pop(room.code, None)
+    room.close()  # also drops the seats held for the clients to resume
+    release_code(room.code)
+
+
+async def take_turn(room: Room, clients: List[SimulatedClient]) -> float:
+    """Latency from sending a turn to the last client receiving the new state."""
+    holder = clients[room.game.current_index]  # type: ignore[attr-defined]
+    started = time.perf_counter()
+    holder.send_text(TAKE_TURN)
+    arrivals = [await client.wait_for(STATE_PREFIX) for client in clients]
+    return max(arrivals) - started
+
+
+async def play(
+    room: Room, clients: List[SimulatedClient], actions: int, latencies: List[float]
+) -> None:
+    for _ in range(actions):
+        latencies.append(await take_turn(room, clients))
+
+
+async def measure_allocations(
+    tables: List[Tuple[Room, List[SimulatedClient]]], actions: int
+) -> Dict[str, Optional[float]]:
+    # One action at a time, so each peak belongs to a single action. CPython
+    # does not count malloc calls, so this reports bytes rather than calls.
+    peaks = []
+    tracemalloc.start()
+    start, _ = tracemalloc.get_traced_memory()
+    for _ in range(actions):
+        for room, clients in tables:
+            before, _ = tracemalloc.get_traced_memory()
+            if hasattr(tracemalloc, "reset_peak"):
+                tracemalloc.reset_peak()
+                await take_turn(room, clients)
+                peaks.append(tracemalloc.get_traced_memory()[1] - before)
+            else:
+                await take_turn(room, clients)
+    end, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    count = actions * len(tables)
+    return {
+        "alloc_peak_bytes_per_action": sum(peaks) / len(peaks) if peaks else None,
+        "retained_bytes_per_action": (end - start) / count if count else None,
+    }
+
+
+async def run(
+    num_rooms: int = 100,
+    clients: int = 10,
+    actions: int = 20,
+    alloc_actions: int = 2,
+) -> Dict[str, Any]:
+    tables = [await open_room(clients) for _ in range(num_rooms)]
+    latencies: List[float] = []
+    try:
+        started = time.perf_counter()
+        await asyncio.gather(
+            *(play(room, members, actions, latencies) for room, members in tables)
+        )
+        elapsed = time.perf_counter() - started
+        allocations = await measure_allocations(tables, alloc_actions)
+    finally:
+        for room, members in tables:
+            await close_room(room, members)
+
+    return {
+        **commit_info(),
+        "python": platform.python_version(),
+        "config": {
+            "rooms": num_rooms,
+            "clients": clients,
+            "actions": actions,
+            "alloc_actions": alloc_actions,
+        },
+        "actions": len(latencies),
+        "seconds": elapsed,
+        "actions_per_sec": len(latencies) / elapsed if elapsed else 0.0,
+        "latency_ms": {
+            "p50": percentile(latencies, 50) * 1000,
+            "p99": percentile(latencies, 99) * 1000,
+            "max": max(latencies, default=0.0) * 1000,
+        },
+        **allocations,
+    }
+
+
+def compare(
+    result: Dict[str, Any], baseline: Dict[str, Any], tolerance: float
+) -> List[str]:
+    """Regressions of result against baseline worse than tolerance (a fraction)."""
+    if result["config"] != baseline.get("config"):
+        return [f"config differs from baseline: {baseline.get('config')}"]
+    checks = [
+        ("actions_per_sec", result["actions_per_sec"], baseline["actions_per_sec"], -1),
+        ("latency p50", result["latency_ms"]["p50"], baseline["latency_ms"]["p50"], 1),
+        ("latency p99", result["latency_ms"]["p99"], baseline["latency_ms"]["p99"], 1),
+    ]
+    if result.get("alloc_peak_bytes_per_action") and baseline.get(
+        "alloc_peak_bytes_per_action"
+    ):
+        checks.append(
+            (
+                "alloc peak per action",
+                result["alloc_peak_bytes_per_action"],
+                baseline["alloc_peak_bytes_per_action"],
+                1,
+            )
+        )
+    regressions = []
+    for name, new, old, worse in checks:
+        if old and (new - old) / old * worse > tolerance:
+            regressions.append(f"{name}: {old:.4g} -> {new:.4g}")
+    return regressions
+
+
+def main(argv: Optional[Sequence[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--rooms", type=int, default=100)
+    parser.add_argument("--clients", type=int, default=10, help="clients per room")
+    parser.add_argument("--actions", type=int, default=20, help="turns per room")
+    parser.add_argument(
+        "--alloc-actions",
+        type=int,
+        default=2,
+        help="turns per room replayed under tracemalloc",
+    )
+    parser.add_argument("--output", help="write the JSON result here")
+    parser.add_argument("--baseline", help="earlier JSON result to compare with")
+    parser.add_argument("--tolerance", type=float, default=0.1)
+    parser.add_argument(
+        "--log-level",
+        default="WARNING",
+        help="app log level during the run; INFO measures per-action logging too",
+    )
+    args = parser.parse_args(argv)
+
+    logging.getLogger().setLevel(args.log_level)
+    result = asyncio.run(
+        run(args.rooms, args.clients, args.actions, args.alloc_actions)
+    )
+    text = json.dumps(result, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(result, json.load(f), args.tolerance)
+        for regression in regressions:
+            print(f"REGRESSION {regression}", file=sys.stderr)
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,112 @@
+import asyncio
+import subprocess
+import time
+from collections import deque
+from typing import Any, Deque, Dict, List, Optional, Sequence, Tuple
+
+Frame = Any  # str or bytes, exactly as the app sent it
+
+
+class SimulatedClient:
+    """
+    A websocket client that talks to an ASGI app in-process, with no network
+    or test transport in between. Frames are kept undecoded so the harness
+    adds as little work of its own as possible to what is being measured.
+    """
+
+    def __init__(self, app: Any, path: str, subprotocols: Sequence[str] = ()):
+        self.app = app
+        self.scope = {
+            "type": "websocket",
+            "asgi": {"version": "3.0"},
+            "scheme": "ws",
+            "http_version": "1.1",
+            "path": path,
+            "raw_path": path.encode(),
+            "root_path": "",
+            "query_string": b"",
+            "headers": [],
+            "subprotocols": list(subprotocols),
+            "client": ("bench", 0),
+            "server": ("bench", 80),
+        }
+        self.subprotocol: Optional[str] = None
+        self.closed = False
+        self.frames: Deque[Tuple[float, Frame]] = deque()
+        self._inbox: "asyncio.Queue[Dict[str, Any]]" = asyncio.Queue()
+        self._arrived = asyncio.Event()
+        self._accepted = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+
+    async def connect(self) -> None:
+        self._inbox.put_nowait({"type": "websocket.connect"})
+        self._task = asyncio.create_task(
+            self.app(self.scope, self._inbox.get, self._receive_from_app)
+        )
+        await self._accepted.wait()
+
+    async def _receive_from_app(self, message: Dict[str, Any]) -> None:
+        kind = message["type"]
+        if kind == "websocket.send":
+            frame = message.get("text")
+            self.frames.append(
+                (time.perf_counter(), frame if frame is not None else message["bytes"])
+            )
+            self._arrived.set()
+        elif kind == "websocket.accept":
+            self.subprotocol = message.get("subprotocol")
+            self._accepted.set()
+        elif kind == "websocket.close":
+            self.closed = True
+            self._accepted.set()
+            self._arrived.set()
+
+    def send_text(self, text: str) -> None:
+        self._inbox.put_nowait({"type": "websocket.receive", "text": text})
+
+    async def next_frame(self) -> Tuple[float, Frame]:
+        """Arrival time and contents of the oldest frame not yet taken."""
+        while not self.frames:
+            if self.closed:
+                raise ConnectionError("Server closed the connection")
+            self._arrived.clear()
+            await self._arrived.wait()
+        return self.frames.popleft()
+
+    async def wait_for(self, prefix: str) -> float:
+        """Skip frames until one starting with prefix; return its arrival."""
+        while True:
+            arrived, frame = await self.next_frame()
+            if isinstance(frame, str) and frame.startswith(prefix):
+                return arrived
+
+    async def disconnect(self) -> None:
+        self._inbox.put_nowait({"type": "websocket.disconnect", "code": 1000})
+        if self._task is not None:
+            await self._task
+
+
+def percentile(samples: List[float], pct: float) -> float:
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, max(0, round(pct / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+
+def commit_info() -> Dict[str, Any]:
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+        dirty = bool(
+            subprocess.run(
+                ["git", "status", "--porcelain", "--untracked-files=no"],
+                capture_output=True,
+                text=True,
+                check=True,
+            ).stdout.strip()
+        )
+    except (OSError, subprocess.CalledProcessError):
+        return {"commit": None, "dirty": None}
+    return {"commit": commit, "dirty": dirty}
@@ -1,3 +1,4 @@
+import json
 from copy import deepcopy
 from typing import Any, Dict, List, Optional
 
@@ -69,9 +70,15 @@ class FakeWebSocket:
     async def send_json(self, data: Dict[str, Any]):
         self.sent_messages.append(data)
 
+    async def send_text(self, data: str):
+        self.sent_messages.append(json.loads(data))
+
     async def receive_json(self) -> Dict[str, Any]:
         return self.next_message
 
+    async def close(self, code: int = 1000):
+        self.application_state = WebSocketState.DISCONNECTED
+
 
 @pytest.fixture
 def websocket():
@@ -1,17 +1,27 @@
+import asyncio
 from unittest.mock import AsyncMock, patch
 
 import pytest
+from fastapi.websockets import WebSocketState
 
 from app.engine.action_handlers import (
     ACTION_HANDLERS,
+    ack_state,
+    catch_up,
     claim_manager,
     claim_slot,
     handle_ws_message,
+    hold_seat,
+    join_room,
+    leave_room,
     release_slot,
+    resume_room,
     start_game,
     take_turn,
     update_name,
 )
+from app.engine.action_log import LogWriter, RoomLog
+from tests.conftest import FakeWebSocket
 
 
 @pytest.mark.parametrize(
@@ -296,3 +306,159 @@ async def test_handle_ws_message__errors_unknown_actions(trivial_room, websocket
     await handle_ws_message(context)
     assert len(msgs := websocket.sent_messages) == 1
     assert msgs[0].get("error") == "Unknown action: reticulate_splines"
+
+
+async def test_join_room__first_client_becomes_manager(trivial_room, websocket):
+    CLIENT_ID = "testclient"
+    context = {"ws": websocket, "client_id": CLIENT_ID, "room": trivial_room}
+    await join_room(context)
+    assert trivial_room[CLIENT_ID] is websocket
+    assert trivial_room.game.manager == CLIENT_ID
+    msgs = websocket.sent_messages
+    assert msgs[0]["client_id"] == CLIENT_ID
+    assert msgs[-1]["my_slot"] is None
+
+
+async def test_leave_room__releases_slot_and_manager(trivial_room, websocket):
+    CLIENT_ID = "testclient"
+    OTHER_CLIENT = "some1else"
+    other_ws = FakeWebSocket()
+    trivial_room[CLIENT_ID] = websocket
+    trivial_room[OTHER_CLIENT] = other_ws
+    trivial_room.game.manager = CLIENT_ID
+    trivial_room.game.players[0].client_id = CLIENT_ID
+    context = {"ws": websocket, "client_id": CLIENT_ID, "room": trivial_room}
+
+    await leave_room(context)
+    assert CLIENT_ID not in trivial_room
+    assert trivial_room.game.players[0].client_id is None
+    assert trivial_room.game.manager is None
+    assert not websocket.sent_messages
+    assert {"info": "There is no manager"} in other_ws.sent_messages
+
+
+async def test_ack_state__errors_for_unknown_version(trivial_room, websocket):
+    CLIENT_ID = "testclient"
+    trivial_room[CLIENT_ID] = websocket
+    context = {
+        "ws": websocket,
+        "client_id": CLIENT_ID,
+        "room": trivial_room,
+        "data": {"action": "ack_state", "version": 42},
+    }
+    await ack_state(context)
+    assert len(msgs := websocket.sent_messages) == 1
+    assert msgs[0].get("error") == "Unknown state version"
+
+
+async def test_catch_up__no_log(trivial_room, websocket):
+    context = {"ws": websocket, "client_id": "A", "room": trivial_room, "data": {}}
+    await catch_up(context)
+    assert websocket.sent_messages == [{"error": "This room keeps no action log"}]
+
+
+async def test_catch_up__sends_public_view_and_events(
+    trivial_room, websocket, tmp_path
+):
+    trivial_room.log = RoomLog(
+        trivial_room.game, "trivial", str(tmp_path / "log"), LogWriter()
+    )
+    await trivial_room.claim_slot(0, "A")
+    context = {"ws": websocket, "client_id": "B", "room": trivial_room, "data": {}}
+    await catch_up(context)
+    (message,) = websocket.sent_messages
+    assert message["catch_up"] == {
+        "seq": 1,
+        "view": {"public_state": {}, "is_over": False, "final_result": None},
+        "events": [{"seq": 1, "type": "claim_slot", "slot": 0}],
+    }
+
+
+async def test_resume_room__welcome_and_missed_state_only(trivial_room, websocket):
+    other = FakeWebSocket()
+    trivial_room["B"] = other
+    await trivial_room.claim_slot(0, "A")
+    trivial_room.game.is_started = True
+    trivial_room.hold("A", 60, AsyncMock())
+    other.sent_messages.clear()
+    context = {
+        "ws": websocket,
+        "client_id": "A",
+        "room": trivial_room,
+        "version": None,
+        "resume_token": "token",
+    }
+    await resume_room(context)
+
+    welcome, state = websocket.sent_messages
+    assert welcome["client_id"] == "A"
+    assert welcome["resumed"] is True
+    assert welcome["my_slot"] == 0
+    assert welcome["resume_token"] == "token"
+    assert state["version"] == 1 and state["your_turn"] is True
+    assert other.sent_messages == []
+
+    assert trivial_room.held_count() == 0
+
+    websocket.sent_messages.clear()
+    await resume_room(dict(context, version=1))
+    assert [list(m) for m in websocket.sent_messages] == [list(welcome)]
+
+
+async def test_resume_room__patches_only_when_asked(trivial_room, websocket):
+    trivial_room["A"] = websocket
+    context = {
+        "ws": websocket,
+        "client_id": "A",
+        "room": trivial_room,
+        "version": 1,
+        "resume_token": "token",
+    }
+    await trivial_room.send_game_state()
+    await resume_room(context)
+    assert "A" not in trivial_room._acked_versions
+
+    await resume_room(dict(context, patches=True))
+    assert trivial_room._acked_versions["A"] == 1
+
+
+async def test_resume_room__takes_over_a_registered_connection(trivial_room, websocket):
+    old = FakeWebSocket()
+    trivial_room["A"] = old
+    await trivial_room.claim_slot(0, "A")
+    context = {
+        "ws": websocket,
+        "client_id": "A",
+        "room": trivial_room,
+        "version": None,
+        "resume_token": "token",
+    }
+    await resume_room(context)
+    await asyncio.sleep(0)
+    assert trivial_room["A"] is websocket
+    assert old.application_state == WebSocketState.DISCONNECTED
+    assert websocket.sent_messages[0]["resumed"] is True
+
+    # the old connection's disconnect leaves the new one alone
+    old_ctx = {"ws": old, "client_id": "A", "room": trivial_room}
+    await hold_seat(dict(old_ctx, grace=60))
+    await leave_room(old_ctx)
+    assert trivial_room["A"] is websocket
+    assert trivial_room.held_count() == 0
+    assert trivial_room.slot_of("A") == 0
+
+
+async def test_resume_room__joins_afresh_once_the_seat_is_gone(trivial_room, websocket):
+    fallback = {
+        "ws": websocket,
+        "client_id": "B",
+        "room": trivial_room,
+        "resume_token": "new",
+    }
+    context = dict(fallback, client_id="A", resume_token="old", fallback=fallback)
+    await resume_room(context)
+    assert context["client_id"] == "B"
+    assert trivial_room["B"] is websocket and "A" not in trivial_room
+    welcome = websocket.sent_messages[0]
+    assert welcome["client_id"] == "B" and welcome["resume_token"] == "new"
+    assert "resumed" not in welcome
@@ -0,0 +1,124 @@
+import pytest
+
+from app.engine.action_log import (
+    EVENT,
+    LogWriter,
+    RoomLog,
+    apply_event,
+    encode_record,
+    read_log,
+    replay,
+)
+from app.engine.room import Room
+from app.game import GAME_TYPES
+from app.game.pass_pebble import PassThePebbleGame
+from tests.conftest import FakeWebSocket
+
+
+def logged_room(path, writer, snapshot_every=100):
+    room = Room("AAAA", PassThePebbleGame(2))
+    room.log = RoomLog(
+        room.game, "pass_the_pebble", path, writer, snapshot_every=snapshot_every
+    )
+    return room
+
+
+async def play(room):
+    for client_id in ("A", "B"):
+        room[client_id] = FakeWebSocket()
+    await room.set_manager("A", room["A"])
+    await room.claim_slot(0, "A")
+    await room.claim_slot(1, "B")
+    room.game.players[1].set_display_name("Bob")
+    room.record("update_name", slot=1, name="Bob")
+    await room.start_game("A", room["A"])
+    for client_id in ("A", "B", "A"):
+        room.game.submit_action(client_id, {"action": "pass"})
+        room.record("take_turn", client_id=client_id, turn={"action": "pass"})
+    await room.release_slot("B")  # B holds the pebble, so this passes for them
+
+
+async def test_replay__matches_live_game(tmp_path):
+    path = str(tmp_path / "AAAA.log")
+    writer = LogWriter()
+    writer.start()
+    room = logged_room(path, writer)
+    await play(room)
+    writer.stop()
+
+    game, seq = replay(path, GAME_TYPES)
+
+    assert seq == room.log.seq == 10
+    assert game.get_public_state() == room.game.get_public_state()
+    assert game.pass_count == 4
+    assert game.manager == "A"
+    assert [p.client_id for p in game.players.values()] == ["A", None]
+    assert game.players[1].display_name == "Bob"
+    assert writer.records == 11  # the first snapshot and ten events
+    assert writer.batches >= 1
+
+
+async def test_room_log__snapshot_compacts_file(tmp_path):
+    path = str(tmp_path / "AAAA.log")
+    writer = LogWriter()
+    room = logged_room(path, writer, snapshot_every=4)
+    await play(room)
+    writer.start()
+    writer.stop()
+
+    snapshot, events = read_log(path)
+
+    assert snapshot is not None and snapshot["seq"] == 8
+    assert [event["seq"] for event in events] == [9, 10]
+    assert writer.batches == 1
+    assert writer.records == 3  # superseded appends never reach the disk
+    assert replay(path, GAME_TYPES)[0].pass_count == 4
+
+
+async def test_room_log__catch_up(tmp_path):
+    writer = LogWriter()
+    room = logged_room(str(tmp_path / "AAAA.log"), writer, snapshot_every=4)
+    await play(room)
+
+    catch_up = room.log.catch_up()
+
+    assert catch_up["seq"] == 10
+    assert catch_up["view"] == room.game.public_view()
+    assert [event["type"] for event in catch_up["events"]] == [
+        "release_slot",
+        "take_turn",
+    ]
+    assert "snapshot" not in catch_up
+    assert not any("client_id" in event for event in catch_up["events"])
+
+
+def test_read_log__torn_record_ignored(tmp_path):
+    path = str(tmp_path / "AAAA.log")
+    writer = LogWriter()
+    RoomLog(PassThePebbleGame(1), "pass_the_pebble", path, writer)
+    writer.append(path, encode_record(EVENT, {"seq": 1, "type": "start_game"})[:-1])
+    writer.start()
+    writer.stop()
+
+    snapshot, events = read_log(path)
+
+    assert snapshot is not None
+    assert events == []
+
+
+def test_writer__delete(tmp_path):
+    path = tmp_path / "AAAA.log"
+    writer = LogWriter()
+    RoomLog(PassThePebbleGame(1), "pass_the_pebble", str(path), writer)
+    writer.delete(str(path))
+    writer.delete(str(tmp_path / "missing.log"))
+    writer.start()
+    writer.stop()
+
+    assert not path.exists()
+    assert writer.errors == 0
+
+
+def test_apply_event__unknown_type():
+    with pytest.raises(ValueError):
+        apply_event(PassThePebbleGame(1), {"seq": 1, "type": "shuffle"})
@@ -0,0 +1,205 @@
+import asyncio
+import json
+import os
+
+from fastapi import WebSocketDisconnect
+from fastapi.websockets import WebSocketState
+
+from app.engine.cluster import (
+    Cluster,
+    InMemoryBus,
+    InMemoryRegistry,
+    LocalRegistry,
+    RemoteConnection,
+    UnixSocketBus,
+    make_cluster,
+)
+from app.engine.frames import JSON
+from app.engine.resume import ResumeTokens
+from app.engine.room import Room
+from tests.conftest import FakeWebSocket, TrivialGame
+
+DEAD_WORKER = "999999999"
+
+
+def test_in_memory_registry__owner_is_local_rooms():
+    rooms = {"AAAA": Room("AAAA", TrivialGame(1))}
+    registry = InMemoryRegistry(rooms, "1")
+    assert not registry.reserve("AAAA")
+    assert registry.reserve("BBBB")
+    assert registry.owner("AAAA") == "1"
+    assert registry.owner("BBBB") is None
+
+
+def test_local_registry__reservation_shared_between_workers(tmp_path):
+    mine = LocalRegistry({}, str(os.getpid()), str(tmp_path))
+    theirs = LocalRegistry({}, str(os.getppid()), str(tmp_path))
+
+    assert mine.reserve("AAAA")
+    assert not theirs.reserve("AAAA")
+    assert theirs.owner("AAAA") == str(os.getpid())
+
+    theirs.release("AAAA")
+    assert mine.owner("AAAA") == str(os.getpid())
+    mine.release("AAAA")
+    assert theirs.reserve("AAAA")
+
+
+def test_local_registry__takes_over_code_from_dead_worker(tmp_path):
+    dead = LocalRegistry({}, DEAD_WORKER, str(tmp_path))
+    alive = LocalRegistry({}, str(os.getpid()), str(tmp_path))
+    assert dead.reserve("AAAA")
+
+    assert alive.owner("AAAA") is None
+    assert alive.reserve("AAAA")
+
+
+class RelayedWebSocket:
+    codec = JSON
+
+    def __init__(self):
+        self.inbox: asyncio.Queue = asyncio.Queue()
+        self.sent_messages: list = []
+        self.received = asyncio.Event()
+
+    async def receive(self):
+        if (data := await self.inbox.get()) is None:
+            raise WebSocketDisconnect
+        return data
+
+    async def send_text(self, data):
+        self.sent_messages.append(json.loads(data))
+        self.received.set()
+
+    async def send_json(self, data):
+        self.sent_messages.append(data)
+
+    async def next_message(self):
+        while not self.sent_messages:
+            self.received.clear()
+            await asyncio.wait_for(self.received.wait(), 1)
+        return self.sent_messages.pop(0)
+
+
+async def test_unix_socket_bus__remote_client_plays_in_owners_room(tmp_path):
+    owner_rooms: dict = {}
+    owner = Cluster(
+        LocalRegistry(owner_rooms, str(os.getpid()), str(tmp_path)),
+        UnixSocketBus(str(os.getpid()), str(tmp_path)),
+    )
+    remote = Cluster(
+        LocalRegistry({}, str(os.getppid()), str(tmp_path)),
+        UnixSocketBus(str(os.getppid()), str(tmp_path)),
+    )
+    assert owner.registry.reserve("AAAA")
+    owner_rooms["AAAA"] = Room("AAAA", TrivialGame(1))
+    await owner.start()
+    await remote.start()
+    try:
+        assert remote.remote_owner("AAAA") == owner.worker_id
+        assert owner.remote_owner("AAAA") is None
+
+        ws = RelayedWebSocket()
+        serving = asyncio.ensure_future(
+            remote.serve_remote(ws, "AAAA", owner.worker_id)
+        )
+        welcome = await ws.next_message()
+        room = owner_rooms["AAAA"]
+        assert isinstance(room[welcome["client_id"]], RemoteConnection)
+
+        await ws.inbox.put({"action": "claim_slot", "slot": 0})
+        while (msg := await ws.next_message()).get("my_slot") is None:
+            pass
+        assert msg["my_slot"] == 0
+        assert room.game.players[0].client_id == welcome["client_id"]
+
+        await ws.inbox.put(None)
+        await serving
+        for _ in range(100):
+            if not room:
+                break
+            await asyncio.sleep(0.01)
+        assert not room
+        assert room.game.players[0].client_id is None
+    finally:
+        await remote.stop()
+        await owner.stop()
+
+
+async def test_unix_socket_bus__delivers_messages_over_datagram_limit(tmp_path):
+    received: asyncio.Queue = asyncio.Queue()
+    sender = UnixSocketBus("1", str(tmp_path))
+    receiver = UnixSocketBus("2", str(tmp_path))
+    await sender.start(received.put)
+    await receiver.start(received.put)
+    try:
+        big = {"type": "frame", "client_id": "A", "text": "x" * 500_000}
+        sender.publish("2", big)
+        sender.publish("2", {"type": "close", "client_id": "A"})
+        assert await asyncio.wait_for(received.get(), 1) == big
+        assert (await asyncio.wait_for(received.get(), 1))["type"] == "close"
+    finally:
+        await sender.stop()
+        await receiver.stop()
+
+
+def test_make_cluster__memory_backend_by_default(tmp_path):
+    cluster = make_cluster({}, "memory", str(tmp_path))
+    assert isinstance(cluster.registry, InMemoryRegistry)
+    assert not os.listdir(tmp_path)
+
+
+async def test_cluster__expires_clients_of_dead_relaying_worker():
+    room = Room("AAAA", TrivialGame(1))
+    cluster = Cluster(InMemoryRegistry({"AAAA": room}, "1"), InMemoryBus("1"))
+    await cluster._on_message(
+        {"type": "join", "worker": DEAD_WORKER, "code": "AAAA", "client_id": "X"}
+    )
+    await room.claim_slot(0, "X")
+    assert "X" in room
+
+    assert await cluster.expire_dead_peers() == 1
+    assert "X" not in room
+    assert room.game.players[0].client_id is None
+    assert cluster.relayed == {}
+    assert await cluster.expire_dead_peers() == 0
+
+
+async def test_cluster__relayed_client_resumes_and_is_held():
+    tokens = ResumeTokens(b"secret")
+    room = Room("AAAA", TrivialGame(1))
+    cluster = Cluster(
+        InMemoryRegistry({"AAAA": room}, "1"),
+        InMemoryBus("1"),
+        resume_tokens=tokens,
+        resume_grace=60,
+    )
+    # the first socket is still registered when the client comes back
+    first = FakeWebSocket()
+    room["A"] = first
+    await room.claim_slot(0, "A")
+    await cluster.start()
+
+    ws = RelayedWebSocket()
+    resume = {"resume": tokens.issue("AAAA", "A"), "version": None, "patches": False}
+    serving = asyncio.ensure_future(
+        cluster.serve_remote(ws, "AAAA", cluster.worker_id, resume=resume)
+    )
+    welcome = await ws.next_message()
+    assert welcome["client_id"] == "A" and welcome["resumed"] is True
+    assert welcome["my_slot"] == 0
+    assert isinstance(room["A"], RemoteConnection)
+    await asyncio.sleep(0)
+    assert first.application_state == WebSocketState.DISCONNECTED
+
+    await ws.inbox.put(None)
+    await serving
+    for _ in range(100):
+        if room.held_count():
+            break
+        await asyncio.sleep(0.01)
+    assert "A" not in room and room.held_count() == 1
+    assert room.slot_of("A") == 0
+    assert cluster.relayed == {"1": {}}
+    room.close()
+    await cluster.stop()
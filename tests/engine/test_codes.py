@@ -0,0 +1,57 @@
+import random
+
+import pytest
+
+from app.engine.codes import UNAMBIGUOUS_ALPHABET, CodeAllocator
+
+
+@pytest.mark.parametrize("length", [1, 2, 3, 4, 5])
+def test_allocate__creates_codes_of_length(length):
+    code = CodeAllocator(length=length).allocate()
+    assert len(code) == length
+    assert set(code) <= set(UNAMBIGUOUS_ALPHABET)
+
+
+@pytest.mark.parametrize("alphabet,length", [("AB", 1), ("ABC", 3), ("XYZ12", 4)])
+def test_allocate__every_code_once_until_full(alphabet, length):
+    allocator = CodeAllocator(length=length, alphabet=alphabet, reserve_size=7)
+    codes = [allocator.allocate() for _ in range(allocator.capacity)]
+    assert len(set(codes)) == allocator.capacity
+    assert allocator.stats()["occupancy"] == 1.0
+    with pytest.raises(RuntimeError, match="No room codes left"):
+        allocator.allocate()
+
+
+def test_allocate__reuses_freed_codes_at_full_occupancy():
+    allocator = CodeAllocator(length=2, alphabet="ABC", rng=random.Random(1))
+    codes = [allocator.allocate() for _ in range(allocator.capacity)]
+    allocator.free(codes[3])
+    allocator.free(codes[5])
+    assert allocator.stats()["in_use"] == allocator.capacity - 2
+    assert {allocator.allocate(), allocator.allocate()} == {codes[3], codes[5]}
+
+
+def test_allocate__order_depends_on_rng_seed():
+    def first_codes(seed):
+        allocator = CodeAllocator(rng=random.Random(seed))
+        return [allocator.allocate() for _ in range(10)]
+
+    assert first_codes(1) == first_codes(1)
+    assert first_codes(1) != first_codes(2)
+
+
+def test_free__ignores_unknown_and_repeated_codes():
+    allocator = CodeAllocator(length=1, alphabet="AB")
+    code = allocator.allocate()
+    allocator.free("ZZ")
+    allocator.free(code)
+    allocator.free(code)
+    assert allocator.stats()["in_use"] == 0
+    assert sorted([allocator.allocate(), allocator.allocate()]) == ["A", "B"]
+    with pytest.raises(RuntimeError):
+        allocator.allocate()
+
+
+def test_init__rejects_bad_alphabet():
+    with pytest.raises(ValueError):
+        CodeAllocator(alphabet="AA")
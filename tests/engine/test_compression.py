@@ -0,0 +1,56 @@
+import json
+import zlib
+
+from app.engine.compression import (
+    DEFLATED,
+    RAW,
+    CompressionStats,
+    DeflateSettings,
+    FrameCompressor,
+    unwrap,
+)
+
+
+def inflater():
+    return zlib.decompressobj(-zlib.MAX_WBITS)
+
+
+def test_wrap__small_frames_left_uncompressed():
+    compressor = FrameCompressor(DeflateSettings(threshold=64))
+    stats = CompressionStats()
+    frame = compressor.wrap('{"info":"hi"}', stats)
+    assert frame == RAW + b'{"info":"hi"}'
+    assert stats.frames == 1
+    assert stats.compressed_frames == 0
+
+
+def test_wrap__large_frames_compressed_and_round_trip():
+    compressor = FrameCompressor(DeflateSettings(threshold=64))
+    stats = CompressionStats()
+    text = json.dumps({"public_state": {"log": ["pass"] * 200}})
+    client = inflater()
+    for _ in range(3):
+        frame = compressor.wrap(text, stats)
+        assert frame[:1] == DEFLATED
+        assert unwrap(frame, client) == text.encode()
+    assert stats.compressed_frames == 3
+    assert stats.bytes_in == 3 * len(text)
+    assert stats.ratio < 0.5
+
+
+def test_wrap__context_takeover_shrinks_repeated_frames():
+    compressor = FrameCompressor(DeflateSettings(threshold=0, context_takeover=True))
+    client = inflater()
+    frame = json.dumps({"names": {str(i): f"player {i}" for i in range(20)}})
+    first = compressor.wrap(frame)
+    second = compressor.wrap(frame)
+    assert len(second) < len(first)
+    assert unwrap(first, client) == frame.encode()
+    assert unwrap(second, client) == frame.encode()
+    assert unwrap(compressor.wrap(b"\x81\xa1a\x01"), client) == b"\x81\xa1a\x01"
+
+
+def test_stats__as_dict():
+    stats = CompressionStats(frames=2, bytes_in=100, bytes_out=25)
+    assert stats.as_dict()["ratio"] == 0.25
+    assert CompressionStats().ratio == 1.0
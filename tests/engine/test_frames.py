@@ -0,0 +1,96 @@
+import json
+
+import pytest
+
+from app.engine.frames import (
+    CODECS,
+    JSON,
+    encode,
+    extend,
+    negotiate,
+    orjson_dumps,
+    stdlib_dumps,
+    use_json_encoder,
+)
+
+
+@pytest.mark.parametrize(
+    "shared,extra",
+    [
+        ({}, {}),
+        ({}, {"my_slot": 0}),
+        ({"names": {0: "Ann"}, "num_connections": 2}, {}),
+        ({"names": {0: "Ann"}, "num_connections": 2}, {"my_slot": None}),
+        ({"public_state": {"a": [1, 2]}}, {"your_turn": True, "private_state": {}}),
+    ],
+)
+def test_extend__matches_encoding_merged_dict(shared, extra):
+    got = json.loads(extend(encode(shared), extra))
+    want = json.loads(encode({**shared, **extra}))
+    assert got == want
+
+
+def test_encode__compact_and_unicode():
+    assert encode({"name": "Zoë", "n": 1}) == '{"name":"Zoë","n":1}'
+
+
+@pytest.mark.parametrize("size", [0, 3, 15, 16, 70000])
+def test_msgpack_extend__matches_packing_merged_dict(size):
+    msgpack = pytest.importorskip("msgpack")
+    codec = CODECS["roomcode.msgpack"]
+    shared = {f"k{i}": i for i in range(size)}
+    extra = {"my_slot": 1, "private_state": {"available_actions": {}}}
+
+    frame = codec.extend(codec.encode(shared), extra)
+    assert msgpack.unpackb(frame) == {**shared, **extra}
+
+
+def test_negotiate__first_supported_subprotocol():
+    pytest.importorskip("msgpack")
+    codec, chosen = negotiate(["v0.unknown", "roomcode.msgpack", "roomcode.json"])
+    assert chosen == "roomcode.msgpack"
+    assert codec.binary
+
+
+@pytest.mark.parametrize("offered", [[], ["v0.unknown"]])
+def test_negotiate__defaults_to_json(offered):
+    assert negotiate(offered) == (JSON, None)
+
+
+def test_negotiate__deflate_suffix_only_when_allowed():
+    assert negotiate(["roomcode.json+deflate"]) == (JSON, None)
+    assert negotiate(["roomcode.json+deflate"], allow_deflate=True) == (
+        JSON,
+        "roomcode.json+deflate",
+    )
+    assert negotiate(["roomcode.json+gzip"], allow_deflate=True) == (JSON, None)
+
+
+@pytest.mark.parametrize(
+    "message",
+    [
+        {"version": 3, "public_state": {"pass_count": 2}, "final_result": None},
+        {"available_slots": {0: True, 1: False}, "names": {0: "Zoë", 1: None}},
+        {"info": 'quote " and \\ backslash', "n": [1, 2.5, -3], "ok": False},
+    ],
+)
+def test_orjson_dumps__matches_stdlib(message):
+    pytest.importorskip("orjson")
+    assert orjson_dumps(message) == stdlib_dumps(message)
+
+
+def test_orjson_dumps__falls_back_for_big_ints():
+    pytest.importorskip("orjson")
+    assert orjson_dumps({"n": 2**70}) == '{"n":%d}' % 2**70
+
+
+def test_use_json_encoder__swaps_and_restores():
+    previous = use_json_encoder("stdlib")
+    try:
+        assert encode({"a": 1}) == '{"a":1}'
+        use_json_encoder(lambda message: "custom")
+        assert JSON.encode({"a": 1}) == "custom"
+        with pytest.raises(ValueError):
+            use_json_encoder("nope")
+    finally:
+        use_json_encoder(previous)
@@ -0,0 +1,147 @@
+import asyncio
+import json
+
+import pytest
+from fastapi.websockets import WebSocketState
+
+from app.engine.heartbeat import Heartbeat, TimerWheel, is_pong
+
+
+class FakeConnection:
+    client = "test"
+
+    def __init__(self):
+        self.application_state = WebSocketState.CONNECTED
+        self.last_seen = 0.0
+        self.sent = []
+        self.closed_with = None
+
+    async def send_text(self, data):
+        self.sent.append(json.loads(data))
+
+    async def close(self, code=1000):
+        self.closed_with = code
+
+
+def test_wheel__fires_in_order():
+    wheel = TimerWheel(tick=1.0, slots=8, now=0)
+    wheel.schedule("a", 2, now=0)
+    wheel.schedule("b", 5, now=0)
+
+    assert wheel.advance(1.5) == []
+    assert wheel.advance(2.0) == ["a"]
+    assert wheel.advance(4.9) == []
+    assert wheel.advance(5.0) == ["b"]
+    assert len(wheel) == 0
+
+
+def test_wheel__reschedule_and_cancel():
+    wheel = TimerWheel(tick=1.0, slots=8, now=0)
+    wheel.schedule("a", 2, now=0)
+    wheel.schedule("a", 4, now=0)
+    wheel.schedule("b", 3, now=0)
+    wheel.cancel("b")
+    wheel.cancel("missing")
+
+    assert wheel.advance(3) == []
+    assert wheel.advance(4) == ["a"]
+
+
+def test_wheel__stall_longer_than_a_turn():
+    wheel = TimerWheel(tick=1.0, slots=4, now=0)
+    wheel.schedule("a", 1, now=0)
+    wheel.schedule("b", 3, now=0)
+
+    assert sorted(wheel.advance(100)) == ["a", "b"]
+    wheel.schedule("c", 1, now=100)
+    assert wheel.advance(101) == ["c"]
+
+
+def test_wheel__delay_must_fit():
+    wheel = TimerWheel(tick=1.0, slots=4, now=0)
+    with pytest.raises(ValueError):
+        wheel.schedule("a", 4, now=0)
+
+
+def test_wheel__pending_timers_not_visited():
+    wheel = TimerWheel(tick=1.0, slots=64, now=0)
+    for i in range(10000):
+        wheel.schedule(i, 50, now=0)
+    assert wheel.advance(49) == []
+    assert len(wheel.advance(50)) == 10000
+
+
+def test_is_pong():
+    assert is_pong({"action": "pong"})
+    assert not is_pong({"action": "take_turn"})
+    assert not is_pong([1, 2])
+
+
+async def test_heartbeat__pings_quiet_connection_then_evicts():
+    heartbeat = Heartbeat(interval=10, timeout=30, now=0)
+    conn = FakeConnection()
+    heartbeat.watch(conn, now=0)
+
+    await heartbeat.beat(now=10)
+    assert conn.sent == [{"ping": 1}]
+    await heartbeat.beat(now=20)
+    assert conn.sent == [{"ping": 1}, {"ping": 2}]
+
+    await heartbeat.beat(now=30)
+    await asyncio.sleep(0.01)
+    assert conn.closed_with == 1001
+    assert heartbeat.evicted == 1
+    assert len(heartbeat.wheel) == 0
+
+
+async def test_heartbeat__activity_postpones_ping():
+    heartbeat = Heartbeat(interval=10, timeout=30, now=0)
+    conn = FakeConnection()
+    heartbeat.watch(conn, now=0)
+
+    conn.last_seen = 8  # e.g. a pong or any action
+    await heartbeat.beat(now=10)
+    assert conn.sent == []
+    await heartbeat.beat(now=18)
+    assert conn.sent == [{"ping": 1}]
+
+    conn.last_seen = 19
+    await heartbeat.beat(now=47)
+    assert conn.closed_with is None
+    assert heartbeat.evicted == 0
+
+
+async def test_heartbeat__evicts_closed_socket():
+    heartbeat = Heartbeat(interval=10, timeout=30, now=0)
+    conn = FakeConnection()
+    heartbeat.watch(conn, now=0)
+    conn.application_state = WebSocketState.DISCONNECTED
+
+    await heartbeat.beat(now=10)
+    await asyncio.sleep(0.01)
+    assert conn.sent == []
+    assert conn.closed_with == 1001
+
+
+async def test_heartbeat__forget():
+    heartbeat = Heartbeat(interval=10, timeout=30, now=0)
+    conn = FakeConnection()
+    heartbeat.watch(conn, now=0)
+    heartbeat.forget(conn)
+
+    await heartbeat.beat(now=100)
+    assert conn.sent == []
+
+
+async def test_heartbeat__stuck_connection_holds_up_no_pings():
+    class StuckConnection(FakeConnection):
+        async def send_text(self, data):
+            await asyncio.sleep(60)
+
+    heartbeat = Heartbeat(interval=10, timeout=30, now=0)
+    stuck, conn = StuckConnection(), FakeConnection()
+    heartbeat.watch(stuck, now=0)
+    heartbeat.watch(conn, now=0)
+
+    await asyncio.wait_for(heartbeat.beat(now=10), 0.05)
+    assert [list(message) for message in conn.sent] == [["ping"]]
@@ -0,0 +1,64 @@
+import pytest
+
+from app.engine.action_handlers import ACTION_SECONDS, handle_ws_message
+from app.engine.metrics import Counter, Gauge, Histogram, Registry
+from app.engine.room import FRAMES_SENT
+
+
+def test_render__counter_and_gauge():
+    registry = Registry()
+    counter = Counter("things", "Things seen", ["kind"], registry=registry)
+    counter.inc(1, "a")
+    counter.inc(2, "a")
+    counter.inc(1, 'say "hi"')
+    Gauge("level", "Current level", registry=registry, function=lambda: 0.5)
+
+    assert registry.render() == (
+        "# HELP things Things seen\n"
+        "# TYPE things counter\n"
+        'things_total{kind="a"} 3\n'
+        'things_total{kind="say \\"hi\\""} 1\n'
+        "# HELP level Current level\n"
+        "# TYPE level gauge\n"
+        "level 0.5\n"
+    )
+
+
+def test_render__histogram_buckets_cumulative():
+    registry = Registry()
+    histogram = Histogram("wait", "Waits", ["op"], registry=registry, buckets=[1, 5])
+    for value in (0.5, 1, 3, 10):
+        histogram.observe(value, "x")
+
+    assert registry.render().splitlines()[2:] == [
+        'wait_bucket{op="x",le="1"} 2',
+        'wait_bucket{op="x",le="5"} 3',
+        'wait_bucket{op="x",le="+Inf"} 4',
+        'wait_sum{op="x"} 14.5',
+        'wait_count{op="x"} 4',
+    ]
+
+
+def test_register__duplicate_name_rejected():
+    registry = Registry()
+    Gauge("level", "Current level", registry=registry)
+    with pytest.raises(ValueError):
+        Gauge("level", "Current level", registry=registry)
+
+
+async def test_handle_ws_message__records_latency_and_frames(trivial_room, websocket):
+    trivial_room.game.players[0].set_client_id("FOO")
+    trivial_room["FOO"] = websocket
+    before = sum(ACTION_SECONDS.labels("take_turn").counts)
+    sent_before = FRAMES_SENT._values.get(("state",), 0)
+
+    await handle_ws_message(
+        dict(
+            ws=websocket,
+            room=trivial_room,
+            client_id="FOO",
+            data={"action": "take_turn", "turn": {}},
+        )
+    )
+    assert sum(ACTION_SECONDS.labels("take_turn").counts) == before + 1
+    assert FRAMES_SENT._values[("state",)] == sent_before + 1
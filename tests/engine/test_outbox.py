@@ -0,0 +1,122 @@
+import asyncio
+
+from app.engine.outbox import CLOSE_TOO_SLOW, INFO, STATE, URGENT, Outbox
+
+
+class GatedWebSocket:
+    """Writes only complete while the gate is open."""
+
+    def __init__(self):
+        self.gate = asyncio.Event()
+        self.gate.set()
+        self.sent = []
+        self.closed_with = None
+
+    async def send_text(self, data):
+        await self.gate.wait()
+        self.sent.append(data)
+
+    async def close(self, code=1000):
+        self.closed_with = code
+
+
+async def start_blocked_write(outbox, ws):
+    ws.gate.clear()
+    assert outbox.send("first")
+    await asyncio.sleep(0)
+
+
+async def test_send__writer_writes_without_sender_waiting():
+    ws = GatedWebSocket()
+    outbox = Outbox(ws)
+    assert outbox.send("hello")
+    assert ws.sent == []
+    await outbox.drain()
+    assert ws.sent == ["hello"]
+    assert len(outbox) == 0
+
+
+async def test_send__queued_frames_written_by_lane():
+    ws = GatedWebSocket()
+    outbox = Outbox(ws)
+    await start_blocked_write(outbox, ws)
+
+    assert outbox.send("info 1", INFO)
+    assert outbox.send("state 1", STATE)
+    assert outbox.send("error", URGENT)
+    assert outbox.send("state 2", STATE)
+    assert outbox.send("info 2", INFO)
+    assert len(outbox) == 4
+    assert outbox.queued_bytes == len("info 1state 2errorinfo 2")
+
+    ws.gate.set()
+    await outbox.drain()
+    assert ws.sent == ["first", "error", "state 2", "info 1", "info 2"]
+    assert outbox.queued_bytes == 0
+
+
+async def test_send__closed_when_far_over_limit():
+    ws = GatedWebSocket()
+    closed = []
+    outbox = Outbox(ws, max_bytes=10, on_close=lambda: closed.append(True))
+    await start_blocked_write(outbox, ws)
+
+    assert outbox.send("x" * 15)
+    assert not outbox.send("x" * 10)
+    await asyncio.sleep(0.01)
+    assert ws.closed_with == CLOSE_TOO_SLOW
+    assert closed == [True]
+    assert outbox.queued_bytes == 0
+    assert not outbox.send("late")
+
+
+async def test_send__closed_when_over_limit_too_long():
+    ws = GatedWebSocket()
+    outbox = Outbox(ws, max_bytes=10, overflow_grace=0.02)
+    await start_blocked_write(outbox, ws)
+
+    assert outbox.send("x" * 15)
+    await asyncio.sleep(0.03)
+    assert not outbox.send("x")
+    await asyncio.sleep(0.01)
+    assert ws.closed_with == CLOSE_TOO_SLOW
+
+
+async def test_send__superseded_state_frees_room():
+    ws = GatedWebSocket()
+    outbox = Outbox(ws, max_bytes=10, overflow_grace=0)
+    await start_blocked_write(outbox, ws)
+
+    for _ in range(5):
+        assert outbox.send("x" * 8, STATE)
+    assert outbox.queued_bytes == 8
+    ws.gate.set()
+    await outbox.drain()
+
+
+async def test_writer__stuck_write_closes_connection():
+    ws = GatedWebSocket()
+    closed = []
+    outbox = Outbox(ws, send_timeout=0.02, on_close=lambda: closed.append(True))
+    await start_blocked_write(outbox, ws)
+    outbox.send("queued")
+
+    await asyncio.sleep(0.05)
+    assert ws.closed_with == 1011
+    assert outbox.closed
+    assert closed == [True]
+    assert ws.sent == []
+
+
+async def test_close__after_queued_frames():
+    ws = GatedWebSocket()
+    outbox = Outbox(ws)
+    await start_blocked_write(outbox, ws)
+    outbox.send("error", URGENT)
+    outbox.close(1000)
+    assert not outbox.send("late")
+
+    ws.gate.set()
+    await outbox.drain()
+    assert ws.sent == ["first", "error"]
+    assert ws.closed_with == 1000
@@ -0,0 +1,53 @@
+from app.engine.reaper import RoomReaper
+from app.engine.room import Room
+from tests.conftest import TrivialGame
+
+
+def make_rooms(*codes):
+    return {code: Room(code, TrivialGame(1)) for code in codes}
+
+
+def test_reap__empty_room_kept_during_grace_period():
+    rooms = make_rooms("AAAA")
+    reaper = RoomReaper(rooms, empty_grace=60, idle_ttl=600)
+    now = rooms["AAAA"].last_activity
+
+    assert reaper.reap(now + 59) == []
+    assert "AAAA" in rooms
+
+
+def test_reap__empty_room_evicted_after_grace_period():
+    evicted = []
+    rooms = make_rooms("AAAA", "BBBB")
+    reaper = RoomReaper(rooms, empty_grace=60, idle_ttl=600, on_evict=evicted.append)
+    rooms["BBBB"]["FOO"] = object()
+    now = rooms["AAAA"].last_activity
+
+    assert reaper.reap(now + 61) == ["AAAA"]
+    assert list(rooms) == ["BBBB"]
+    assert evicted == ["AAAA"]
+    assert reaper.stats() == {"rooms": 1, "evicted_empty": 1, "evicted_idle": 0}
+
+
+async def test_reap__idle_room_with_connections_evicted_after_ttl(websocket):
+    rooms = make_rooms("AAAA")
+    room = rooms["AAAA"]
+    room["FOO"] = websocket
+    reaper = RoomReaper(rooms, empty_grace=60, idle_ttl=600)
+
+    assert reaper.reap(room.last_activity + 599) == []
+    assert reaper.reap(room.last_activity + 601) == ["AAAA"]
+    assert not rooms
+    assert not room
+    assert reaper.stats() == {"rooms": 0, "evicted_empty": 0, "evicted_idle": 1}
+
+
+def test_reap__activity_resets_idle_clock():
+    rooms = make_rooms("AAAA")
+    room = rooms["AAAA"]
+    reaper = RoomReaper(rooms, empty_grace=60, idle_ttl=600)
+    created = room.last_activity
+
+    room.touch()
+    assert reaper.reap(created + 30) == []
+    assert reaper.reap(room.last_activity + 61) == ["AAAA"]
@@ -0,0 +1,31 @@
+from app.engine.resume import ResumeTokens
+
+tokens = ResumeTokens(b"secret", ttl=60)
+
+
+def test_verify__round_trip():
+    token = tokens.issue("ABCD", "c1", now=1000)
+    assert tokens.verify(token, "ABCD", now=1059) == "c1"
+
+
+def test_verify__other_room():
+    assert tokens.verify(tokens.issue("ABCD", "c1"), "WXYZ") is None
+
+
+def test_verify__expired():
+    token = tokens.issue("ABCD", "c1", now=1000)
+    assert tokens.verify(token, "ABCD", now=1061) is None
+
+
+def test_verify__other_secret():
+    token = ResumeTokens(b"other").issue("ABCD", "c1")
+    assert tokens.verify(token, "ABCD") is None
+
+
+def test_verify__tampered():
+    other = tokens.issue("ABCD", "c2")
+    token = tokens.issue("ABCD", "c1")
+    forged = other.split(".")[0] + "." + token.split(".")[1]
+    assert tokens.verify(forged, "ABCD") is None
+    for junk in ("", "abc", "a.b.c", "!!!.???"):
+        assert tokens.verify(junk, "ABCD") is None
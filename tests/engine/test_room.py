@@ -1,6 +1,17 @@
+import asyncio
+import json
+import zlib
+from typing import List, Optional
+from unittest.mock import patch
+
 import pytest
 from fastapi.websockets import WebSocketState
 
+from app.engine.compression import DeflateSettings, FrameCompressor, unwrap
+from app.engine.frames import CODECS
+from app.engine.room import Room
+from tests.conftest import FakeWebSocket, TrivialGame
+
 
 def test_room(trivial_room):
     room = trivial_room
@@ -24,3 +35,499 @@ async def test_send_game_state__connected_websocket_only(
     await trivial_room.send_game_state()
     msgs = websocket.sent_messages
     assert len(msgs) == want_msg_count
+
+
+class StuckWebSocket:
+    application_state = WebSocketState.CONNECTED
+
+    def __init__(self):
+        self.closed = False
+
+    async def send_text(self, data):
+        await asyncio.sleep(60)
+
+    async def close(self, code=1000):
+        self.closed = True
+
+
+class BrokenWebSocket:
+    application_state = WebSocketState.CONNECTED
+
+    async def send_text(self, data):
+        raise RuntimeError("connection reset")
+
+
+async def test_broadcast__stuck_client_dropped_others_delivered(
+    trivial_room, websocket
+):
+    trivial_room.send_timeout = 0.05
+    stuck = StuckWebSocket()
+    trivial_room["STUCK"] = stuck
+    trivial_room["FOO"] = websocket
+
+    # the broadcast doesn't wait for the stuck client
+    await asyncio.wait_for(trivial_room.broadcast({"info": "hello"}), 0.02)
+    assert websocket.sent_messages == [{"info": "hello"}]
+
+    await asyncio.sleep(0.1)
+    assert "STUCK" not in trivial_room
+    assert "FOO" in trivial_room
+    assert stuck.closed
+
+
+async def test_send_game_state__broken_client_dropped(trivial_room, websocket):
+    trivial_room["BROKEN"] = BrokenWebSocket()
+    trivial_room["FOO"] = websocket
+
+    await trivial_room.send_game_state()
+    assert len(websocket.sent_messages) == 1
+    assert list(trivial_room.keys()) == ["FOO"]
+
+
+def test_slots_by_client__tracks_seat_changes():
+    room = Room("ABC123", TrivialGame(3))
+    players = room.game.players
+    assert room.slots_by_client() == {}
+
+    players[0].set_client_id("foo")
+    players[2].client_id = "bar"
+    assert room.slots_by_client() == {"foo": 0, "bar": 2}
+    assert room.slot_of("bar") == 2
+
+    players[0].set_client_id(None)
+    assert room.slots_by_client() == {"bar": 2}
+    assert room.slot_of("foo") is None
+
+
+def test_slots_by_client__indexes_players_seated_before_room():
+    game = TrivialGame(2)
+    game.players[1].client_id = "foo"
+    room = Room("ABC123", game)
+    assert room.slot_of("foo") == 1
+
+
+def test_slot_payloads__cached_until_player_changes():
+    room = Room("ABC123", TrivialGame(2))
+    available = room.slot_availability()
+    names = room.player_names()
+    assert room.slot_availability() is available
+    assert room.player_names() is names
+
+    room.game.players[0].set_client_id("foo")
+    assert room.slot_availability() == {0: False, 1: True}
+    assert room.player_names() == {0: "Player 0", 1: None}
+
+    room.game.players[0].set_display_name("Ann")
+    assert room.player_names() == {0: "Ann", 1: None}
+
+
+async def test_submit__applies_actions_one_at_a_time_in_order(trivial_room):
+    events = []
+
+    def make_handler(name):
+        async def handler(ctx):
+            events.append(f"{name} start")
+            await asyncio.sleep(0)
+            events.append(f"{name} end")
+
+        return handler
+
+    await asyncio.gather(
+        *(trivial_room.submit(make_handler(name), {}) for name in "abc")
+    )
+    assert events == ["a start", "a end", "b start", "b end", "c start", "c end"]
+
+
+async def test_submit__batch_publishes_state_once(trivial_room, websocket):
+    trivial_room["FOO"] = websocket
+
+    async def handler(ctx):
+        await trivial_room.send_game_state()
+
+    await asyncio.gather(*(trivial_room.submit(handler, {}) for _ in range(3)))
+    assert len(websocket.sent_messages) == 1
+    assert "public_state" in websocket.sent_messages[0]
+
+
+async def test_submit__reraises_handler_error(trivial_room):
+    async def handler(ctx):
+        raise ValueError("foo")
+
+    with pytest.raises(ValueError, match="foo"):
+        await trivial_room.submit(handler, {})
+
+
+class CountingGame(TrivialGame):
+    def __init__(self, players: int):
+        super().__init__(players)
+        self._count = 0
+
+    @property
+    def count(self) -> int:
+        return self._count
+
+    @count.setter
+    def count(self, count: int) -> None:
+        # changed outside submit_action(), so say so
+        self._count = count
+        self.state_changed()
+
+    def get_public_state(self) -> dict:
+        return {"count": self.count, "label": "x" * 200}
+
+
+class BoardGame(TrivialGame):
+    def __init__(self, players: int):
+        super().__init__(players)
+        self.board: List[str] = []
+
+    def get_public_state(self) -> dict:
+        return {"board": self.board, "label": "x" * 200}
+
+    def submit_action(
+        self, client_id: str, action: dict, force_turn_for_client: Optional[str] = None
+    ) -> None:
+        self.board.append(action["card"])
+
+
+async def test_send_game_state__full_snapshot_until_acked(websocket):
+    room = Room("ABC123", CountingGame(1))
+    room["FOO"] = websocket
+
+    await room.send_game_state()
+    await room.send_game_state()
+    first, second = websocket.sent_messages
+    assert first["version"] == second["version"] == 1
+    assert second["public_state"] == {"count": 0, "label": "x" * 200}
+    assert "patch" not in second
+
+
+async def test_send_game_state__patch_against_acked_version(websocket):
+    room = Room("ABC123", CountingGame(1))
+    room["FOO"] = websocket
+    await room.send_game_state()
+    snapshot = websocket.sent_messages[-1]
+    assert room.ack_state("FOO", snapshot["version"])
+
+    room.game.count = 1
+    await room.send_game_state()
+    msg = websocket.sent_messages[-1]
+    assert msg["version"] == 2
+    assert msg["base_version"] == 1
+    assert msg["patch"] == [
+        {"op": "replace", "path": "/public_state/count", "value": 1}
+    ]
+    assert "public_state" not in msg
+    assert "private_state" in msg
+
+
+async def test_send_game_state__snapshot_when_too_far_behind(websocket):
+    room = Room("ABC123", CountingGame(1))
+    room.state_history = 2
+    room["FOO"] = websocket
+    await room.send_game_state()
+    room.ack_state("FOO", 1)
+
+    for count in range(1, 4):
+        room.game.count = count
+        await room.send_game_state()
+    msg = websocket.sent_messages[-1]
+    assert msg["version"] == 4
+    assert "patch" not in msg
+    assert msg["public_state"]["count"] == 3
+
+
+def test_ack_state__unknown_version_rejected(trivial_room, websocket):
+    trivial_room["FOO"] = websocket
+    assert not trivial_room.ack_state("FOO", 1)
+    assert not trivial_room.ack_state("BAR", 0)
+
+
+async def test_submit__coalesces_slot_and_state_frames(websocket):
+    room = Room("ABC123", TrivialGame(2))
+    room["FOO"] = websocket
+
+    async def handler(ctx):
+        await room.claim_slot(0, "FOO")
+        await room.broadcast_slots()
+        await room.send_game_state()
+        await room.claim_slot(1, "BAR")
+        await room.send_game_state()
+
+    await room.submit(handler, {})
+    slots, state = websocket.sent_messages
+    assert slots["available_slots"] == {"0": False, "1": False}
+    assert slots["my_slot"] == 0
+    assert "public_state" in state
+
+
+async def test_submit__info_flushes_pending_frames_first(websocket):
+    room = Room("ABC123", TrivialGame(1))
+    room["FOO"] = websocket
+
+    async def handler(ctx):
+        await room.claim_slot(0, "FOO")
+        await room.broadcast({"info": "hello"})
+        await room.send(websocket, {"error": "oops"})
+        await room.send_game_state()
+
+    await room.submit(handler, {})
+    msgs = websocket.sent_messages
+    assert [next(iter(msg)) for msg in msgs] == [
+        "num_connections",
+        "info",
+        "error",
+        "version",
+    ]
+
+
+async def test_submit__window_shares_broadcast_across_actions(websocket):
+    room = Room("ABC123", TrivialGame(1))
+    room.coalesce_window = 0.05
+    room["FOO"] = websocket
+
+    async def handler(ctx):
+        await room.send_game_state()
+
+    async def late_submit():
+        await asyncio.sleep(0.01)
+        await room.submit(handler, {})
+
+    await asyncio.gather(room.submit(handler, {}), late_submit())
+    assert len(websocket.sent_messages) == 1
+
+
+class MsgpackWebSocket(FakeWebSocket):
+    def __init__(self):
+        super().__init__()
+        self.codec = CODECS["roomcode.msgpack"]
+
+    async def send_bytes(self, data):
+        self.sent_messages.append(self.codec.decode(data))
+
+
+async def test_broadcast__mixed_codecs_share_room(trivial_room, websocket):
+    pytest.importorskip("msgpack")
+    binary_ws = MsgpackWebSocket()
+    trivial_room["FOO"] = websocket
+    trivial_room["BAR"] = binary_ws
+    trivial_room.game.players[0].client_id = "BAR"
+
+    await trivial_room.broadcast({"info": "hello"})
+    await trivial_room.broadcast_slots()
+    await trivial_room.send_game_state()
+
+    json_msgs, binary_msgs = websocket.sent_messages, binary_ws.sent_messages
+    assert json_msgs[0] == binary_msgs[0] == {"info": "hello"}
+    assert json_msgs[1]["my_slot"] is None
+    assert binary_msgs[1]["my_slot"] == 0
+    assert binary_msgs[1]["available_slots"] == {0: False}
+    assert binary_msgs[2]["your_turn"] is True
+    assert json_msgs[2]["public_state"] == binary_msgs[2]["public_state"]
+
+
+class DeflateWebSocket(FakeWebSocket):
+    def __init__(self):
+        super().__init__()
+        self.compressor = FrameCompressor(DeflateSettings(threshold=32))
+        self.inflater = zlib.decompressobj(-zlib.MAX_WBITS)
+
+    async def send_bytes(self, data):
+        self.sent_messages.append(json.loads(unwrap(data, self.inflater)))
+
+
+async def test_broadcast__compression_stats_per_room(trivial_room, websocket):
+    compressed = DeflateWebSocket()
+    trivial_room["FOO"] = websocket
+    trivial_room["BAR"] = compressed
+
+    await trivial_room.broadcast({"info": "hi"})
+    await trivial_room.broadcast({"info": "x" * 500})
+    assert compressed.sent_messages == [{"info": "hi"}, {"info": "x" * 500}]
+    assert websocket.sent_messages == compressed.sent_messages
+    stats = trivial_room.compression
+    assert stats.frames == 2
+    assert stats.compressed_frames == 1
+    assert stats.bytes_out < stats.bytes_in
+
+
+async def test_hold__keeps_seat_until_grace_ends(trivial_room, websocket):
+    left = []
+
+    async def leave():
+        left.append(True)
+
+    trivial_room["FOO"] = websocket
+    await trivial_room.claim_slot(0, "FOO")
+    trivial_room.hold("FOO", 0.01, leave)
+    assert "FOO" not in trivial_room
+    assert trivial_room.slot_of("FOO") == 0
+    assert trivial_room.held_count() == 1
+
+    await asyncio.sleep(0.05)
+    assert left == [True]
+    assert trivial_room.held_count() == 0
+    assert not trivial_room.unhold("FOO")
+
+
+async def test_unhold__cancels_leave(trivial_room, websocket):
+    left = []
+
+    async def leave():
+        left.append(True)
+
+    trivial_room["FOO"] = websocket
+    trivial_room.hold("FOO", 0.01, leave)
+    assert trivial_room.unhold("FOO")
+    await asyncio.sleep(0.05)
+    assert left == []
+
+
+async def test_send_game_state_to__one_client_only(websocket):
+    room = Room("ABC123", CountingGame(1))
+    other = FakeWebSocket()
+    room["FOO"], room["BAR"] = websocket, other
+    await room.send_game_state_to("FOO")
+    assert len(websocket.sent_messages) == 1
+    assert other.sent_messages == []
+
+
+async def test_send_game_state__drops_disconnected_socket(trivial_room, websocket):
+    websocket.application_state = WebSocketState.DISCONNECTED
+    trivial_room["FOO"] = websocket
+    await trivial_room.send_game_state()
+    assert "FOO" not in trivial_room
+
+
+def watched(frame):
+    lines = frame.decode().splitlines()
+    fields = dict(line.split(": ", 1) for line in lines if line)
+    return fields["id"], fields["event"], json.loads(fields["data"])
+
+
+async def test_watch__starts_at_current_state(websocket):
+    room = Room("ABC123", CountingGame(1))
+    watcher = room.watch()
+    version, event, data = watched(await watcher.next())
+    assert (version, event) == ("1", "state")
+    assert data["public_state"]["count"] == 0
+    assert data["names"] == {"0": None}
+    assert "private_state" not in data
+
+
+async def test_watch__one_frame_shared_per_state(websocket):
+    room = Room("ABC123", CountingGame(1))
+    room["FOO"] = websocket
+    first, second = room.watch(), room.watch()
+    await first.next(), await second.next()
+
+    room.game.count += 1
+    await room.send_game_state()
+    frame = await first.next()
+    assert frame is await second.next()
+    assert watched(frame)[2]["public_state"]["count"] == 1
+
+    # nothing new for watchers when slots are republished unchanged
+    await room.broadcast_slots()
+    assert not first._ready.is_set()
+
+
+async def test_watch__close_and_unwatch(trivial_room):
+    kept, dropped = trivial_room.watch(), trivial_room.watch()
+    trivial_room.unwatch(dropped)
+    trivial_room.close()
+    assert await kept.next() is None
+    assert await kept.next() is None
+    assert not trivial_room.watchers
+
+
+async def test_send_game_state__public_state_built_once_per_version(websocket):
+    game = CountingGame(1)
+    room = Room("ABC123", game)
+    room["FOO"] = websocket
+    with patch.object(
+        CountingGame, "get_public_state", wraps=game.get_public_state
+    ) as built:
+        await room.send_game_state()
+        await room.send_game_state()
+        room.watch()
+        assert built.call_count == 1
+
+        game.count = 1
+        await room.send_game_state()
+        assert built.call_count == 2
+
+
+async def test_send__stuck_client_never_blocks_room(trivial_room):
+    trivial_room.send_timeout = 0.05
+    stuck = StuckWebSocket()
+    trivial_room["STUCK"] = stuck
+
+    for _ in range(3):
+        await asyncio.wait_for(trivial_room.send(stuck, {"error": "Nope"}), 0.02)
+    await asyncio.sleep(0.1)
+    assert "STUCK" not in trivial_room
+    assert stuck.closed
+
+
+class SlowWebSocket(FakeWebSocket):
+    async def send_text(self, data):
+        await asyncio.sleep(0.2)
+        await super().send_text(data)
+
+
+async def test_broadcast__slow_client_does_not_pace_room(trivial_room, websocket):
+    slow = SlowWebSocket()
+    trivial_room["SLOW"] = slow
+    trivial_room["FOO"] = websocket
+
+    await asyncio.wait_for(trivial_room.broadcast({"info": "one"}), 0.05)
+    await asyncio.wait_for(trivial_room.broadcast({"info": "two"}), 0.05)
+    assert websocket.sent_messages == [{"info": "one"}, {"info": "two"}]
+    assert slow.sent_messages == []
+
+    await trivial_room.outbox(slow).drain()
+    assert slow.sent_messages == [{"info": "one"}, {"info": "two"}]
+    assert "SLOW" in trivial_room
+
+
+class SeatingGame(TrivialGame):
+    def get_public_state(self) -> dict:
+        return {
+            "seats": [
+                (player.display_name, player.client_id is not None)
+                for player in self.players.values()
+            ]
+        }
+
+
+async def test_send_game_state__reflects_seat_and_name_changes(websocket):
+    room = Room("ABC123", SeatingGame(1))
+    room["FOO"] = websocket
+    await room.send_game_state()
+
+    room.game.players[0].set_client_id("FOO")
+    await room.send_game_state()
+    room.game.players[0].set_display_name("Zed")
+    await room.send_game_state()
+    states = [m["public_state"]["seats"] for m in websocket.sent_messages]
+    assert states == [
+        [["Player 0", False]],
+        [["Player 0", True]],
+        [["Zed", True]],
+    ]
+
+
+async def test_send_game_state__sees_changes_to_a_live_public_field(websocket):
+    room = Room("ABC123", BoardGame(1))
+    room["FOO"] = websocket
+    await room.send_game_state()
+    assert room.ack_state("FOO", websocket.sent_messages[-1]["version"])
+
+    room.game.submit_action("FOO", {"card": "Ah"})
+    await room.send_game_state()
+    msg = websocket.sent_messages[-1]
+    assert msg["version"] == 2
+    assert msg["patch"] == [
+        {"op": "replace", "path": "/public_state/board", "value": ["Ah"]}
+    ]
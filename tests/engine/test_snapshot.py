@@ -0,0 +1,112 @@
+import os
+import time
+
+import pytest
+
+from app.engine.room import Room
+from app.engine.snapshot import SnapshotStore, restore_room, snapshot_room
+from tests.conftest import TrivialGame
+
+GAME_TYPES = {"trivial": TrivialGame}
+
+
+def make_room(code):
+    game = TrivialGame(2)
+    game.players[1].set_display_name("Bob")
+    game.is_started = True
+    game.current_index = 1
+    room = Room(code, game)
+    room.state_version = 7
+    return room
+
+
+def test_restore_room__round_trip():
+    room = restore_room(
+        "AAAA", snapshot_room(make_room("AAAA"), GAME_TYPES), GAME_TYPES
+    )
+
+    assert room.code == "AAAA"
+    assert room.state_version == 7
+    assert isinstance(room.game, TrivialGame)
+    assert room.game.is_started and room.game.current_index == 1
+    assert [p.display_name for p in room.game.players.values()] == ["Player 0", "Bob"]
+    assert all(p.client_id is None for p in room.game.players.values())
+    assert room.game.manager is None
+
+
+def test_snapshot_store__rooms_taken_once(tmp_path):
+    path = str(tmp_path / "snapshot")
+    SnapshotStore(path).write(
+        [
+            (code, snapshot_room(make_room(code), GAME_TYPES))
+            for code in ("AAAA", "BBBB")
+        ]
+    )
+
+    store = SnapshotStore(path)
+    assert store.open() == ["AAAA", "BBBB"]
+    assert "AAAA" in store and len(store) == 2
+
+    payload = store.take("AAAA")
+    assert payload is not None
+    assert restore_room("AAAA", payload, GAME_TYPES).game.current_index == 1
+    assert store.take("AAAA") is None
+    assert [code for code, _ in store.remaining()] == ["BBBB"]
+    store.close()
+
+
+def test_snapshot_store__remaining_rooms_kept_on_next_write(tmp_path):
+    path = str(tmp_path / "snapshot")
+    SnapshotStore(path).write([("AAAA", b"{}"), ("BBBB", b"[]")])
+
+    store = SnapshotStore(path)
+    store.open()
+    store.take("AAAA")
+    store.write([("CCCC", b"1")] + list(store.remaining()))
+
+    store = SnapshotStore(path)
+    assert store.open() == ["CCCC", "BBBB"]
+    assert store.take("BBBB") == b"[]"
+
+
+def test_snapshot_store__failed_write_keeps_old_snapshot(tmp_path):
+    path = str(tmp_path / "snapshot")
+    SnapshotStore(path).write([("AAAA", b"{}")])
+
+    def records():
+        yield "BBBB", b"[]"
+        raise RuntimeError("room broke")
+
+    with pytest.raises(RuntimeError):
+        SnapshotStore(path).write(records())
+    assert os.listdir(tmp_path) == ["snapshot"]
+    assert SnapshotStore(path).open() == ["AAAA"]
+
+
+def test_snapshot_store__missing_file(tmp_path):
+    assert SnapshotStore(str(tmp_path / "nothing")).open() == []
+
+
+def test_snapshot_store__old_snapshot_ignored(tmp_path):
+    path = str(tmp_path / "snapshot")
+    SnapshotStore(path).write([("AAAA", b"{}")])
+    old = time.time() - 120
+    os.utime(path, (old, old))
+
+    assert SnapshotStore(path, max_age=60).open() == ["AAAA"]  # age is in the file
+    assert SnapshotStore(path, max_age=-1).open() == []
+
+
+def test_snapshot_store__corrupt_snapshot_ignored(tmp_path):
+    path = str(tmp_path / "snapshot")
+    SnapshotStore(path).write([("AAAA", b"{}")])
+    with open(path, "rb") as f:
+        data = f.read()
+
+    with open(path, "wb") as f:
+        f.write(data[:-1])
+    assert SnapshotStore(path).open() == []
+
+    with open(path, "wb") as f:
+        f.write(b"not a snapshot")
+    assert SnapshotStore(path).open() == []
@@ -0,0 +1,45 @@
+import json
+
+import pytest
+
+from app.engine.state_diff import apply_patch, copy_view, diff
+
+
+@pytest.mark.parametrize(
+    "old,new",
+    [
+        ({}, {}),
+        ({"a": 1}, {"a": 2}),
+        ({"a": 1}, {"b": 1}),
+        ({"a": {"b": [1, 2]}}, {"a": {"b": [1, 2, 3]}}),
+        ({"a": True}, {"a": 1}),
+        ({"a/b": {"c~d": 0}}, {"a/b": {"c~d": 1}}),
+        ({"a": None}, {"a": {"b": 1}}),
+        ([1], {"a": 1}),
+    ],
+)
+def test_diff__apply_round_trips(old, new):
+    patch = json.loads(json.dumps(diff(old, new)))
+    assert apply_patch(old, patch) == new
+
+
+def test_diff__unchanged_is_empty():
+    state = {"public_state": {"pass_count": 1}, "is_over": False}
+    assert diff(state, json.loads(json.dumps(state))) == []
+
+
+def test_diff__only_changed_leaves():
+    old = {"public_state": {"pass_count": 1, "current_holder_index": 0}}
+    new = {"public_state": {"pass_count": 2, "current_holder_index": 0}}
+    assert diff(old, new) == [
+        {"op": "replace", "path": "/public_state/pass_count", "value": 2}
+    ]
+
+
+def test_copy_view__shares_no_containers():
+    state = {"board": ["Ah"], "pair": ([1], "x"), "n": 1}
+    copied = copy_view(state)
+    assert copied == state
+    state["board"].append("Kd")
+    state["pair"][0].append(2)
+    assert copied == {"board": ["Ah"], "pair": ([1], "x"), "n": 1}
@@ -0,0 +1,48 @@
+import asyncio
+
+from app.engine.watch import KEEPALIVE, Watcher, stream
+
+
+async def test_watcher__keeps_only_latest_frame():
+    watcher = Watcher()
+    watcher.offer(b"one")
+    watcher.offer(b"two")
+    assert await watcher.next() == b"two"
+
+    watcher.offer(b"three")
+    assert await watcher.next() == b"three"
+
+
+async def test_watcher__close_ends_stream():
+    watcher = Watcher()
+    watcher.offer(b"one")
+    frames = []
+
+    async def consume():
+        async for frame in stream(watcher):
+            frames.append(frame)
+
+    task = asyncio.ensure_future(consume())
+    await asyncio.sleep(0.01)
+    watcher.close()
+    await asyncio.wait_for(task, 1)
+    assert frames == [b"one"]
+
+
+async def test_stream__caps_frame_rate():
+    watcher = Watcher()
+    watcher.offer(b"one")
+    frames = stream(watcher, min_interval=0.05)
+    assert await frames.__anext__() == b"one"
+
+    # offered while the stream waits out the interval; only the last is sent
+    for frame in [b"two", b"three", b"four"]:
+        watcher.offer(frame)
+    assert await frames.__anext__() == b"four"
+    await frames.aclose()
+
+
+async def test_stream__keepalive_when_quiet():
+    frames = stream(Watcher(), keepalive=0.01)
+    assert await frames.__anext__() == KEEPALIVE
+    await frames.aclose()
@@ -4,7 +4,7 @@ import pytest
 from fastapi import status
 from httpx import ASGITransport, AsyncClient
 
-from app.api import generate_code, rooms
+from app.api import code_allocator, rooms, watch_game
 from app.main import fastapi_app as app
 
 
@@ -13,12 +13,6 @@ def async_client():
     return AsyncClient(transport=ASGITransport(app=app), base_url="http://test")
 
 
-@pytest.mark.parametrize("length", [1, 2, 3, 4, 5])
-def test_generate_code__creates_codes_of_length(length):
-    code = generate_code(length)
-    assert len(code) == length
-
-
 @pytest.mark.asyncio
 async def test_create_game_success(async_client):
     async with async_client as ac:
@@ -47,8 +41,8 @@ async def test_create_game_invalid_type(async_client):
 @pytest.mark.asyncio
 async def test_create_game_code_collision(async_client):
     # first two calls return "DUCK" and third returns "GRAY"
-    with patch(
-        "app.api.generate_code", side_effect=["DUCK", "DUCK", "GRAY", "DUCK"]
+    with patch.object(
+        code_allocator, "allocate", side_effect=["DUCK", "DUCK", "GRAY", "DUCK"]
     ) as mocked_gencode:
         async with async_client as ac:
             response1 = await ac.post(
@@ -74,3 +68,65 @@ async def test_temp_pebble_endpoint(async_client):
         response = await ac.get("/play/pass-the-pebble/")
         assert response.status_code == status.HTTP_200_OK
         assert "<html>" in response.content.decode()
+
+
+@pytest.mark.asyncio
+async def test_metrics(async_client):
+    async with async_client as ac:
+        await ac.post(
+            "/create-game/", json={"game_type": "pass_the_pebble", "players": 2}
+        )
+        response = await ac.get("/metrics")
+    assert response.status_code == status.HTTP_200_OK
+    assert response.headers["content-type"].startswith("text/plain")
+    assert "\nroomcode_rooms 1\n" in response.text
+    assert "# TYPE roomcode_action_seconds histogram" in response.text
+
+
+@pytest.mark.asyncio
+async def test_watch_unknown_room(async_client):
+    async with async_client as ac:
+        response = await ac.get("/watch/NOPE/")
+    assert response.status_code == status.HTTP_404_NOT_FOUND
+
+
+@pytest.mark.asyncio
+async def test_watch_streams_public_state(async_client):
+    async with async_client as ac:
+        response = await ac.post(
+            "/create-game/", json={"game_type": "pass_the_pebble", "players": 2}
+        )
+    room = rooms[code := response.json()["code"]]
+
+    # the stream never ends by itself, so read it without a client
+    watching = await watch_game(code)
+    assert watching.media_type == "text/event-stream"
+    frames = watching.body_iterator
+    first = await frames.__anext__()
+    assert isinstance(first, bytes)
+    assert first.startswith(b"id: 1\nevent: state\ndata: ")
+    assert len(room.watchers) == 1
+
+    await frames.aclose()  # type: ignore[attr-defined]
+    assert not room.watchers
+
+
+@pytest.mark.asyncio
+async def test_metrics_compression_by_room(async_client):
+    async with async_client as ac:
+        response = await ac.post(
+            "/create-game/", json={"game_type": "pass_the_pebble", "players": 2}
+        )
+        code = response.json()["code"]
+        stats = rooms[code].compression
+        stats.frames, stats.bytes_in, stats.bytes_out = 2, 400, 100
+        stats.cpu_seconds = 0.5
+        response = await ac.get("/metrics")
+    assert f'\nroomcode_room_ws_compression_ratio{{room="{code}"}} 0.25\n' in (
+        response.text
+    )
+    assert (
+        f'\nroomcode_room_ws_compression_cpu_seconds{{room="{code}"}} 0.5\n'
+        in response.text
+    )
+    assert "\nroomcode_ws_compression_ratio 0.25\n" in response.text
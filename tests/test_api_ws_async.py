@@ -1,12 +1,14 @@
+import asyncio
 from contextlib import AsyncExitStack
 from unittest.mock import patch
 
 import pytest
 from httpx import AsyncClient
-from httpx_ws import aconnect_ws
+from httpx_ws import WebSocketDisconnect, aconnect_ws
 from httpx_ws.transport import ASGIWebSocketTransport
 
 from app.api import rooms
+from app.engine.action_handlers import leave_room
 from app.main import fastapi_app as app
 
 # The first client to connect receives messages:
@@ -75,6 +77,7 @@ async def test_ws_inner_exception(async_ws_client, trivial_room, caplog):
 
 
 @pytest.mark.asyncio
+@patch("app.api.RESUME_GRACE", 0)
 async def test_ws_disconnect_releases_manager(async_ws_client, trivial_room):
     room = trivial_room
     assert room.code not in rooms
@@ -98,3 +101,70 @@ async def test_ws_disconnect_releases_manager(async_ws_client, trivial_room):
         await ws1.close()
         msg = await ws2.receive_json()
         assert msg["info"] == "There is no manager"
+
+
+@pytest.mark.asyncio
+async def test_ws_resume_keeps_seat(async_ws_client, trivial_room):
+    room = trivial_room
+    rooms[room.code] = room
+
+    async with aconnect_ws(f"/ws/{room.code}/", async_ws_client) as ws1:
+        welcome = await ws1.receive_json()
+        for _ in range(NUM_FIRST_CLIENT_MSG - 1):
+            await ws1.receive_json()
+        await ws1.send_json({"action": "claim_slot", "slot": 0})
+        await ws1.receive_json()
+    client_id = welcome["client_id"]
+    while not room.held_count():
+        await asyncio.sleep(0.01)
+    assert room.slot_of(client_id) == 0
+    assert room.game.manager == client_id
+
+    token = welcome["resume_token"]
+    async with aconnect_ws(f"/ws/{room.code}/?resume={token}", async_ws_client) as ws2:
+        message = await ws2.receive_json()
+        assert message["client_id"] == client_id
+        assert message["resumed"] is True
+        assert message["my_slot"] == 0
+        assert room.held_count() == 0
+    while not room.held_count():
+        await asyncio.sleep(0.01)
+
+    # a token is only good while the seat is kept
+    room.unhold(client_id)
+    await room.submit(leave_room, dict(ws=None, room=room, client_id=client_id))
+    async with aconnect_ws(f"/ws/{room.code}/?resume={token}", async_ws_client) as ws3:
+        assert (await ws3.receive_json())["client_id"] != client_id
+    room.close()
+
+
+@pytest.mark.asyncio
+async def test_ws_resume_while_first_socket_registered(async_ws_client, trivial_room):
+    room = trivial_room
+    rooms[room.code] = room
+
+    async with aconnect_ws(f"/ws/{room.code}/", async_ws_client) as ws1:
+        welcome = await ws1.receive_json()
+        for _ in range(NUM_FIRST_CLIENT_MSG - 1):
+            await ws1.receive_json()
+        client_id, token = welcome["client_id"], welcome["resume_token"]
+        first = room[client_id]
+
+        # the server hasn't noticed the first socket is gone
+        async with aconnect_ws(
+            f"/ws/{room.code}/?resume={token}", async_ws_client
+        ) as ws2:
+            message = await ws2.receive_json()
+            assert message["client_id"] == client_id
+            assert message["resumed"] is True
+            assert room[client_id] is not first
+            assert room.game.manager == client_id
+
+            # the first socket is closed, and its disconnect keeps the seat
+            with pytest.raises(WebSocketDisconnect):
+                while True:
+                    await ws1.receive_json()
+            await asyncio.sleep(0.05)
+            assert room[client_id] is not first
+            assert room.held_count() == 0
+    room.close()
@@ -1,6 +1,13 @@
+import json
+import zlib
+
+import pytest
 from starlette.testclient import TestClient
 
+from app import api
 from app.api import rooms
+from app.engine.compression import unwrap
+from app.engine.snapshot import SnapshotStore
 from app.main import fastapi_app as app
 
 client = TestClient(app)
@@ -53,3 +60,61 @@ def test_ws_second_client_connect(trivial_room):
             assert message["client_id"] == client_id_2
             message = ws_2.receive_json()
             assert message.get("available_slots") == {"0": True}
+
+
+def test_ws_msgpack_subprotocol(trivial_room):
+    msgpack = pytest.importorskip("msgpack")
+    room = trivial_room
+    rooms[room.code] = room
+    with client.websocket_connect(
+        f"/ws/{room.code}/", subprotocols=["roomcode.msgpack"]
+    ) as ws:
+        assert ws.accepted_subprotocol == "roomcode.msgpack"
+        message = msgpack.unpackb(ws.receive_bytes(), strict_map_key=False)
+        assert message["client_id"] == list(room.keys())[0]
+        for _ in range(3):
+            ws.receive_bytes()
+
+        ws.send_bytes(msgpack.packb({"action": "claim_slot", "slot": 0}))
+        message = msgpack.unpackb(ws.receive_bytes(), strict_map_key=False)
+        assert message["my_slot"] == 0
+        assert message["available_slots"] == {0: False}
+
+
+def test_ws_deflate_subprotocol(trivial_room):
+    room = trivial_room
+    rooms[room.code] = room
+    with client.websocket_connect(
+        f"/ws/{room.code}/", subprotocols=["roomcode.json+deflate"]
+    ) as ws:
+        assert ws.accepted_subprotocol == "roomcode.json+deflate"
+        inflater = zlib.decompressobj(-zlib.MAX_WBITS)
+        message = json.loads(unwrap(ws.receive_bytes(), inflater))
+        assert message["client_id"] == list(room.keys())[0]
+
+
+def test_ws_room_restored_after_restart(tmp_path, monkeypatch):
+    monkeypatch.setattr(api, "snapshots", SnapshotStore(str(tmp_path / "snapshot")))
+    with TestClient(app) as before:
+        response = before.post(
+            "/create-game/", json={"game_type": "pass_the_pebble", "players": 2}
+        )
+        code = response.json()["code"]
+        rooms[code].game.pass_count = 2
+    rooms.clear()  # as in a new process
+
+    with TestClient(app) as after:
+        assert code not in rooms
+        with after.websocket_connect(f"/ws/{code}/") as ws:
+            assert "client_id" in ws.receive_json()
+            assert rooms[code].game.pass_count == 2
+
+
+def test_ws_pong_is_not_an_action(trivial_room):
+    rooms[trivial_room.code] = trivial_room
+    with client.websocket_connect(f"/ws/{trivial_room.code}/") as ws:
+        for _ in range(4):
+            ws.receive_json()
+        ws.send_json({"action": "pong"})
+        ws.send_json({"action": "claim_slot", "slot": 0})
+        assert ws.receive_json()["my_slot"] == 0
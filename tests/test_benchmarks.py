@@ -0,0 +1,33 @@
+import pytest
+
+from app.api import rooms
+from benchmarks import bench_evaluator, bench_json
+from benchmarks.bench_rooms import compare, run
+
+
+@pytest.mark.asyncio
+async def test_bench_rooms__smoke():
+    result = await run(num_rooms=2, clients=3, actions=4, alloc_actions=1)
+    assert result["actions"] == 8
+    assert result["actions_per_sec"] > 0
+    assert 0 < result["latency_ms"]["p50"] <= result["latency_ms"]["p99"]
+    assert not rooms
+
+    slower = {**result, "actions_per_sec": result["actions_per_sec"] / 2}
+    assert compare(result, result, tolerance=0.1) == []
+    assert compare(slower, result, tolerance=0.1)[0].startswith("actions_per_sec")
+
+
+def test_bench_json__smoke():
+    result = bench_json.run(number=5, repeat=1)
+    assert set(result["us_per_publish"]["stdlib"]) == {
+        "game_state",
+        "slots",
+        "table_state",
+    }
+
+
+def test_bench_evaluator__smoke():
+    result = bench_evaluator.run(hands=100)
+    assert result["hands_per_sec"] > 0
+    assert result["showdown_hands_per_sec"] > 0
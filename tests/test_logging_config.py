@@ -0,0 +1,91 @@
+import json
+import logging
+import queue
+
+import pytest
+
+from app.logging_config import (
+    JsonFormatter,
+    NonBlockingQueueHandler,
+    SamplingFilter,
+    configure_logging,
+    parse_sample_rates,
+)
+
+
+def make_record(msg="client %s sent action %s", args=("FOO", "pass"), **extra):
+    record = logging.LogRecord("root", logging.INFO, "api.py", 1, msg, args, None)
+    record.__dict__.update(extra)
+    return record
+
+
+def test_sampling_filter__limits_each_category_per_second():
+    now = [0.0]
+    sampler = SamplingFilter({"action": 2}, clock=lambda: now[0])
+
+    passed = [sampler.filter(make_record(sample="action")) for _ in range(10)]
+    assert passed == [True, True] + [False] * 8
+    assert sampler.filter(make_record(sample="turn"))
+    assert sampler.filter(make_record())
+
+    now[0] = 0.5
+    record = make_record(sample="action")
+    assert sampler.filter(record)
+    assert record.suppressed == 8
+    assert record.getMessage() == "client FOO sent action pass (8 similar suppressed)"
+    assert not sampler.filter(make_record(sample="action"))
+
+
+def test_parse_sample_rates():
+    assert parse_sample_rates("") == ({}, None)
+    assert parse_sample_rates("action=5, slot=0.5,20") == (
+        {"action": 5.0, "slot": 0.5},
+        20.0,
+    )
+
+
+def test_json_formatter():
+    record = make_record(sample="action", suppressed=3)
+    entry = json.loads(JsonFormatter().format(record))
+    assert entry["message"] == "client FOO sent action pass"
+    assert entry["level"] == "INFO"
+    assert entry["where"] == "api.py:1"
+    assert entry["category"] == "action"
+    assert entry["suppressed"] == 3
+
+
+def test_queue_handler__never_blocks_when_full():
+    handler = NonBlockingQueueHandler(queue.Queue(1))
+    args = {"slot": 0}
+    handler.handle(make_record("state %s", (args,)))
+    handler.handle(make_record("state %s", (args,)))
+    args["slot"] = 1
+    assert handler.dropped == 1
+    assert handler.queue.get_nowait().getMessage() == "state {'slot': 0}"
+
+
+@pytest.mark.parametrize("fmt", ["text", "json"])
+def test_configure_logging__queue_mode(fmt, capsys):
+    root = logging.getLogger()
+    saved_handlers, saved_level = root.handlers[:], root.level
+    root.handlers.clear()
+    try:
+        listener = configure_logging(mode="queue", fmt=fmt, sample="action=1")
+        assert listener is not None
+        assert isinstance(root.handlers[0], NonBlockingQueueHandler)
+        for _ in range(3):
+            root.info("hot line", extra={"sample": "action"})
+        root.info("rare line")
+        listener.stop()
+    finally:
+        root.handlers[:] = saved_handlers
+        root.setLevel(saved_level)
+
+    lines = capsys.readouterr().err.splitlines()
+    assert len(lines) == 2
+    assert "hot line" in lines[0] and "rare line" in lines[1]
+
+
+def test_configure_logging__unknown_mode():
+    with pytest.raises(ValueError):
+        configure_logging(mode="async")